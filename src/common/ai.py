@@ -1,5 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型调用（OpenAI 兼容接口），twitter_pipeline.py、processor.py 和商务部爬虫共用
+默认使用通义千问（DashScope），ai_config.json 中的其他服务商作为对冲和故障切换目标（见 ai_router.py）
+- 每个服务商在每个事件循环只创建一个 AsyncOpenAI 客户端，复用 HTTP 连接池（不再每次调用新建客户端）
+- 信号量限制同时进行的请求数、最小间隔限制每秒请求数，按 DashScope 的并发/QPS 配额设置（每个服务商各自计数）
+- 可重试的错误（超时、连接失败、429、5xx）按带随机抖动的指数退避重试，
+  响应带 Retry-After 时按服务端要求等待；400/401 等请求错误不重试
+- 调用前先查响应缓存（ai_cache.py），相同图片和提示词不重复调用模型
+- 传入 on_text 时以流式方式调用，每收到一段输出就回调一次累计文本（命中缓存时不回调）
+- 每次调用和缓存命中记入台账（ai_ledger.py）；当天 token 用量接近预算时改用便宜模型、推迟低优先级调用
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
 import os
-from openai import OpenAI
+import random
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+)
+
+from src.common import ai_cache, ai_ledger, ai_router
+
+
+# 加载配置
+def load_secrets():
+    """加载 secrets.json 配置文件"""
+    secrets_path = Path("config/secrets.json")
+    if secrets_path.exists():
+        with open(secrets_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+SECRETS = load_secrets()
+
+# 获取 API Key（优先从环境变量，其次从 secrets.json）
+API_KEY = os.getenv("QIANWEN_API_KEY") or SECRETS.get("qianwen", {}).get("api_key", "")
+BASE_URL = os.getenv("QIANWEN_BASE_URL") or SECRETS.get("qianwen", {}).get("base_url", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+MODEL = os.getenv("QIANWEN_MODEL") or SECRETS.get("qianwen", {}).get("model", "qwen-vl-plus")
+TEXT_MODEL = os.getenv("QIANWEN_TEXT_MODEL") or SECRETS.get("qianwen", {}).get("text_model", "qwen-turbo")  # 纯文本分诊用的模型
+CHEAP_MODEL = os.getenv("QIANWEN_CHEAP_MODEL") or SECRETS.get("qianwen", {}).get("cheap_model", "")  # 接近每日预算时改用的视觉模型，为空时不降级
+CHEAP_TEXT_MODEL = os.getenv("QIANWEN_CHEAP_TEXT_MODEL") or SECRETS.get("qianwen", {}).get("cheap_text_model", "")  # 接近每日预算时改用的文本模型
+TIMEOUT = int(os.getenv("QIANWEN_TIMEOUT", "120"))  # 单次请求超时（秒）
+CONCURRENCY = int(os.getenv("QIANWEN_CONCURRENCY", "4"))  # 同时进行的请求数上限
+QPS = float(os.getenv("QIANWEN_QPS", "2"))  # 每秒最多发起的请求数，0 表示不限制
+MAX_RETRIES = int(os.getenv("QIANWEN_MAX_RETRIES", "3"))  # 失败后最多重试次数
+BACKOFF_BASE = float(os.getenv("QIANWEN_BACKOFF_BASE", "1"))  # 第一次重试的基础等待（秒），之后每次翻倍
+BACKOFF_MAX = float(os.getenv("QIANWEN_BACKOFF_MAX", "30"))  # 单次等待上限（秒）
+JSON_MODE = os.getenv("QIANWEN_JSON_MODE", "true").lower() == "true"  # 要求结构化输出的调用使用 JSON 模式（response_format=json_object）
+PROVIDER = "qianwen"  # 内置 DashScope 服务商的名称（响应缓存键、路由统计中使用）
+ROUTER_CONFIG = Path(os.getenv("AI_ROUTER_CONFIG", "config/ai_config.json"))  # 其他服务商（与商务部爬虫同一格式），用于对冲和故障切换
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
 
 AI_PROMPT = """
 你是一名事件驱动型投资信号分析器。
@@ -51,39 +113,424 @@ A / B / C / D
 XX / 100
 """
 
-import os
-import json
-from pathlib import Path
 
-# 加载配置
-def load_secrets():
-    """加载 secrets.json 配置文件"""
-    secrets_path = Path("config/secrets.json")
-    if secrets_path.exists():
-        with open(secrets_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+class Provider:
+    """
+    一个 OpenAI 兼容的模型服务；text_model / vision_model 为空表示不用它做文本 / 截图分析
+    cheap_text_model / cheap_vision_model 为接近每日预算时改用的便宜模型，为空时不降级
+    """
 
-SECRETS = load_secrets()
+    def __init__(
+        self,
+        name: str,
+        api_key: str,
+        base_url: str,
+        text_model: Optional[str] = None,
+        vision_model: Optional[str] = None,
+        timeout: float = TIMEOUT,
+        temperature: Optional[float] = None,
+        cheap_text_model: Optional[str] = None,
+        cheap_vision_model: Optional[str] = None,
+    ):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.text_model = text_model
+        self.vision_model = vision_model
+        self.timeout = timeout
+        self.temperature = temperature
+        self.cheap_text_model = cheap_text_model
+        self.cheap_vision_model = cheap_vision_model
 
-# 获取 API Key（优先从环境变量，其次从 secrets.json）
-API_KEY = os.getenv("QIANWEN_API_KEY") or SECRETS.get("qianwen", {}).get("api_key", "")
-BASE_URL = os.getenv("QIANWEN_BASE_URL") or SECRETS.get("qianwen", {}).get("base_url", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+    def model_for(self, vision: bool, cheap: bool = False) -> Optional[str]:
+        model = self.vision_model if vision else self.text_model
+        if cheap and model:
+            return (self.cheap_vision_model if vision else self.cheap_text_model) or model
+        return model
 
-if not API_KEY:
-    raise ValueError("请配置 QIANWEN_API_KEY 环境变量或在 config/secrets.json 中设置 api_key")
 
-client = OpenAI(
-    api_key=API_KEY,
-    base_url=BASE_URL,
+DEFAULT_PROVIDER = Provider(
+    PROVIDER,
+    API_KEY,
+    BASE_URL,
+    text_model=TEXT_MODEL,
+    vision_model=MODEL,
+    cheap_text_model=CHEAP_TEXT_MODEL,
+    cheap_vision_model=CHEAP_MODEL,
 )
-completion = client.chat.completions.create(
-    model="qwen-vl-plus",  # 此处以qwen-vl-plus为例，可按需更换模型名称。模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-    messages=[
-        {"role": "system", "content": AI_PROMPT.strip()},
-        {"role": "user","content": [
-            {"type": "image_url",
-             "image_url": {"url": "https://shenyuan-x.oss-cn-hangzhou.aliyuncs.com/2009211541800001587.jpg"}},
-            ]}]
+
+_providers: Optional[List[Provider]] = None
+
+
+def default_providers() -> List[Provider]:
+    """
+    内置的 DashScope 在前；ai_config.json 中有 API Key、且不是同一个 base_url 的服务商依次在后
+    （"model" 为文本模型，"vision_model" 为视觉模型，"cheap_model" / "cheap_vision_model" 为接近预算时的降级模型）
+    """
+    global _providers
+    if _providers is not None:
+        return _providers
+    _providers = [DEFAULT_PROVIDER]
+    if not ROUTER_CONFIG.exists():
+        return _providers
+    try:
+        cfg = json.loads(ROUTER_CONFIG.read_text(encoding="utf-8"))
+    except ValueError as exc:
+        print(f"[WARN] {ROUTER_CONFIG} 解析失败，只使用 DashScope: {exc}")
+        return _providers
+    for name, pcfg in (cfg.get("providers") or {}).items():
+        api_key = pcfg.get("api_key") or os.getenv(pcfg.get("api_key_env") or "", "")
+        base_url = pcfg.get("base_url") or ""
+        # 同一服务的另一份配置，对冲过去也是同一个后端
+        if not api_key or not base_url or base_url.rstrip("/") == BASE_URL.rstrip("/"):
+            continue
+        _providers.append(
+            Provider(
+                name,
+                api_key,
+                base_url,
+                text_model=pcfg.get("model") or pcfg.get("model_name"),
+                vision_model=pcfg.get("vision_model"),
+                timeout=float(pcfg.get("timeout") or cfg.get("timeout") or TIMEOUT),
+                temperature=pcfg.get("temperature", cfg.get("temperature")),
+                cheap_text_model=pcfg.get("cheap_model"),
+                cheap_vision_model=pcfg.get("cheap_vision_model"),
+            )
+        )
+    return _providers
+
+
+class _ClientState:
+    """某个服务商绑定在某个事件循环上的客户端、信号量和 QPS 节拍"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, provider: Provider):
+        import httpx
+
+        self.loop = loop
+        self.client = AsyncOpenAI(
+            api_key=provider.api_key,
+            base_url=provider.base_url,
+            timeout=provider.timeout,
+            # 重试由 _complete 统一处理（带抖动、尊重 Retry-After），关闭 SDK 自带的重试
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max(1, CONCURRENCY) * 2,
+                    max_keepalive_connections=max(1, CONCURRENCY),
+                    keepalive_expiry=60,
+                ),
+                timeout=httpx.Timeout(provider.timeout, connect=10),
+            ),
+        )
+        self.semaphore = asyncio.Semaphore(max(1, CONCURRENCY))
+        self.lock = asyncio.Lock()
+        self.next_at = 0.0
+
+    async def wait_for_slot(self) -> None:
+        """按 QPS 间隔依次放行"""
+        if QPS <= 0:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            if self.next_at > now:
+                await asyncio.sleep(self.next_at - now)
+                now = time.monotonic()
+            self.next_at = now + 1 / QPS
+
+
+_states: Dict[str, _ClientState] = {}
+_closing: set = set()  # 正在关闭的旧客户端任务，保留引用以免被回收
+
+
+async def _close_client(client: AsyncOpenAI) -> None:
+    try:
+        await client.close()
+    except Exception:
+        pass  # 原事件循环已关闭时，连接随之失效，尽力而为
+
+
+def _retire(state: _ClientState) -> None:
+    """关闭被替换的客户端：原循环仍在运行时交给它关闭，否则在当前循环上关闭"""
+    if state.loop.is_running() and not state.loop.is_closed():
+        asyncio.run_coroutine_threadsafe(_close_client(state.client), state.loop)
+        return
+    task = asyncio.get_running_loop().create_task(_close_client(state.client))
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+def _current(provider: Provider) -> _ClientState:
+    # httpx 连接和 asyncio 原语都属于创建它们的事件循环；同步入口每次 asyncio.run 都是新循环
+    loop = asyncio.get_running_loop()
+    state = _states.get(provider.name)
+    if state is None or state.loop is not loop:
+        if state is not None:
+            _retire(state)
+        state = _states[provider.name] = _ClientState(loop, provider)
+    return state
+
+
+def retry_delay(attempt: int, exc: Exception) -> float:
+    """第 attempt 次重试前的等待秒数：有 Retry-After 时以服务端为准，否则指数退避 + 全抖动"""
+    response = getattr(exc, "response", None)
+    if response is not None:
+        headers = response.headers
+        try:
+            if headers.get("retry-after-ms"):
+                return min(BACKOFF_MAX, float(headers["retry-after-ms"]) / 1000)
+            if headers.get("retry-after"):
+                return min(BACKOFF_MAX, float(headers["retry-after"]))
+        except ValueError:
+            pass  # HTTP 日期格式的 Retry-After 按指数退避处理
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code in RETRY_STATUS
+
+
+async def analyze_image(
+    image_url: str,
+    prompt: str = AI_PROMPT,
+    system_prompt: bool = True,
+    content: Optional[bytes] = None,
+    json_mode: bool = False,
+    on_text: Optional[Callable[[str], None]] = None,
+    validate: Optional[Callable[[str], bool]] = None,
+    priority: str = ai_ledger.PRIORITY_NORMAL,
+) -> Dict[str, Any]:
+    """
+    调用视觉模型分析图片，返回 {success, ai_text, full_response, provider}，命中缓存时另带 cached=True
+    system_prompt 为 False 时提示词和图片放在同一条 user 消息里
+    content 为图片字节时按内容查缓存，否则按 image_url 查
+    validate 判断输出是否可用（对冲时取第一个可用的结果）
+    priority 为 PRIORITY_LOW 的调用在接近每日预算时推迟，返回 success=False、deferred=True
+    """
+    if system_prompt:
+        messages = [
+            {"role": "system", "content": prompt.strip()},
+            {"role": "user", "content": [{"type": "image_url", "image_url": {"url": image_url}}]},
+        ]
+    else:
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": image_url}},
+                ],
+            }
+        ]
+    cache_input = content if content is not None else image_url
+    return await _route(
+        default_providers(), True, messages, cache_input, prompt, json_mode, on_text, validate, priority
+    )
+
+
+async def analyze_text(
+    text: str,
+    prompt: str,
+    json_mode: bool = False,
+    validate: Optional[Callable[[str], bool]] = None,
+    providers: Optional[List[Provider]] = None,
+    priority: str = ai_ledger.PRIORITY_NORMAL,
+) -> Dict[str, Any]:
+    """调用文本模型（比视觉模型便宜、快），返回值和 priority 同 analyze_image；providers 默认为 default_providers()"""
+    messages = [
+        {"role": "system", "content": prompt.strip()},
+        {"role": "user", "content": text},
+    ]
+    return await _route(
+        providers or default_providers(), False, messages, text, prompt, json_mode, None, validate, priority
     )
-print(completion.model_dump_json())
\ No newline at end of file
+
+
+async def _route(
+    providers: List[Provider],
+    vision: bool,
+    messages: List[Dict[str, Any]],
+    cache_input: Union[bytes, str],
+    prompt: str,
+    json_mode: bool,
+    on_text: Optional[Callable[[str], None]],
+    validate: Optional[Callable[[str], bool]],
+    priority: str = ai_ledger.PRIORITY_NORMAL,
+) -> Dict[str, Any]:
+    """按预算选模型（或推迟），先查所有候选服务商的缓存，都没有时交给路由器（对冲 / 故障切换）"""
+    ledger = ai_ledger.shared_ledger()
+    level = ledger.budget_level() if ledger is not None else ai_ledger.NORMAL
+    if level == ai_ledger.DEFER and priority == ai_ledger.PRIORITY_LOW:
+        ledger.deferred += 1
+        error = "今日 token 预算不足，推迟调用"
+        return {"success": False, "deferred": True, "ai_text": "", "full_response": "", "error": error}
+    cheap = level != ai_ledger.NORMAL
+
+    candidates = {f"{p.name}:{p.model_for(vision, cheap)}": p for p in providers if p.model_for(vision, cheap)}
+    if not candidates:
+        return {"success": False, "ai_text": "", "full_response": "", "error": "没有可用的服务商"}
+
+    keys = {
+        route_key: ai_cache.cache_key(cache_input, prompt, p.model_for(vision, cheap), p.name)
+        for route_key, p in candidates.items()
+    }
+    cache = ai_cache.shared_cache()
+    if cache is not None:
+        # 降级期间原模型已有的结果同样可用，且排在便宜模型之前
+        lookups = {}
+        for p in candidates.values():
+            for model in dict.fromkeys([p.model_for(vision), p.model_for(vision, cheap)]):
+                lookups[ai_cache.cache_key(cache_input, prompt, model, p.name)] = (p.name, model)
+        hit = cache.get_any(list(lookups))
+        if hit is not None:
+            key, cached = hit
+            answer = json.loads(cached)
+            # 旧版本可能缓存过没通过校验的输出，不可用时当作未命中
+            if validate is None or validate(answer["ai_text"]):
+                if ledger is not None:
+                    provider_name, model = lookups[key]
+                    ledger.record(provider_name, model, prompt, attempts=0, cache_hit=True, status="cached")
+                # 不回调 on_text：调用方的流式回调用于发初步通知，命中缓存时直接发最终通知即可
+                return {"success": True, "cached": True, **answer}
+
+    # 对冲时两个服务商同时在流式输出：只转发第一个吐出内容的服务商，避免回调拿到两家拼在一起的字段
+    stream_owner: List[str] = []
+
+    def stream_for(route_key: str) -> Optional[Callable[[str], None]]:
+        if on_text is None:
+            return None
+
+        def forward(text: str) -> None:
+            if not stream_owner:
+                stream_owner.append(route_key)
+            if stream_owner[0] == route_key:
+                on_text(text)
+
+        return forward
+
+    async def call(route_key: str) -> Dict[str, Any]:
+        provider = candidates[route_key]
+        model = provider.model_for(vision, cheap)
+        started = time.monotonic()
+        try:
+            result = await _complete(provider, model, messages, json_mode, stream_for(route_key))
+        except asyncio.CancelledError:
+            # 被对冲请求取消：服务端可能已经计费，但拿不到 usage，只记耗时
+            if ledger is not None:
+                ledger.record(provider.name, model, prompt, latency=time.monotonic() - started, status="cancelled")
+            raise
+        if ledger is not None:
+            input_tokens, output_tokens = ai_ledger.usage_tokens(result.get("usage"))
+            ledger.record(
+                provider.name,
+                model,
+                prompt,
+                input_tokens,
+                output_tokens,
+                latency=time.monotonic() - started,
+                attempts=result["attempts"],
+                status="ok" if result["success"] else "error",
+            )
+        return result
+
+    result = await ai_router.shared_router().call(
+        list(candidates), call, (lambda result: validate(result["ai_text"])) if validate else None
+    )
+    # 只缓存路由器采纳的结果：都没通过校验时路由器返回的兜底结果不写入缓存
+    route_key = result.get("provider")
+    if result["success"] and cache is not None and route_key in candidates:
+        if validate is None or validate(result["ai_text"]):
+            provider = candidates[route_key]
+            answer = {"ai_text": result["ai_text"], "full_response": result["full_response"]}
+            model = provider.model_for(vision, cheap)
+            cache.put(keys[route_key], json.dumps(answer, ensure_ascii=False), model, provider.name, prompt)
+    return result
+
+
+async def _stream(
+    client: AsyncOpenAI, request: Dict[str, Any], on_text: Callable[[str], None]
+) -> Dict[str, Any]:
+    """流式调用，边收边回调；结束后拼成与非流式 model_dump() 相同结构的结果"""
+    stream = await client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True})
+    parts: List[str] = []
+    result: Dict[str, Any] = {}
+    finish_reason = None
+    async for chunk in stream:
+        result.update(id=chunk.id, model=chunk.model, created=chunk.created, object="chat.completion")
+        if chunk.usage:
+            result["usage"] = chunk.usage.model_dump()
+        for choice in chunk.choices:
+            finish_reason = choice.finish_reason or finish_reason
+            if choice.delta and choice.delta.content:
+                parts.append(choice.delta.content)
+                on_text("".join(parts))
+    result["choices"] = [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "".join(parts)},
+            "finish_reason": finish_reason,
+        }
+    ]
+    return result
+
+
+async def _complete(
+    provider: Provider,
+    model: str,
+    messages: List[Dict[str, Any]],
+    json_mode: bool = False,
+    on_text: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """限流 → 调用（可流式） → 重试；返回值另带 usage 和尝试次数 attempts，供台账记录"""
+    request: Dict[str, Any] = {"model": model, "messages": messages}
+    if json_mode:
+        request["response_format"] = {"type": "json_object"}
+    if provider.temperature is not None:
+        request["temperature"] = provider.temperature
+
+    state = _current(provider)
+    last_error: Optional[Exception] = None
+    attempt = 0
+    for attempt in range(MAX_RETRIES + 1):
+        await state.wait_for_slot()
+        try:
+            # 只在请求期间占用并发名额，退避等待时让给其他请求
+            async with state.semaphore:
+                if on_text:
+                    result = await _stream(state.client, request, on_text)
+                else:
+                    result = (await state.client.chat.completions.create(**request)).model_dump()
+            ai_text = ""
+            if result.get("choices"):
+                ai_text = result["choices"][0].get("message", {}).get("content") or ""
+            return {
+                "success": True,
+                "ai_text": ai_text,
+                "full_response": json.dumps(result, ensure_ascii=False, indent=2),
+                "usage": result.get("usage"),
+                "attempts": attempt + 1,
+            }
+        except Exception as exc:
+            last_error = exc
+            if attempt >= MAX_RETRIES or not is_retryable(exc):
+                break
+            delay = retry_delay(attempt, exc)
+            print(f"[WARN] {provider.name} 调用失败（尝试 {attempt + 1}/{MAX_RETRIES + 1}），{delay:.1f}s 后重试: {exc}")
+            await asyncio.sleep(delay)
+
+    print(f"[ERROR] {provider.name} 调用最终失败: {last_error}")
+    return {
+        "success": False,
+        "ai_text": "",
+        "full_response": str(last_error),
+        "error": str(last_error),
+        "attempts": attempt + 1,
+    }
+
+
+def report() -> None:
+    """输出缓存命中率、各服务商的延迟统计和今日台账汇总"""
+    ai_cache.report()
+    ai_router.shared_router().report()
+    ai_ledger.report()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI 响应缓存（data/ai_cache.db），按内容寻址
+键 = sha256(输入内容) + 提示词版本 + 模型 + 服务商：同一张截图、同一篇文章用同一提示词和模型只调用一次，
+reset_tweet.py 重置后重跑、processor.py 重扫整个截图目录、商务部文章重复入库都直接命中缓存
+- 提示词版本取提示词文本的哈希，改了提示词自动失效
+- 超过 TTL 的条目在读取时丢弃；总大小超过上限时按最近使用时间淘汰（LRU）
+- 只缓存成功的响应
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+# ==================== 配置 ====================
+CACHE_ENABLED = os.getenv("AI_CACHE", "true").lower() == "true"  # 设为 false 时每次都调用模型
+CACHE_PATH = Path(os.getenv("AI_CACHE_PATH", "data/ai_cache.db"))
+CACHE_TTL_DAYS = float(os.getenv("AI_CACHE_TTL_DAYS", "30"))  # 条目有效期（天），0 表示不过期
+CACHE_MAX_MB = float(os.getenv("AI_CACHE_MAX_MB", "200"))  # 缓存总大小上限，超过后淘汰最久未使用的条目
+
+
+def digest(content: Union[bytes, str]) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def prompt_version(prompt: str) -> str:
+    return digest(prompt.strip())[:12]
+
+
+def cache_key(content: Union[bytes, str], prompt: str, model: str, provider: str) -> str:
+    """输入内容、提示词版本、模型、服务商任一不同都得到不同的键"""
+    return digest("\n".join([digest(content), prompt_version(prompt), model, provider]))
+
+
+class AICache:
+    """sqlite 持久化的响应缓存；可在多个线程中使用（共用一个连接，读写加锁）"""
+
+    def __init__(
+        self,
+        path: Path = CACHE_PATH,
+        ttl_days: float = CACHE_TTL_DAYS,
+        max_mb: float = CACHE_MAX_MB,
+    ):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.ttl = ttl_days * 86400
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ai_cache (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_last_used ON ai_cache(last_used_at);")
+        self.conn.commit()
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[str]:
+        hit = self.get_any([key], now)
+        return hit[1] if hit else None
+
+    def get_any(self, keys: List[str], now: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """
+        按顺序返回第一个未过期的条目 (键, 响应)（同一输入在多个服务商下的结果），
+        整体计一次命中或未命中
+        """
+        now = time.time() if now is None else now
+        with self._lock, self.conn:
+            for key in keys:
+                row = self.conn.execute("SELECT response, created_at FROM ai_cache WHERE key = ?;", (key,)).fetchone()
+                if row and self.ttl > 0 and now - row[1] > self.ttl:
+                    self.conn.execute("DELETE FROM ai_cache WHERE key = ?;", (key,))
+                    row = None
+                if row is None:
+                    continue
+                self.conn.execute(
+                    "UPDATE ai_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?;", (now, key)
+                )
+                self.hits += 1
+                return key, row[0]
+            self.misses += 1
+            return None
+
+    def put(
+        self, key: str, response: str, model: str, provider: str, prompt: str, now: Optional[float] = None
+    ) -> None:
+        now = time.time() if now is None else now
+        size = len(response.encode("utf-8"))
+        with self._lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO ai_cache (key, provider, model, prompt_version, response, size, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    response=excluded.response,
+                    size=excluded.size,
+                    created_at=excluded.created_at,
+                    last_used_at=excluded.last_used_at;
+                """,
+                (key, provider, model, prompt_version(prompt), response, size, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> int:
+        """先删过期条目，再按最近使用时间从旧到新删，直到总大小不超过上限；返回删除条数"""
+        removed = 0
+        if self.ttl > 0:
+            removed += self.conn.execute(
+                "DELETE FROM ai_cache WHERE created_at < ?;", (now - self.ttl,)
+            ).rowcount
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM ai_cache;").fetchone()[0]
+        if total <= self.max_bytes:
+            return removed
+        for key, size in self.conn.execute("SELECT key, size FROM ai_cache ORDER BY last_used_at;").fetchall():
+            self.conn.execute("DELETE FROM ai_cache WHERE key = ?;", (key,))
+            removed += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+        return removed
+
+    def report(self) -> None:
+        lookups = self.hits + self.misses
+        if not lookups:
+            return
+        print(f"[INFO] AI缓存：命中 {self.hits} 次，未命中 {self.misses} 次（命中率 {self.hits / lookups:.0%}）")
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_cache: Optional[AICache] = None
+
+
+def shared_cache() -> Optional[AICache]:
+    """进程内共用的缓存；AI_CACHE=false 时返回 None"""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = AICache()
+    return _cache
+
+
+def report() -> None:
+    if _cache is not None:
+        _cache.report()
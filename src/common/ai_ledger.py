@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI 调用台账（data/ai_ledger.db）和每日 token 预算
+- 每次模型调用记一行：服务商、模型、提示词版本、输入/输出 token、耗时、尝试次数、是否命中缓存、结果；
+  缓存命中和被对冲取消的调用同样记录（token 为 0），可以按天、按模型汇总用量、费用和延迟
+- 预算控制：当天 token 用量达到 AI_DAILY_TOKEN_BUDGET 的 AI_BUDGET_DOWNGRADE_AT 后改用便宜模型，
+  达到 AI_BUDGET_DEFER_AT 后推迟低优先级调用（processor.py 重扫截图目录），留给下一次运行
+- 守护进程、processor.py 和商务部爬虫共用同一个库，当天用量定期从库中重新汇总
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.common.ai_cache import prompt_version
+
+# ==================== 配置 ====================
+LEDGER_ENABLED = os.getenv("AI_LEDGER", "true").lower() == "true"  # 设为 false 时不记录台账，也不做预算控制
+LEDGER_PATH = Path(os.getenv("AI_LEDGER_PATH", "data/ai_ledger.db"))
+DAILY_TOKEN_BUDGET = int(os.getenv("AI_DAILY_TOKEN_BUDGET", "0"))  # 每日 token 预算（输入 + 输出），0 表示不限
+DOWNGRADE_AT = float(os.getenv("AI_BUDGET_DOWNGRADE_AT", "0.8"))  # 用量达到预算的该比例后改用便宜模型
+DEFER_AT = float(os.getenv("AI_BUDGET_DEFER_AT", "0.95"))  # 用量达到预算的该比例后推迟低优先级调用
+REFRESH_INTERVAL = float(os.getenv("AI_LEDGER_REFRESH", "60"))  # 多久从库中重新汇总一次当天用量（秒）
+# 单价（元 / 千 token），如 {"qwen-vl-plus": [0.0015, 0.0045]}；未列出的模型不计费用
+PRICES: Dict[str, Any] = json.loads(os.getenv("AI_TOKEN_PRICES") or "{}")
+
+# 预算状态
+NORMAL = "normal"
+DOWNGRADE = "downgrade"
+DEFER = "defer"
+
+# 调用优先级：预算接近上限时只推迟低优先级的调用
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+
+
+def usage_tokens(usage: Optional[Dict[str, Any]]) -> Tuple[int, int]:
+    """从响应的 usage 中取 (输入, 输出) token 数；兼容 prompt/completion 和 input/output 两种字段名"""
+    if not usage:
+        return 0, 0
+    input_tokens = usage.get("prompt_tokens", usage.get("input_tokens")) or 0
+    output_tokens = usage.get("completion_tokens", usage.get("output_tokens")) or 0
+    return int(input_tokens), int(output_tokens)
+
+
+def token_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    price = PRICES.get(model)
+    if not price:
+        return None
+    return (input_tokens * float(price[0]) + output_tokens * float(price[1])) / 1000
+
+
+class AILedger:
+    """sqlite 持久化的调用台账；可在多个线程中使用（共用一个连接，读写加锁）"""
+
+    def __init__(
+        self,
+        path: Path = LEDGER_PATH,
+        budget: int = DAILY_TOKEN_BUDGET,
+        downgrade_at: float = DOWNGRADE_AT,
+        defer_at: float = DEFER_AT,
+    ):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.budget = budget
+        self.downgrade_at = downgrade_at
+        self.defer_at = defer_at
+        self.deferred = 0
+        self._lock = threading.Lock()
+        self._day = ""
+        self._used = 0
+        self._refreshed_at = 0.0
+        self._level = NORMAL
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ai_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                called_at REAL NOT NULL,
+                day TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                input_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL DEFAULT 0,
+                cost REAL,
+                latency_ms INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                cache_hit INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL
+            );
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_calls_day ON ai_calls(day);")
+        self.conn.commit()
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        prompt: str,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        latency: float = 0.0,
+        attempts: int = 1,
+        cache_hit: bool = False,
+        status: str = "ok",
+        now: Optional[float] = None,
+    ) -> None:
+        """status：ok / error / cancelled（被对冲请求取消）/ cached"""
+        now = time.time() if now is None else now
+        day = dt.date.fromtimestamp(now).isoformat()
+        with self._lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO ai_calls (
+                    called_at, day, provider, model, prompt_version, input_tokens, output_tokens,
+                    cost, latency_ms, attempts, cache_hit, status
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    now,
+                    day,
+                    provider,
+                    model,
+                    prompt_version(prompt),
+                    input_tokens,
+                    output_tokens,
+                    token_cost(model, input_tokens, output_tokens),
+                    int(latency * 1000),
+                    attempts,
+                    int(cache_hit),
+                    status,
+                ),
+            )
+            if day == self._day:
+                self._used += input_tokens + output_tokens
+
+    def tokens_today(self, now: Optional[float] = None) -> int:
+        """当天所有进程的 token 用量；每 REFRESH_INTERVAL 秒（或跨天时）从库中重新汇总，其间累加本进程的记录"""
+        now = time.time() if now is None else now
+        day = dt.date.fromtimestamp(now).isoformat()
+        with self._lock:
+            if day != self._day or now - self._refreshed_at >= REFRESH_INTERVAL:
+                self._used = self.conn.execute(
+                    "SELECT COALESCE(SUM(input_tokens + output_tokens), 0) FROM ai_calls WHERE day = ?;", (day,)
+                ).fetchone()[0]
+                self._day = day
+                self._refreshed_at = now
+            return self._used
+
+    def recent_latencies(self, provider: str, model: str, limit: int) -> List[Tuple[float, bool]]:
+        """某个服务商 + 模型最近 limit 次实际调用的 (耗时秒数, 是否成功)，按时间从旧到新，用于预热路由统计"""
+        with self._lock:
+            rows = self.conn.execute(
+                """
+                SELECT latency_ms, status FROM ai_calls
+                WHERE provider = ? AND model = ? AND cache_hit = 0
+                ORDER BY id DESC LIMIT ?;
+                """,
+                (provider, model, limit),
+            ).fetchall()
+        # 被对冲取消的调用与 ai_router 的统计一致，按成功计入耗时
+        return [(latency_ms / 1000, status != "error") for latency_ms, status in reversed(rows)]
+
+    def budget_level(self, now: Optional[float] = None) -> str:
+        if self.budget <= 0:
+            return NORMAL
+        ratio = self.tokens_today(now) / self.budget
+        level = DEFER if ratio >= self.defer_at else DOWNGRADE if ratio >= self.downgrade_at else NORMAL
+        if level != self._level:
+            print(f"[WARN] 今日 AI token 用量 {ratio:.0%}（预算 {self.budget}），预算状态 {self._level} → {level}")
+            self._level = level
+        return level
+
+    def summary(self, day: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """某天（默认今天）按 服务商:模型 汇总的调用次数、缓存命中、token、费用和平均耗时"""
+        day = day or dt.date.today().isoformat()
+        with self._lock:
+            rows = self.conn.execute(
+                """
+                SELECT provider, model, COUNT(*), SUM(cache_hit), SUM(input_tokens), SUM(output_tokens),
+                       SUM(cost), AVG(CASE WHEN cache_hit = 0 THEN latency_ms END), SUM(MAX(attempts - 1, 0))
+                FROM ai_calls WHERE day = ?
+                GROUP BY provider, model ORDER BY provider, model;
+                """,
+                (day,),
+            ).fetchall()
+        return {
+            f"{provider}:{model}": {
+                "calls": calls,
+                "cache_hits": hits,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cost": cost,
+                "avg_latency_ms": avg_latency,
+                "retries": retries,
+            }
+            for provider, model, calls, hits, input_tokens, output_tokens, cost, avg_latency, retries in rows
+        }
+
+    def report(self) -> None:
+        summary = self.summary()
+        for key, item in summary.items():
+            cost = "" if item["cost"] is None else f"，约 {item['cost']:.2f} 元"
+            latency = "-" if item["avg_latency_ms"] is None else f"{item['avg_latency_ms'] / 1000:.1f}s"
+            print(
+                f"[INFO] 今日 {key}：{item['calls']} 次（缓存 {item['cache_hits']}，重试 {item['retries']}），"
+                f"输入 {item['input_tokens']} / 输出 {item['output_tokens']} token{cost}，平均耗时 {latency}"
+            )
+        if self.budget > 0 and summary:
+            used = sum(item["input_tokens"] + item["output_tokens"] for item in summary.values())
+            print(f"[INFO] 今日 token 用量 {used} / {self.budget}（{used / self.budget:.0%}）")
+        if self.deferred:
+            print(f"[WARN] 预算不足，推迟了 {self.deferred} 次低优先级调用")
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_ledger: Optional[AILedger] = None
+
+
+def shared_ledger() -> Optional[AILedger]:
+    """进程内共用的台账；AI_LEDGER=false 时返回 None"""
+    global _ledger
+    if not LEDGER_ENABLED:
+        return None
+    if _ledger is None:
+        _ledger = AILedger()
+    return _ledger
+
+
+def report() -> None:
+    if _ledger is not None:
+        _ledger.report()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多服务商路由：对冲请求 + 按延迟和错误率故障切换
+- 每个服务商（按 服务商:模型 区分）记录最近若干次调用的耗时和成败，得到滚动 p50 / p95 和错误率
+- 排序：错误率过高的排到最后，其余按 p50 从快到慢；样本不足时按配置顺序
+- 首选服务商超过自己的 p95 还没返回时，向第二个服务商发一份相同的请求（对冲），
+  先拿到有效结果的一方胜出，另一方取消；首选直接失败时立即切换，不等 p95
+单个服务商偶发的长尾延迟是告警延迟的主要来源，对冲把它截断在 p95 附近
+cron 每次启动都是新进程，统计在首次用到某个服务商时从调用台账（ai_ledger.py）的最近记录预热；
+台账里也没有足够样本时默认不对冲（AI_HEDGE_DELAY=0），只在失败后切换
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from src.common import ai_ledger
+
+# ==================== 配置 ====================
+HEDGE_ENABLED = os.getenv("AI_HEDGE", "true").lower() == "true"  # 设为 false 时只在失败后切换服务商
+HEDGE_DELAY = float(os.getenv("AI_HEDGE_DELAY", "0"))  # 样本不足、还没有 p95 时的对冲等待（秒），0 表示不对冲
+WINDOW = int(os.getenv("AI_ROUTER_WINDOW", "100"))  # 每个服务商保留最近多少次调用的统计
+MIN_SAMPLES = int(os.getenv("AI_ROUTER_MIN_SAMPLES", "5"))  # 至少多少个样本后才使用 p50 / p95 / 错误率
+MAX_ERROR_RATE = float(os.getenv("AI_ROUTER_MAX_ERROR_RATE", "0.5"))  # 错误率超过该值的服务商排到最后
+
+# 单次调用：传入服务商键，返回 {success, ...}
+Call = Callable[[str], Awaitable[Dict[str, Any]]]
+
+
+class LatencyStats:
+    """最近 WINDOW 次调用的 (耗时, 是否成功)"""
+
+    def __init__(self, window: int = WINDOW):
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.samples.append((latency, ok))
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < MIN_SAMPLES:
+            return None
+        latencies = sorted(latency for latency, _ in self.samples)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    @property
+    def p50(self) -> Optional[float]:
+        return self.percentile(0.5)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self.percentile(0.95)
+
+    @property
+    def error_rate(self) -> float:
+        if len(self.samples) < MIN_SAMPLES:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+
+class Router:
+    def __init__(self):
+        self.stats: Dict[str, LatencyStats] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def stats_for(self, key: str) -> LatencyStats:
+        if key not in self.stats:
+            stats = self.stats[key] = LatencyStats()
+            # 键为 服务商:模型，与台账的 provider / model 对应
+            ledger = ai_ledger.shared_ledger() if ":" in key else None
+            if ledger is not None:
+                provider, model = key.split(":", 1)
+                for latency, ok in ledger.recent_latencies(provider, model, WINDOW):
+                    stats.record(latency, ok)
+        return self.stats[key]
+
+    def rank(self, keys: List[str]) -> List[str]:
+        def order(item: Tuple[int, str]) -> Tuple[bool, float, int]:
+            index, key = item
+            stats = self.stats_for(key)
+            p50 = stats.p50
+            return stats.error_rate > MAX_ERROR_RATE, p50 if p50 is not None else float("inf"), index
+
+        return [key for _, key in sorted(enumerate(keys), key=order)]
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """对冲前等待的秒数；没有 p95 且未配置 AI_HEDGE_DELAY 时返回 None（不对冲）"""
+        p95 = self.stats_for(key).p95
+        if p95 is not None:
+            return p95
+        return HEDGE_DELAY if HEDGE_DELAY > 0 else None
+
+    async def _timed(self, key: str, call: Call) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            result = await call(key)
+        except asyncio.CancelledError:
+            # 被对冲请求取消：耗时至少这么久，同样计入，避免慢的服务商 p95 被低估
+            self.stats_for(key).record(time.monotonic() - started, True)
+            raise
+        except Exception as exc:
+            result = {"success": False, "ai_text": "", "full_response": str(exc), "error": str(exc)}
+        self.stats_for(key).record(time.monotonic() - started, bool(result.get("success")))
+        result.setdefault("provider", key)
+        return result
+
+    async def call(
+        self, keys: List[str], call: Call, validate: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> Dict[str, Any]:
+        """
+        按排序依次尝试，返回第一个有效结果（success 且通过 validate）；
+        都无效时返回最后一个成功的结果，全部失败时返回最后一个失败结果
+        """
+        ranked = self.rank(keys)
+        waiting = list(ranked)
+        running: Dict[asyncio.Task, str] = {}
+        fallback: Optional[Dict[str, Any]] = None
+
+        def launch() -> None:
+            key = waiting.pop(0)
+            running[asyncio.ensure_future(self._timed(key, call))] = key
+
+        launch()
+        try:
+            while running:
+                timeout = None
+                if HEDGE_ENABLED and waiting and len(running) == 1:
+                    timeout = self.hedge_delay(next(iter(running.values())))
+                done, _ = await asyncio.wait(set(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    key = next(iter(running.values()))
+                    print(f"[INFO] {key} 超过 p95（{timeout:.1f}s）未返回，向 {waiting[0]} 发送对冲请求")
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    key = running.pop(task)
+                    result = task.result()
+                    if result.get("success") and (validate is None or validate(result)):
+                        if key != ranked[0]:
+                            self.hedge_wins += 1
+                        return result
+                    if result.get("success") or fallback is None or not fallback.get("success"):
+                        fallback = result
+                    print(f"[WARN] {key} 未返回有效结果{'' if not waiting else f'，切换到 {waiting[0]}'}")
+                if not running and waiting:
+                    launch()
+            return fallback or {"success": False, "ai_text": "", "full_response": "", "error": "没有可用的服务商"}
+        finally:
+            # 胜出后取消仍在进行的请求
+            losers: Set[asyncio.Task] = set(running)
+            for task in losers:
+                task.cancel()
+            if losers:
+                await asyncio.gather(*losers, return_exceptions=True)
+
+    def report(self) -> None:
+        for key, stats in self.stats.items():
+            if not stats.samples:
+                continue
+            p50, p95 = stats.p50, stats.p95
+            print(
+                f"[INFO] AI服务商 {key}：{len(stats.samples)} 次，"
+                f"p50 {'-' if p50 is None else f'{p50:.1f}s'}，p95 {'-' if p95 is None else f'{p95:.1f}s'}，"
+                f"错误率 {stats.error_rate:.0%}"
+            )
+        if self.hedges:
+            print(f"[INFO] 对冲请求 {self.hedges} 次，其中备用服务商胜出 {self.hedge_wins} 次")
+
+
+_router: Optional[Router] = None
+
+
+def shared_router() -> Router:
+    global _router
+    if _router is None:
+        _router = Router()
+    return _router
@@ -14,19 +14,27 @@ import json
 import os
 import re
 import sqlite3
+import sys
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Set, Tuple
 from urllib.parse import urljoin
 
 import requests
 from bs4 import BeautifulSoup
-from openai import OpenAI
 from playwright.async_api import async_playwright
 
+# Allow running as a script (python src/mofcom/scraper.py) while importing project modules
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.common import ai
+
 LIST_URL = "https://www.mofcom.gov.cn/zwgk/zcfb/index.html"
 DB_PATH = Path(os.getenv("MOFCOM_DB_PATH", "data/mofcom.db"))
 AI_CONFIG_PATH = Path(os.getenv("MOFCOM_AI_CONFIG", "config/ai_config.json"))
 DEFAULT_PROVIDER = os.getenv("MOFCOM_AI_PROVIDER")
+# Articles estimated above this many tokens are split into chunks: each chunk is extracted in parallel,
+# then one reduce call writes the verdict from the extracts (latency bounded by the slowest chunk)
+CHUNK_TOKENS = int(os.getenv("MOFCOM_CHUNK_TOKENS", "3000"))
 FEISHU_WEBHOOK = os.getenv(
     "FEISHU_WEBHOOK", "https://www.feishu.cn/flow/api/trigger-webhook/bddf3cb6f0d84b025ae922df47e69804"
 )
@@ -51,6 +59,20 @@ Output Constraints
 逻辑必须严密，区分“短期情绪”和“长期基本面”。
 """
 
+EXTRACT_PROMPT = """
+你是一名贸易政策研究员。用户提供的是一篇中国商务部公告的其中一段（长公告已按段切分，分别处理）。
+
+任务：只做事实摘录，不做分析和投资判断。逐条列出本段中的：
+- 管制物项、商品编码、税率/配额等具体数字
+- 涉及的国家/地区、实体清单、企业名称
+- 生效日期、期限、适用范围、例外条款
+- 附件名称及链接
+
+要求：
+- 保留原文中的数字、编码和专有名词，不要改写或概括
+- 本段没有上述内容时，只输出“无关键事实”
+"""
+
 HEADERS = {
     "User-Agent": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -88,7 +110,7 @@ def _resolve_api_key(pcfg: Dict[str, Any]) -> str:
     raise SystemExit(f"API key missing for provider. Set 'api_key' or env '{env_name}'.")
 
 
-def _resolve_provider(cfg: Dict[str, Any], provider_name: Optional[str]) -> Dict[str, Any]:
+def _resolve_provider(cfg: Dict[str, Any], provider_name: Optional[str]) -> ai.Provider:
     name = provider_name or cfg.get("default_provider")
     if not name:
         raise SystemExit("No provider specified and no default_provider in config.")
@@ -104,17 +126,28 @@ def _resolve_provider(cfg: Dict[str, Any], provider_name: Optional[str]) -> Dict
     if not model:
         raise SystemExit(f"Provider '{name}' must define 'model'.")
 
-    client_kwargs = {"api_key": api_key, "max_retries": 0}
-    if pcfg.get("base_url"):
-        client_kwargs["base_url"] = pcfg["base_url"]
+    return ai.Provider(
+        name,
+        api_key,
+        pcfg.get("base_url") or "https://api.openai.com/v1",
+        text_model=model,
+        timeout=float(pcfg.get("timeout") or cfg.get("timeout") or 180),
+        temperature=pcfg.get("temperature", cfg.get("temperature", 0.3)),
+        # Cheaper fallback model used once the daily token budget is nearly spent (see ai_ledger.py)
+        cheap_text_model=pcfg.get("cheap_model"),
+    )
+
 
-    return {
-        "name": name,
-        "client": OpenAI(**client_kwargs),
-        "model": model,
-        "timeout": float(pcfg.get("timeout") or cfg.get("timeout") or 180),
-        "temperature": pcfg.get("temperature", cfg.get("temperature", 0.3)),
-    }
+def _resolve_providers(cfg: Dict[str, Any], provider_name: Optional[str]) -> List[ai.Provider]:
+    """The selected provider first; every other fully configured provider follows as a hedge/failover target."""
+    primary = _resolve_provider(cfg, provider_name)
+    providers = [primary]
+    for name, pcfg in cfg["providers"].items():
+        has_key = pcfg.get("api_key") or (pcfg.get("api_key_env") and os.getenv(pcfg["api_key_env"]))
+        if name == primary.name or not has_key or not (pcfg.get("model") or pcfg.get("model_name")):
+            continue
+        providers.append(_resolve_provider(cfg, name))
+    return providers
 
 
 def ensure_db() -> sqlite3.Connection:
@@ -142,20 +175,75 @@ def known_links(conn: sqlite3.Connection) -> Set[str]:
     return {r[0] for r in rows}
 
 
-def run_ai_query(payload: str, prompt: str, config: Dict[str, Any], provider: Optional[str] = None) -> str:
-    p = _resolve_provider(config, provider)
-    messages = [
-        {"role": "system", "content": prompt.strip()},
-        {"role": "user", "content": payload.strip()},
-    ]
-    response = p["client"].chat.completions.create(
-        model=p["model"],
-        messages=messages,
-        timeout=p["timeout"],
-        temperature=p["temperature"],
+async def run_ai_query(payload: str, prompt: str, config: Dict[str, Any], provider: Optional[str] = None) -> str:
+    # Shared client, cache, hedging and failover live in src/common/ai.py
+    result = await ai.analyze_text(payload.strip(), prompt, providers=_resolve_providers(config, provider))
+    if not result["success"]:
+        raise RuntimeError(result.get("error") or "AI call failed")
+    return result["ai_text"].strip()
+
+
+def estimate_tokens(text: str) -> int:
+    # No tokenizer dependency: CJK characters are roughly one token each, other text about four characters per token
+    cjk = len(re.findall(r"[\u3000-\u9fff\uff00-\uffef]", text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def chunk_text(text: str, max_tokens: Optional[int] = None) -> List[str]:
+    """Split on line boundaries (keeps tariff-list rows intact); a single oversized line is cut by length."""
+    max_tokens = max_tokens or CHUNK_TOKENS
+    chunks: List[str] = []
+    lines: List[str] = []
+    size = 0
+    for line in text.splitlines():
+        pieces = [line]
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            step = max(1, len(line) * max_tokens // line_tokens)
+            pieces = [line[i : i + step] for i in range(0, len(line), step)]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece) + 1
+            if lines and size + piece_tokens > max_tokens:
+                chunks.append("\n".join(lines))
+                lines, size = [], 0
+            lines.append(piece)
+            size += piece_tokens
+    if lines:
+        chunks.append("\n".join(lines))
+    return chunks
+
+
+async def analyze_article(
+    entry: Dict[str, str], content: str, config: Dict[str, Any], provider: Optional[str] = None
+) -> str:
+    """
+    Short articles go to the strategist prompt in one call. Long ones are map-reduced: every chunk is
+    sent to EXTRACT_PROMPT concurrently, then the joined extracts go to AI_PROMPT for the final verdict.
+    """
+    chunks = chunk_text(content)
+    if len(chunks) <= 1:
+        return await run_ai_query(build_ai_payload(entry, content), AI_PROMPT, config, provider=provider)
+
+    print(f"[INFO] {entry['title']}: ~{estimate_tokens(content)} tokens, analysing {len(chunks)} chunks in parallel")
+    header = f"【新闻标题】{entry['title']}\n【发布日期】{entry['date']}\n"
+    results = await asyncio.gather(
+        *(
+            run_ai_query(f"{header}【第 {i}/{len(chunks)} 段】\n{chunk}", EXTRACT_PROMPT, config, provider=provider)
+            for i, chunk in enumerate(chunks, 1)
+        ),
+        return_exceptions=True,
     )
-    choice = response.choices[0].message if response.choices else None
-    return (choice.content or "").strip() if choice else ""
+    if all(isinstance(result, Exception) for result in results):
+        raise RuntimeError(f"all {len(chunks)} chunk extractions failed: {results[0]}")
+
+    extracts = []
+    for i, result in enumerate(results, 1):
+        if isinstance(result, Exception):
+            print(f"[WARN] Chunk {i}/{len(chunks)} extraction failed for {entry['title']}: {result}")
+            result = "（本段提取失败，内容缺失）"
+        extracts.append(f"【第 {i}/{len(chunks)} 段要点】\n{result}")
+    digest = "原文较长，以下为分段摘录的关键事实：\n\n" + "\n\n".join(extracts)
+    return await run_ai_query(build_ai_payload(entry, digest), AI_PROMPT, config, provider=provider)
 
 
 async def fetch_listing_html() -> str:
@@ -364,10 +452,9 @@ async def process_entry(
         return None
 
     rowid, stored_at = persist_article(conn, entry, content)
-    ai_payload = build_ai_payload(entry, content)
     ai_result = ""
     try:
-        ai_result = run_ai_query(ai_payload, AI_PROMPT, ai_config, provider=DEFAULT_PROVIDER)
+        ai_result = await analyze_article(entry, content, ai_config, provider=DEFAULT_PROVIDER)
     except Exception as exc:
         ai_result = ""
         print(f"[WARN] AI call failed for {entry['title']}: {exc}")
@@ -397,6 +484,7 @@ async def main() -> None:
 
     for entry in new_entries:
         await process_entry(entry, ai_config, conn)
+    ai.report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+登录态管理：持久化 Playwright storage_state，并快速判断会话是否已失效
+- 每次成功抓取后保存 storage_state（含 X 刷新过的 Cookie 和 localStorage），下次启动直接复用
+- 手动更新了 Cookie 文件（比 storage_state 新）时以 Cookie 文件为准
+- 导航后按跳转地址、auth_token Cookie 和登录墙元素判断登录态，失效时立即失败，
+  不再等 wait_for_timeline 的 30 秒选择器超时
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, Page
+
+AUTH_CHECK_TIMEOUT = int(os.getenv("TWITTER_AUTH_CHECK_TIMEOUT", "3000"))  # 等待登录态标志出现的上限（毫秒）
+
+# 会话失效时 X 会跳转到这些地址
+LOGIN_URL_RE = re.compile(r"x\.com/(?:i/flow/login|login|logout|i/flow/signup|account/access)(?:[/?#]|$)")
+
+# 已登录：侧边栏账号按钮 / 发推按钮；未登录：登录按钮、登录表单或登录墙
+LOGIN_STATE_JS = r"""
+() => {
+    if (document.querySelector(
+        '[data-testid="SideNav_AccountSwitcher_Button"], [data-testid="AppTabBar_Profile_Link"], '
+        + '[data-testid="SideNav_NewTweet_Button"]'
+    )) return 'logged_in';
+    if (document.querySelector(
+        '[data-testid="loginButton"], [data-testid="LoginForm_Login_Button"], '
+        + 'a[href="/login"], a[href="/i/flow/login"], [data-testid="sheetDialog"] a[href*="login"]'
+    )) return 'logged_out';
+    return null;
+}
+"""
+
+
+class SessionExpiredError(SystemExit):
+    """登录态已失效（需要重新导出 Cookie）；与其他致命配置错误一样以 SystemExit 结束 cron 运行"""
+
+
+def usable_storage_state(state_file: Optional[Path], cookie_file: Optional[Path]) -> Optional[Path]:
+    """storage_state 存在且不早于 Cookie 文件时返回其路径，否则返回 None（使用 Cookie 文件）"""
+    if not state_file or not state_file.exists():
+        return None
+    if cookie_file and cookie_file.exists() and cookie_file.stat().st_mtime > state_file.stat().st_mtime:
+        print(f"[INFO] Cookie 文件比 {state_file} 新，改用 Cookie 文件登录")
+        return None
+    return state_file
+
+
+async def save_storage_state(context: "BrowserContext", state_file: Path) -> None:
+    """先写临时文件再替换，进程中途退出也不会留下半个 JSON"""
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = state_file.with_suffix(state_file.suffix + ".tmp")
+    await context.storage_state(path=str(tmp))
+    os.replace(tmp, state_file)
+
+
+def discard_storage_state(state_file: Optional[Path]) -> None:
+    """会话失效后删除保存的登录态，下次启动回到 Cookie 文件"""
+    if state_file and state_file.exists():
+        state_file.unlink()
+        print(f"[INFO] 已删除失效的登录态 {state_file}")
+
+
+async def check_login(page: "Page", timeout: int = AUTH_CHECK_TIMEOUT) -> str:
+    """返回 logged_in / logged_out / unknown（超时仍未出现任何标志）"""
+    if LOGIN_URL_RE.search(page.url):
+        return "logged_out"
+    cookies = await page.context.cookies("https://x.com")
+    if not any(c["name"] == "auth_token" and c["value"] for c in cookies):
+        return "logged_out"
+    try:
+        handle = await page.wait_for_function(LOGIN_STATE_JS, polling="raf", timeout=timeout)
+        state = await handle.json_value()
+    except Exception:
+        return "unknown"
+    # 等待期间可能已经跳转到登录页
+    if LOGIN_URL_RE.search(page.url):
+        return "logged_out"
+    return state
+
+
+async def ensure_logged_in(page: "Page", timeout: int = AUTH_CHECK_TIMEOUT) -> None:
+    """导航后立即检查登录态，已失效时抛出 SessionExpiredError"""
+    state = await check_login(page, timeout)
+    if state == "logged_out":
+        raise SessionExpiredError(f"❌ 登录态已失效（{page.url}），请重新导出 Cookie")
+    if state == "unknown":
+        print(f"[WARN] {timeout}ms 内未能判断登录态，继续等待时间线")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+待截图队列（twitter.db: pending_captures）
+单轮限速预算不够时，超出的新推文不再直接丢弃，而是连同发现时间存入队列；
+之后每轮先按发现顺序处理队列，再处理本轮新发现的推文，
+断线或限流很久后的追赶量受每轮预算约束，且不会因为滚出范围而丢失
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import sqlite3
+from typing import Any, Collection, Dict, Iterable, List
+
+
+def ensure_pending_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pending_captures (
+            id TEXT PRIMARY KEY,
+            user_handle TEXT NOT NULL,
+            link TEXT NOT NULL,
+            discovered_at TEXT NOT NULL,
+            raw_json TEXT
+        );
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_pending_user_discovered ON pending_captures(user_handle, discovered_at);"
+    )
+
+
+def enqueue_pending(conn: sqlite3.Connection, user_handle: str, tweets: Iterable[Dict[str, Any]]) -> int:
+    """加入队列；已在队列中的推文保留最初的发现时间。返回新加入的条数"""
+    discovered_at = dt.datetime.now().isoformat(timespec="seconds")
+    added = 0
+    with conn:
+        for tweet in tweets:
+            cursor = conn.execute(
+                """
+                INSERT OR IGNORE INTO pending_captures (id, user_handle, link, discovered_at, raw_json)
+                VALUES (?, ?, ?, ?, ?);
+                """,
+                (tweet["id"], user_handle, tweet["link"], discovered_at, json.dumps(tweet, ensure_ascii=False)),
+            )
+            added += cursor.rowcount
+    return added
+
+
+def load_pending(
+    conn: sqlite3.Connection, user_handle: str, known_ids: Collection[str] = ()
+) -> List[Dict[str, Any]]:
+    """
+    按发现顺序（同一批按 ID 从旧到新）返回队列中的推文
+    已在 known_ids 中（由实时监听等其他途径保存过）的推文不再截图，直接移出队列
+    """
+    rows = conn.execute(
+        """
+        SELECT id, link, raw_json FROM pending_captures
+        WHERE user_handle = ?
+        ORDER BY discovered_at, length(id), id;
+        """,
+        (user_handle,),
+    ).fetchall()
+    stale = [tweet_id for tweet_id, _, _ in rows if tweet_id in known_ids]
+    if stale:
+        remove_pending(conn, stale)
+    tweets = []
+    for tweet_id, link, raw_json in rows:
+        if tweet_id in known_ids:
+            continue
+        tweet = json.loads(raw_json) if raw_json else {}
+        tweet.update(id=tweet_id, link=link)
+        tweets.append(tweet)
+    return tweets
+
+
+def remove_pending(conn: sqlite3.Connection, tweet_ids: Iterable[str]) -> None:
+    with conn:
+        conn.executemany("DELETE FROM pending_captures WHERE id = ?;", [(tid,) for tid in tweet_ids])
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+浏览器会话管理：启动 Chromium、创建已登录的上下文、健康检查与回收
+cron 单次流水线和常驻守护进程（daemon.py）共用同一套逻辑
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from playwright.async_api import Browser, BrowserContext, Page, Playwright
+
+from src.twitter import profile
+from src.twitter.auth import save_storage_state, usable_storage_state
+from src.twitter.request_policy import SCREENSHOT, TIMELINE, RequestPolicy
+
+# 浏览器指纹（与原先各脚本中的配置保持一致）
+VIEWPORT = {"width": 1920, "height": 1080}
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
+
+
+class PagePool:
+    """同一上下文中的 N 个页面，由信号量控制同时借出的数量"""
+
+    def __init__(
+        self,
+        context: BrowserContext,
+        size: int,
+        policy: Optional[RequestPolicy] = None,
+        phase: str = SCREENSHOT,
+    ):
+        self.context = context
+        self.size = max(1, size)
+        self.policy = policy
+        self.phase = phase
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._idle: List[Page] = []
+        self._pages: List[Page] = []
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """借出一个页面，用完自动归还（首次借出时才创建）"""
+        async with self._semaphore:
+            page = self._idle.pop() if self._idle else None
+            if page is None or page.is_closed():
+                page = await self.context.new_page()
+                if self.policy:
+                    # 详情页用于截图：放行图片，仍屏蔽视频和埋点；时间线页面按 phase 指定
+                    self.policy.set_phase(page, self.phase)
+                self._pages.append(page)
+            try:
+                yield page
+            finally:
+                self._idle.append(page)
+
+    async def close(self) -> None:
+        for page in self._pages:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self._pages.clear()
+        self._idle.clear()
+
+
+class BrowserSession:
+    """
+    一个已登录的浏览器上下文 + 主页面，可做健康检查并整体回收
+    有可用的 storage_state 时直接复用，否则调用 load_cookies 读取 Cookie 文件注入
+    指定 user_data_dir 时改用持久化配置目录（launch_persistent_context），重复加载走磁盘缓存
+    """
+
+    def __init__(
+        self,
+        playwright: Playwright,
+        load_cookies: Callable[[], List[Dict[str, Any]]],
+        headless: bool = True,
+        policy: Optional[RequestPolicy] = None,
+        storage_state: Optional[Path] = None,
+        cookie_file: Optional[Path] = None,
+        user_data_dir: Optional[Path] = None,
+    ):
+        self.playwright = playwright
+        self.load_cookies = load_cookies
+        self.headless = headless
+        self.policy = policy
+        self.storage_state = storage_state
+        self.cookie_file = cookie_file
+        self.user_data_dir = user_data_dir
+        self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
+        self.page: Optional[Page] = None
+        self.pool: Optional[PagePool] = None
+        self.timeline_pages: Optional[PagePool] = None
+        self.launch_count = 0
+        self.launched_at = 0.0
+        self.cold_start = False
+        self._load_reported = False
+        self._context_closed = False
+
+        if self.user_data_dir and self.policy:
+            # Playwright 启用 route 拦截时会禁用 HTTP 缓存，与持久化配置目录的目的冲突
+            print(f"[INFO] 已启用持久化配置目录，关闭请求拦截以使用浏览器缓存")
+            self.policy = None
+
+    async def start(self) -> Page:
+        """启动浏览器、创建已登录的上下文，返回主页面"""
+        state = usable_storage_state(self.storage_state, self.cookie_file)
+        if self.user_data_dir:
+            await self._launch_persistent(state)
+        else:
+            self.browser = await self.playwright.chromium.launch(headless=self.headless)
+            self.context = await self.browser.new_context(
+                viewport=VIEWPORT,
+                user_agent=USER_AGENT,
+                # Service Worker 发出的请求不经过 context.route，启用拦截时禁用它
+                service_workers="block" if self.policy else "allow",
+                storage_state=str(state) if state else None,
+            )
+            if self.policy:
+                await self.policy.install(self.context)
+            if state:
+                print(f"[INFO] 已复用登录态 {state}")
+            else:
+                await self._inject_cookies(self.load_cookies())
+        self._context_closed = False
+        self.context.on("close", lambda _: setattr(self, "_context_closed", True))
+        # 持久化上下文启动时自带一个空白页，直接作为主页面
+        self.page = self.context.pages[0] if self.context.pages else await self.context.new_page()
+        self.launch_count += 1
+        self.launched_at = time.monotonic()
+        self._load_reported = False
+        return self.page
+
+    async def _launch_persistent(self, state: Optional[Path]) -> None:
+        self.user_data_dir.mkdir(parents=True, exist_ok=True)
+        profile.prune_profile(self.user_data_dir, profile.PROFILE_MAX_MB * 1024 * 1024)
+        self.cold_start = profile.is_cold(self.user_data_dir)
+        self.context = await self.playwright.chromium.launch_persistent_context(
+            str(self.user_data_dir),
+            headless=self.headless,
+            viewport=VIEWPORT,
+            user_agent=USER_AGENT,
+            args=[f"--disk-cache-size={profile.DISK_CACHE_MB * 1024 * 1024}"],
+        )
+        # 持久化上下文没有单独的 Browser 对象
+        self.browser = self.context.browser
+        print(f"[INFO] 已打开浏览器配置目录 {self.user_data_dir}（{'冷启动' if self.cold_start else '热启动'}）")
+
+        # 与普通模式一致：优先用 storage_state 中的 Cookie（覆盖配置目录里可能已过期的），否则用 Cookie 文件
+        if state:
+            with open(state, "r", encoding="utf-8") as f:
+                await self.context.add_cookies(json.load(f).get("cookies", []))
+            print(f"[INFO] 已复用登录态 {state}")
+        else:
+            await self._inject_cookies(self.load_cookies())
+
+    async def _inject_cookies(self, cookies: List[Dict[str, Any]]) -> None:
+        # 先注入 Cookie（必须在 goto 之前，避免以游客身份加载触发限制）
+        await self.context.add_cookies(cookies)
+        print(f"[INFO] 已注入 {len(cookies)} 个 Cookie")
+
+    async def report_load(self, page: Page, first_tweet_ms: int) -> None:
+        """持久化配置目录模式下，记录每次启动后第一次加载时间线的耗时和缓存命中"""
+        if not self.user_data_dir or self._load_reported:
+            return
+        self._load_reported = True
+        try:
+            timing = await profile.measure_load(page)
+            profile.record_load(self.user_data_dir, self.cold_start, first_tweet_ms, timing)
+        except Exception as exc:
+            print(f"[WARN] 记录页面加载耗时失败: {exc}")
+
+    def due_for_prune(self) -> bool:
+        """持久化配置目录模式下，常驻运行超过 PRUNE_INTERVAL_HOURS 后应回收浏览器以检查并清理缓存"""
+        if not self.user_data_dir or not self.launched_at:
+            return False
+        return time.monotonic() - self.launched_at > profile.PRUNE_INTERVAL_HOURS * 3600
+
+    async def save_state(self) -> None:
+        """成功抓取后保存登录态（X 会在运行中刷新 Cookie），下次启动直接复用"""
+        if not self.storage_state or not self.context:
+            return
+        try:
+            await save_storage_state(self.context, self.storage_state)
+        except Exception as exc:
+            print(f"[WARN] 保存登录态失败: {exc}")
+
+    def detail_pool(self, size: int) -> PagePool:
+        """详情页页面池：常驻模式下跨轮次复用，浏览器回收时一并重建"""
+        if self.pool is None:
+            self.pool = PagePool(self.context, size, policy=self.policy)
+        return self.pool
+
+    def timeline_pool(self, size: int) -> PagePool:
+        """时间线页面池：多目标调度时每个目标借一个页面滚动，页面数决定同时抓取的目标数"""
+        if self.timeline_pages is None:
+            self.timeline_pages = PagePool(self.context, size, policy=self.policy, phase=TIMELINE)
+        return self.timeline_pages
+
+    async def is_healthy(self, timeout: float = 5.0) -> bool:
+        """检查浏览器进程和主页面是否仍可用"""
+        if not self.context or self._context_closed:
+            return False
+        if self.browser and not self.browser.is_connected():
+            return False
+        if not self.page or self.page.is_closed():
+            return False
+        try:
+            await asyncio.wait_for(self.page.evaluate("() => document.readyState"), timeout=timeout)
+        except Exception as exc:
+            print(f"[WARN] 页面健康检查失败: {exc}")
+            return False
+        return True
+
+    async def recycle(self) -> Page:
+        """关闭当前浏览器并重新启动"""
+        print(f"[INFO] 回收浏览器（已启动 {self.launch_count} 次）")
+        await self.close()
+        return await self.start()
+
+    async def close(self) -> None:
+        """关闭浏览器，忽略已断开时的异常"""
+        # 持久化上下文需要关闭 context 才会退出浏览器并把缓存写回磁盘
+        target = self.browser or self.context
+        if target:
+            try:
+                await target.close()
+            except Exception as exc:
+                print(f"[WARN] 关闭浏览器失败: {exc}")
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.pool = None
+        self.timeline_pages = None
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Twitter 常驻抓取服务：保持一个已登录的浏览器常驻，按自己的节奏轮询
+替代 cron 每 10 分钟冷启动 Chromium；只有健康检查失败时才回收浏览器
+多个目标账号（见 targets.py）共用同一个浏览器，由调度器分配到有限的时间线页面上
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List, Set
+
+from playwright.async_api import async_playwright
+
+# 以脚本方式运行（python src/twitter/daemon.py）时也能导入项目内模块
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.common import ai
+from src.twitter import imaging, profile
+from src.twitter import twitter_pipeline as pipeline
+from src.twitter.auth import SessionExpiredError
+from src.twitter.browser import BrowserSession
+from src.twitter.targets import TARGETS_FILE, Target, TargetScheduler, load_targets
+
+# ==================== 配置 ====================
+POLL_INTERVAL = int(os.getenv("TWITTER_DAEMON_INTERVAL", "120"))  # 目标未单独配置时两轮抓取的间隔（秒）
+MAX_FAILURES = int(os.getenv("TWITTER_DAEMON_MAX_FAILURES", "3"))  # 连续失败多少次后回收浏览器
+MAX_RECYCLES = int(os.getenv("TWITTER_DAEMON_MAX_RECYCLES", "5"))  # 连续回收仍失败则退出，交给外部重启
+TIMELINE_PAGES = int(os.getenv("TWITTER_DAEMON_PAGES", "2"))  # 同时抓取的目标数（时间线页面数）
+
+
+class ScraperDaemon:
+    """常驻调度：复用同一个浏览器会话，按 TargetScheduler 的顺序对各目标执行 run_cycle"""
+
+    def __init__(self, targets: List[Target], concurrency: int = TIMELINE_PAGES):
+        self.scheduler = TargetScheduler(targets)
+        self.concurrency = max(1, concurrency)
+        self.failures = 0
+        self.recycles = 0
+        self.cycles = 0
+        self.session_expired = False
+
+    async def run(self) -> None:
+        async with async_playwright() as p:
+            session = pipeline.new_session(p)
+            await session.start()
+            try:
+                await self._loop(session)
+            finally:
+                await session.close()
+                await imaging.flush()
+                imaging.shutdown()
+
+    async def _loop(self, session: BrowserSession) -> None:
+        running: Set[asyncio.Task] = set()
+        while True:
+            # 登录态失效时回收浏览器也没用，等 Cookie 文件更新后再用新 Cookie 重启
+            if not running and self.session_expired:
+                await self._wait_for_new_cookies()
+                self.session_expired = False
+                self.recycles = 0
+                await self._recycle(session)
+
+            # 持久化配置目录模式下定期重启浏览器，启动前检查并清理缓存
+            if not running and session.due_for_prune():
+                print(f"[INFO] 浏览器已运行超过 {profile.PRUNE_INTERVAL_HOURS}h，重启以清理配置目录缓存")
+                await self._recycle(session)
+
+            # 连续失败或页面不健康时，等正在抓取的目标结束后再整体回收浏览器
+            if not running and (self.failures >= MAX_FAILURES or not await session.is_healthy()):
+                await self._recycle(session)
+                if self.recycles > MAX_RECYCLES:
+                    print(f"[ERROR] 浏览器已连续回收 {self.recycles} 次仍失败，守护进程退出")
+                    return
+                if session.page is None:
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+
+            while not self.session_expired and self.failures < MAX_FAILURES and len(running) < self.concurrency:
+                target = self.scheduler.next_target()
+                if target is None:
+                    break
+                self.scheduler.start(target)
+                running.add(asyncio.create_task(self.poll_target(session, target)))
+
+            wait = self.scheduler.seconds_until_due()
+            if len(running) >= self.concurrency or self.failures >= MAX_FAILURES or self.session_expired:
+                # 页面都在用（或等待回收），到期的目标也只能等有页面空出来
+                wait = None
+            if running:
+                done, running = await asyncio.wait(
+                    running, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                )
+            else:
+                await asyncio.sleep(POLL_INTERVAL if wait is None else wait)
+
+    async def poll_target(self, session: BrowserSession, target: Target) -> None:
+        """借一个时间线页面对目标执行一轮抓取；失败计入该目标的退避和全局失败次数"""
+        self.cycles += 1
+        cycle = self.cycles
+        print(f"\n[INFO] ========== 守护进程第 {cycle} 轮：@{target.handle} ==========")
+
+        started = time.monotonic()
+        success = False
+        try:
+            async with session.timeline_pool(self.concurrency).page() as page:
+                new_count, processed_count = await pipeline.run_cycle(target.handle, session=session, page=page)
+            success = True
+        except SessionExpiredError as exc:
+            self.session_expired = True
+            print(f"[ERROR] 第 {cycle} 轮 @{target.handle}: {exc}")
+        except (Exception, SystemExit) as exc:
+            # wait_for_timeline 等函数用 SystemExit 表示致命错误，常驻模式下按一次失败处理
+            self.failures += 1
+            print(f"[WARN] 第 {cycle} 轮 @{target.handle} 失败（连续 {self.failures} 次）: {exc}")
+        finally:
+            self.scheduler.finish(target, success)
+            pipeline.report_request_policy(session)
+            ai.report()
+
+        if success:
+            self.failures = 0
+            self.recycles = 0
+            print(
+                f"[INFO] 第 {cycle} 轮 @{target.handle} 完成：新推文 {new_count} 条，已处理 {processed_count} 条，"
+                f"耗时 {time.monotonic() - started:.1f}s"
+            )
+
+    async def _wait_for_new_cookies(self) -> None:
+        cookie_file = pipeline.COOKIE_FILE
+        mtime = cookie_file.stat().st_mtime if cookie_file.exists() else None
+        print(f"[ERROR] 登录态已失效，暂停抓取，等待更新 {cookie_file}")
+        while (cookie_file.stat().st_mtime if cookie_file.exists() else None) == mtime:
+            await asyncio.sleep(POLL_INTERVAL)
+        print(f"[INFO] 检测到 Cookie 文件已更新，重新启动浏览器")
+
+    async def _recycle(self, session: BrowserSession) -> None:
+        self.recycles += 1
+        self.failures = 0
+        try:
+            await session.recycle()
+        except Exception as exc:
+            print(f"[ERROR] 浏览器重启失败: {exc}")
+
+
+async def main() -> None:
+    targets = load_targets(pipeline.TARGET_USER, POLL_INTERVAL)
+
+    print(f"=" * 60)
+    print(f"Twitter 常驻抓取服务启动")
+    print(f"=" * 60)
+    print(f"[INFO] 目标账号: {len(targets)} 个（{TARGETS_FILE if TARGETS_FILE.exists() else 'TWITTER_USER'}）")
+    for target in targets:
+        print(f"[INFO]   @{target.handle}  优先级 {target.priority}  间隔 {target.interval}s")
+    print(f"[INFO] 时间线页面数: {TIMELINE_PAGES}")
+
+    if not pipeline.validate_config():
+        return
+
+    try:
+        await ScraperDaemon(targets).run()
+    except KeyboardInterrupt:
+        print(f"\n[INFO] 用户中断")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+截图近似去重（twitter_ai.db: screenshot_hashes）
+每张截图在编码进程里顺带计算 64 位 dHash（见 imaging.py），AI 分析前按汉明距离查找近似截图：
+重新抓取的推文、同一段文字配同一张梗图的转发直接复用之前的分析结果，不再重复上传 OSS 和调用视觉模型
+
+整张截图的 8x8 dHash 主要反映头像、昵称和版式，同一账号两条文字不同的推文距离也可能只有 1，
+因此 dHash 只用来筛候选，还要求推文正文（空白归一化后的哈希）完全一致；没有正文的推文不去重
+
+查找用分段索引：64 位哈希切成 4 段 16 位，每段单独建索引；
+距离不超过 3 的两个哈希至少有一段完全相同，先按段取候选再逐个算汉明距离
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+from typing import Optional, Tuple
+
+DEDUPE_DISTANCE = int(os.getenv("TWITTER_DEDUPE_DISTANCE", "3"))  # 视为重复的最大汉明距离，-1 关闭去重
+
+BANDS = 4
+BAND_BITS = 16
+
+
+def _bands(hash_hex: str) -> Tuple[int, ...]:
+    value = int(hash_hex, 16)
+    mask = (1 << BAND_BITS) - 1
+    return tuple((value >> (BAND_BITS * i)) & mask for i in range(BANDS))
+
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def text_digest(text: Optional[str]) -> str:
+    """推文正文的哈希（合并空白后计算）；没有正文时返回空字符串"""
+    normalized = re.sub(r"\s+", " ", text or "").strip()
+    if not normalized:
+        return ""
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def ensure_hash_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS screenshot_hashes (
+            tweet_id TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            band0 INTEGER NOT NULL,
+            band1 INTEGER NOT NULL,
+            band2 INTEGER NOT NULL,
+            band3 INTEGER NOT NULL,
+            text_hash TEXT NOT NULL DEFAULT ''
+        );
+        """
+    )
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(screenshot_hashes);").fetchall()}
+    if "text_hash" not in columns:
+        conn.execute("ALTER TABLE screenshot_hashes ADD COLUMN text_hash TEXT NOT NULL DEFAULT '';")
+    for i in range(BANDS):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_hash_band{i} ON screenshot_hashes(band{i});")
+
+
+def record_hash(conn: sqlite3.Connection, tweet_id: str, hash_hex: str, text_hash: str = "") -> None:
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO screenshot_hashes (tweet_id, hash, band0, band1, band2, band3, text_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(tweet_id) DO UPDATE SET
+                hash=excluded.hash,
+                band0=excluded.band0,
+                band1=excluded.band1,
+                band2=excluded.band2,
+                band3=excluded.band3,
+                text_hash=excluded.text_hash;
+            """,
+            (tweet_id, hash_hex, *_bands(hash_hex), text_hash),
+        )
+
+
+def find_similar(
+    conn: sqlite3.Connection,
+    tweet_id: str,
+    hash_hex: str,
+    text_hash: str,
+    max_distance: int = DEDUPE_DISTANCE,
+) -> Optional[Tuple[str, int]]:
+    """
+    返回正文哈希相同、截图距离最近且不超过 max_distance 的其他推文 (tweet_id, 距离)，没有时返回 None
+    text_hash 为空（没有正文）时不做判断，直接返回 None
+    """
+    if max_distance < 0 or not text_hash:
+        return None
+    bands = _bands(hash_hex)
+    where = " OR ".join(f"band{i} = ?" for i in range(BANDS))
+    rows = conn.execute(
+        f"SELECT tweet_id, hash FROM screenshot_hashes WHERE tweet_id != ? AND text_hash = ? AND ({where})",
+        (tweet_id, text_hash, *bands),
+    ).fetchall()
+    best: Optional[Tuple[str, int]] = None
+    for other_id, other_hash in rows:
+        distance = hamming(hash_hex, other_hash)
+        if distance <= max_distance and (best is None or distance < best[1]):
+            best = (other_id, distance)
+    return best
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推文详情页抓取（scraper.py 和 twitter_pipeline.py 共用）
+按真实信号判断页面就绪，不再用固定的 wait_for_timeout：
+- TweetDetail 接口响应到达、推文 article 可见
+- article 内所有 <img> 解码完成、字体加载完成
+- article 高度连续几帧不变（布局稳定）后立即截图
+时间线上显示完整的推文（没有 Show more、敏感内容遮罩、引用卡片）直接在时间线上原地截图，
+省掉一次详情页导航；模拟真人的随机停顿由 pacing.PacingPolicy 在导航前单独控制
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict
+
+from src.twitter import imaging
+from src.twitter.graphql_timeline import operation_name
+
+if TYPE_CHECKING:
+    from playwright.async_api import Locator, Page, Response
+
+ARTICLE = 'article[data-testid="tweet"]'
+RESPONSE_TIMEOUT = 15000  # 等待 TweetDetail 响应的上限（毫秒），超时后只按 article 可见判断
+READY_TIMEOUT = 5000  # 图片解码 + 字体 + 布局稳定的总上限（毫秒）
+EXPAND_TIMEOUT = 2000  # 点击 Show more / View 后等待按钮消失的上限（毫秒）
+
+# 在页面内一次完成：字体就绪 → article 内图片解码 → 高度连续 3 帧不变（对 locator 调用 evaluate）
+# 每一步都受同一个截止时间约束，超时后照常返回，由调用方决定是否继续截图
+ARTICLE_READY_JS = r"""
+async (article, timeout) => {
+    const deadline = performance.now() + timeout;
+    const remaining = () => Math.max(0, deadline - performance.now());
+    const within = (promise) => Promise.race([promise, new Promise((r) => setTimeout(r, remaining()))]);
+
+    await within(document.fonts.ready);
+    const images = Array.from(article.querySelectorAll('img'));
+    await within(Promise.all(images.map((img) => img.decode().catch(() => null))));
+
+    let last = -1, stable = 0;
+    while (stable < 3 && remaining() > 0) {
+        await new Promise((r) => requestAnimationFrame(() => r()));
+        const height = article.getBoundingClientRect().height;
+        stable = height === last ? stable + 1 : 0;
+        last = height;
+    }
+    return {
+        ready: stable >= 3,
+        images: images.length,
+        pending: images.filter((img) => !img.complete || !img.naturalWidth).length,
+    };
+}
+"""
+
+
+def _is_tweet_detail(response: "Response") -> bool:
+    return operation_name(response.url) == "TweetDetail"
+
+
+async def open_tweet_detail(page: "Page", link: str, timeout: int) -> None:
+    """导航到详情页，等待 TweetDetail 响应和推文 article 出现"""
+    # 先开始监听再导航，避免响应早于监听到达
+    response_wait = asyncio.ensure_future(
+        page.wait_for_event("response", predicate=_is_tweet_detail, timeout=min(timeout, RESPONSE_TIMEOUT))
+    )
+    try:
+        # 不等 load 事件（所有图片加载完），就绪由下面的信号判断
+        await page.goto(link, timeout=timeout, wait_until="domcontentloaded")
+        try:
+            await response_wait
+        except Exception:
+            print(f"[WARN] 未等到 TweetDetail 响应，按页面元素判断就绪")
+    finally:
+        if not response_wait.done():
+            response_wait.cancel()
+    await page.wait_for_selector(ARTICLE, timeout=15000, state="visible")
+
+
+async def _click_and_wait_gone(page: "Page", label: str, description: str) -> None:
+    try:
+        button = page.locator(f"{ARTICLE} button").filter(has_text=label).first
+        if await button.count() > 0 and await button.is_visible():
+            await button.click()
+            print(f"[INFO] 已点击 {label} {description}")
+            # 按钮消失说明内容已经展开，不再固定等待
+            await button.wait_for(state="detached", timeout=EXPAND_TIMEOUT)
+    except Exception:
+        pass  # 没有按钮或已展开，忽略
+
+
+async def expand_article(page: "Page") -> None:
+    """展开长推文（Show more）和敏感内容（View）"""
+    await _click_and_wait_gone(page, "Show more", "展开长推文")
+    await _click_and_wait_gone(page, "View", "展示敏感内容")
+
+
+async def wait_for_article_ready(article: "Locator", timeout: int = READY_TIMEOUT) -> Dict[str, Any]:
+    """等待 article 内图片解码、字体加载、布局稳定；返回 {ready, images, pending}"""
+    return await article.evaluate(ARTICLE_READY_JS, timeout)
+
+
+async def capture_screenshot(article: "Locator", tweet: Dict[str, Any], screenshot_dir: Path) -> Path:
+    """
+    截图到内存（PNG，无损）→ 进程池缩放编码 → 字节放进 tweet 供上传和 AI 直接使用，
+    本地文件在后台写入存档
+    """
+    raw = await article.screenshot(type="png")
+    data, image_hash = await imaging.encode(raw)
+    screenshot_path = screenshot_dir / f"{tweet['id']}{imaging.suffix()}"
+    tweet["screenshot_path"] = str(screenshot_path)
+    tweet[imaging.IMAGE_KEY] = data
+    tweet[imaging.HASH_KEY] = image_hash
+    imaging.archive(screenshot_path, data)
+    return screenshot_path
+
+
+def needs_detail(tweet: Dict[str, Any]) -> bool:
+    """时间线上显示不完整（长推文截断、敏感内容遮罩、引用卡片）的推文必须进详情页截图"""
+    return bool(tweet.get("truncated") or tweet.get("sensitive") or tweet.get("quote"))
+
+
+def timeline_article(page: "Page", tweet_id: str) -> "Locator":
+    """时间线上某条推文的 article（按 User-Name 中的状态链接定位，不会匹配到引用卡片）"""
+    status_link = page.locator(f'[data-testid="User-Name"] a[href$="/status/{tweet_id}"]')
+    return page.locator(ARTICLE).filter(has=status_link).first
+
+
+async def screenshot_in_place(page: "Page", tweet: Dict[str, Any], screenshot_dir: Path) -> bool:
+    """
+    在当前时间线页面上直接对推文 article 截图，并提取正文（已有全文时跳过）
+    article 不在 DOM 中或图片没加载完时返回 False，由调用方回退到详情页
+    """
+    tweet_id = tweet["id"]
+    article = timeline_article(page, tweet_id)
+    scroll_y = None
+    try:
+        if await article.count() == 0:
+            return False
+        # 截图会把元素滚入视口，记下位置截完后还原，不打乱时间线的滚动进度
+        scroll_y = await page.evaluate("() => window.scrollY")
+        await article.scroll_into_view_if_needed(timeout=EXPAND_TIMEOUT)
+        state = await wait_for_article_ready(article)
+        if state["pending"]:
+            print(f"[INFO] 推文 {tweet_id} 在时间线上还有 {state['pending']} 张图片未加载，改为进入详情页")
+            return False
+
+        if not tweet.get("text"):
+            text_locator = article.locator('[data-testid="tweetText"]').first
+            text = await text_locator.inner_text() if await text_locator.count() > 0 else ""
+            tweet["text"] = text.strip()
+
+        screenshot_path = await capture_screenshot(article, tweet, screenshot_dir)
+        print(f"[INFO] 已在时间线上原地截图: {screenshot_path}")
+        return True
+    except Exception as exc:
+        print(f"[WARN] 原地截图失败 {tweet_id}，改为进入详情页: {exc}")
+        return False
+    finally:
+        if scroll_y is not None:
+            try:
+                await page.evaluate("(y) => window.scrollTo(0, y)", scroll_y)
+            except Exception:
+                pass
+
+
+async def fetch_tweet_detail(page: "Page", tweet: Dict[str, Any], screenshot_dir: Path, timeout: int) -> Dict[str, Any]:
+    """进入推文详情页，提取文字（已有全文时跳过）并对 article 截图"""
+    tweet_id = tweet["id"]
+    link = tweet["link"]
+
+    print(f"[INFO] 进入详情页: {link}")
+    started = time.monotonic()
+
+    try:
+        await open_tweet_detail(page, link, timeout)
+        await expand_article(page)
+        state = await wait_for_article_ready(page.locator(ARTICLE).first)
+        if not state["ready"] or state["pending"]:
+            print(f"[WARN] 详情页未完全就绪（图片 {state['images']} 张，未加载 {state['pending']} 张），继续截图")
+
+        # 提取文字（graphql 模式已从接口拿到全文，详情页只用于截图）
+        if not tweet.get("text"):
+            try:
+                text_locator = page.locator(f'{ARTICLE} [data-testid="tweetText"]').first
+                text = await text_locator.inner_text() if await text_locator.count() > 0 else ""
+                tweet["text"] = text.strip()
+            except Exception:
+                tweet["text"] = ""
+
+        # 截图：对推文本体 article 区域截图（避免 cellInnerDiv 的上下留白）
+        try:
+            screenshot_path = await capture_screenshot(page.locator(ARTICLE).first, tweet, screenshot_dir)
+            print(f"[INFO] 已保存截图: {screenshot_path}（{(time.monotonic() - started) * 1000:.0f}ms）")
+        except Exception as exc:
+            print(f"[WARN] 截图失败: {exc}")
+            tweet["screenshot_path"] = None
+
+    except Exception as exc:
+        print(f"[WARN] 获取推文详情失败 {tweet_id}: {exc}")
+        tweet.setdefault("text", "")
+        tweet["screenshot_path"] = None
+
+    return tweet
+
+
+# X 限流时不一定返回 429 页面，而是在时间线/详情页位置显示错误提示和 Retry 按钮
+RATE_LIMIT_JS = r"""
+() => {
+    const text = document.body ? document.body.innerText : '';
+    if (/Rate limit exceeded|Too Many Requests|请求过多|速率限制/i.test(text)) return true;
+    return /Something went wrong\. Try reloading\.|出错了。请尝试重新加载。/.test(text)
+        && !document.querySelector('article[data-testid="tweet"]');
+}
+"""
+
+
+async def is_rate_limited(page: "Page") -> bool:
+    """页面上是否显示限流提示（没有推文、只有"出错了，请重新加载"也按限流处理）"""
+    try:
+        return bool(await page.evaluate(RATE_LIMIT_JS))
+    except Exception:
+        return False
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+从 X 前端的 GraphQL 接口响应（UserTweets / TweetDetail）中直接解析推文
+页面本身就会请求这些接口，监听 page.on("response") 即可拿到全文、发布时间、
+转发/引用标记、媒体和互动数据，不必再逐条进入详情页读取 DOM
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import re
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Set
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page, Response
+
+# https://x.com/i/api/graphql/<queryId>/UserTweets?variables=...
+GRAPHQL_URL_RE = re.compile(r"/i/api/graphql/[^/]+/(UserTweets|TweetDetail)(?:\?|$)")
+
+
+def operation_name(url: str) -> Optional[str]:
+    """返回 GraphQL 操作名（UserTweets / TweetDetail），其他请求返回 None"""
+    match = GRAPHQL_URL_RE.search(url)
+    return match.group(1) if match else None
+
+
+def _parse_created_at(value: str) -> str:
+    """'Wed Oct 10 20:19:24 +0000 2018' → ISO 8601，解析失败时原样返回"""
+    try:
+        return dt.datetime.strptime(value, "%a %b %d %H:%M:%S %z %Y").isoformat()
+    except (TypeError, ValueError):
+        return value or ""
+
+
+def _unwrap(result: Dict[str, Any]) -> Dict[str, Any]:
+    """TweetWithVisibilityResults 把真正的推文包在 tweet 字段里"""
+    if result.get("__typename") == "TweetWithVisibilityResults":
+        return result.get("tweet") or {}
+    return result
+
+
+def _screen_name(tweet: Dict[str, Any]) -> str:
+    user = tweet.get("core", {}).get("user_results", {}).get("result", {})
+    # 新版接口把 screen_name 放在 user.core，旧版在 user.legacy
+    return user.get("core", {}).get("screen_name") or user.get("legacy", {}).get("screen_name", "")
+
+
+def _full_text(tweet: Dict[str, Any]) -> str:
+    # 长推文（Premium）的完整正文在 note_tweet 中，legacy.full_text 只有截断版本
+    note = tweet.get("note_tweet", {}).get("note_tweet_results", {}).get("result", {})
+    return note.get("text") or tweet.get("legacy", {}).get("full_text", "")
+
+
+def _media(legacy: Dict[str, Any]) -> List[Dict[str, str]]:
+    items = legacy.get("extended_entities", {}).get("media") or legacy.get("entities", {}).get("media") or []
+    media = []
+    for item in items:
+        entry = {"type": item.get("type", "photo"), "url": item.get("media_url_https", "")}
+        variants = item.get("video_info", {}).get("variants") or []
+        mp4 = [v for v in variants if v.get("content_type") == "video/mp4"]
+        if mp4:
+            entry["video_url"] = max(mp4, key=lambda v: v.get("bitrate", 0)).get("url", "")
+        media.append(entry)
+    return media
+
+
+def parse_tweet_result(result: Dict[str, Any], pinned: bool = False) -> Optional[Dict[str, Any]]:
+    """把一个 tweet_results.result 节点转换成流水线使用的推文字典"""
+    tweet = _unwrap(result)
+    legacy = tweet.get("legacy")
+    tweet_id = tweet.get("rest_id")
+    if not legacy or not tweet_id:
+        return None
+
+    author = _screen_name(tweet)
+    retweeted = legacy.get("retweeted_status_result", {}).get("result")
+    if retweeted:
+        # 与 DOM 模式一致：转发以原推为准（ID、作者、正文），并标记 is_repost
+        original = parse_tweet_result(retweeted)
+        if not original:
+            return None
+        original.update({"is_repost": 1, "reposted_by": author, "pinned": pinned})
+        return original
+
+    quoted = tweet.get("quoted_status_result", {}).get("result")
+    quoted_id = _unwrap(quoted).get("rest_id") if quoted else legacy.get("quoted_status_id_str")
+    views = tweet.get("views", {}).get("count")
+
+    return {
+        "id": tweet_id,
+        "user_handle": author,
+        "link": f"https://x.com/{author}/status/{tweet_id}",
+        "text": _full_text(tweet).strip(),
+        "created_at": _parse_created_at(legacy.get("created_at", "")),
+        "is_repost": 0,
+        "is_quote": 1 if legacy.get("is_quote_status") or quoted_id else 0,
+        "quoted_id": quoted_id,
+        "pinned": pinned,
+        "media": _media(legacy),
+        "metrics": {
+            "reply": legacy.get("reply_count", 0),
+            "retweet": legacy.get("retweet_count", 0),
+            "like": legacy.get("favorite_count", 0),
+            "quote": legacy.get("quote_count", 0),
+            "bookmark": legacy.get("bookmark_count", 0),
+            "view": int(views) if views and str(views).isdigit() else None,
+        },
+        "source": "graphql",
+    }
+
+
+def _instructions(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    data = payload.get("data", {})
+    # TweetDetail
+    conversation = data.get("threaded_conversation_with_injections_v2")
+    if conversation:
+        return conversation.get("instructions", [])
+    # UserTweets：timeline_v2（旧）或 timeline（新）
+    result = data.get("user", {}).get("result", {})
+    timeline = result.get("timeline_v2") or result.get("timeline") or {}
+    return timeline.get("timeline", {}).get("instructions", [])
+
+
+def _entry_results(entry: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    content = entry.get("content", {})
+    item = content.get("itemContent", {})
+    if item.get("tweet_results", {}).get("result"):
+        yield item["tweet_results"]["result"]
+    # 自我回复串（profile-conversation-*）是一个包含多条推文的模块
+    for module_item in content.get("items", []):
+        inner = module_item.get("item", {}).get("itemContent", {})
+        if inner.get("tweet_results", {}).get("result"):
+            yield inner["tweet_results"]["result"]
+
+
+def parse_timeline_payload(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """解析 UserTweets / TweetDetail 响应，按时间线顺序返回推文（置顶推文带 pinned 标记）"""
+    tweets: List[Dict[str, Any]] = []
+    for instruction in _instructions(payload):
+        kind = instruction.get("type")
+        if kind == "TimelinePinEntry":
+            entries, pinned = [instruction.get("entry", {})], True
+        elif kind == "TimelineAddEntries":
+            entries, pinned = instruction.get("entries", []), False
+        else:
+            continue
+        for entry in entries:
+            for result in _entry_results(entry):
+                tweet = parse_tweet_result(result, pinned=pinned)
+                if tweet:
+                    tweets.append(tweet)
+    return tweets
+
+
+class GraphQLTimelineCollector:
+    """监听页面的 GraphQL 响应，累计解析出的推文（按首次出现的顺序，按 ID 去重）"""
+
+    def __init__(self) -> None:
+        self.tweets: Dict[str, Dict[str, Any]] = {}
+        self.responses = 0
+        self._pending: Set[asyncio.Task] = set()
+
+    def attach(self, page: "Page") -> None:
+        page.on("response", self._on_response)
+
+    def detach(self, page: "Page") -> None:
+        page.remove_listener("response", self._on_response)
+
+    def _on_response(self, response: "Response") -> None:
+        if not operation_name(response.url):
+            return
+        task = asyncio.ensure_future(self._handle(response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _handle(self, response: "Response") -> None:
+        try:
+            payload = await response.json()
+        except Exception as exc:
+            print(f"[WARN] 解析 GraphQL 响应失败 {response.url[:80]}: {exc}")
+            return
+        self.responses += 1
+        for tweet in parse_timeline_payload(payload):
+            # 后到的响应（如 TweetDetail）信息更完整，合并覆盖
+            self.tweets.setdefault(tweet["id"], {}).update(tweet)
+
+    async def drain(self) -> None:
+        """等待已收到但尚未解析完的响应"""
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    def authored_by(self, user_handle: str) -> List[Dict[str, Any]]:
+        """只返回目标用户本人发布的推文（与 DOM 模式一致，不含转发）"""
+        handle = user_handle.lower()
+        tweets = []
+        for tweet in self.tweets.values():
+            if tweet.get("is_repost") or tweet.get("user_handle", "").lower() != handle:
+                continue
+            # 统一使用调用方的写法，known_tweet_ids / save_tweet 按 user_handle 精确匹配
+            tweets.append({**tweet, "user_handle": user_handle})
+        return tweets
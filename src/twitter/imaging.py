@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+截图编码：Playwright 截图直接返回 PNG 字节，在进程池里缩放并重新编码（WebP 或 JPEG），
+编码结果随推文字典交给 OSS 上传和 AI 分析，不再先写盘再读回
+本地文件只作为存档，在后台线程写入，不阻塞抓取
+编码进程顺带计算 dHash，供 AI 分析前的近似去重（dedupe.py）使用
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Set, Tuple
+
+# ==================== 配置 ====================
+SCREENSHOT_FORMAT = os.getenv("TWITTER_SCREENSHOT_FORMAT", "webp").lower()  # webp / jpeg
+SCREENSHOT_WIDTH = int(os.getenv("TWITTER_SCREENSHOT_WIDTH", "1200"))  # 宽于该值时等比缩小（像素），0 表示不缩放
+SCREENSHOT_QUALITY = int(os.getenv("TWITTER_SCREENSHOT_QUALITY", "80"))  # WebP / JPEG 质量
+ENCODE_WORKERS = int(os.getenv("TWITTER_ENCODE_WORKERS", "2"))  # 编码进程数
+
+# 编码后的截图字节在推文字典中的键（不写入数据库的 raw_json）
+IMAGE_KEY = "screenshot_bytes"
+HASH_KEY = "screenshot_hash"
+
+CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_archive_tasks: Set[asyncio.Task] = set()
+
+
+def suffix(fmt: str = SCREENSHOT_FORMAT) -> str:
+    return ".webp" if fmt == "webp" else ".jpg"
+
+
+def content_type(path: str) -> str:
+    return CONTENT_TYPES["webp"] if path.endswith(".webp") else CONTENT_TYPES["jpeg"]
+
+
+def encode_image(data: bytes, fmt: str = SCREENSHOT_FORMAT, width: int = SCREENSHOT_WIDTH, quality: int = SCREENSHOT_QUALITY) -> bytes:
+    """PNG → 缩放到目标宽度 → WebP / JPEG（在编码进程中执行，参数和返回值都是纯字节）"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        if width and image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        out = io.BytesIO()
+        if fmt == "webp":
+            image.save(out, format="WEBP", quality=quality, method=4)
+        else:
+            # 截图以文字为主，关闭色度抽样避免文字边缘发虚
+            image.save(out, format="JPEG", quality=quality, optimize=True, progressive=True, subsampling=0)
+        return out.getvalue()
+
+
+def dhash(data: bytes, size: int = 8) -> str:
+    """差值哈希：灰度缩到 (size+1)×size，逐行比较相邻像素，得到 size*size 位，返回十六进制"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        pixels = image.convert("L").resize((size + 1, size), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return f"{value:0{size * size // 4}x}"
+
+
+def encode_and_hash(data: bytes) -> Tuple[bytes, str]:
+    return encode_image(data), dhash(data)
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Playwright 和 to_thread 的线程已经在运行，用 spawn 启动编码进程，避免 fork 带着线程锁的状态
+        _executor = ProcessPoolExecutor(
+            max_workers=max(1, ENCODE_WORKERS), mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+async def encode(data: bytes) -> Tuple[bytes, str]:
+    """在进程池中编码并计算 dHash，不占用事件循环；返回 (编码后的字节, 哈希)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool(), encode_and_hash, data)
+
+
+def _write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def archive(path: Path, data: bytes) -> None:
+    """后台写入本地存档；失败只打印警告"""
+
+    async def write() -> None:
+        try:
+            await asyncio.to_thread(_write, path, data)
+        except OSError as exc:
+            print(f"[WARN] 截图存档失败 {path}: {exc}")
+
+    task = asyncio.ensure_future(write())
+    _archive_tasks.add(task)
+    task.add_done_callback(_archive_tasks.discard)
+
+
+async def flush() -> None:
+    """等待所有存档写完（进程退出前调用）"""
+    if _archive_tasks:
+        await asyncio.gather(*list(_archive_tasks))
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抓取节奏控制：多个页面并发访问 X 时共享的限速器，以及模拟真人的随机停顿
+页面就绪由 detail.py 按真实信号判断，这里只负责"下一次导航前等多久"
+
+AdaptiveRateLimiter 是跨运行共享的令牌桶，状态保存在 twitter.db：
+- 每次加载主页、滚动、进入详情页消耗一个令牌，速率单位为 次/分钟
+- 遇到 429（只看页面本身和 /i/api/、graphql 接口，图片等子资源不算）、限流提示页或空时间线时
+  速率减半并暂停一段时间（乘性减）
+- 整轮运行没有任何限流信号时速率加 RATE_STEP（加性增），逐步逼近能持续的最高速率
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import sqlite3
+import time
+from typing import Any, Optional, Tuple
+
+# ==================== 配置 ====================
+RATE_INITIAL = float(os.getenv("TWITTER_RATE_INITIAL", "20"))  # 首次运行的速率（次/分钟）
+RATE_MIN = float(os.getenv("TWITTER_RATE_MIN", "2"))  # 降速下限
+RATE_MAX = float(os.getenv("TWITTER_RATE_MAX", "60"))  # 提速上限
+RATE_STEP = float(os.getenv("TWITTER_RATE_STEP", "2"))  # 每轮健康运行后增加的速率
+RATE_BACKOFF = float(os.getenv("TWITTER_RATE_BACKOFF", "0.5"))  # 遇到限流信号时速率乘以该系数
+RATE_PAUSE = int(os.getenv("TWITTER_RATE_PAUSE", "300"))  # 遇到限流信号后暂停的秒数
+RATE_HORIZON = int(os.getenv("TWITTER_RATE_HORIZON", "120"))  # 单轮最多愿意为令牌等待的秒数（决定本轮详情页预算）
+PENALTY_COOLDOWN = 60  # 同一波限流（多个 429 响应）只降速一次（秒）
+
+
+def is_rate_limited(response: Any) -> bool:
+    """页面本身或 X 接口（/i/api/、graphql）返回 429；图片、统计上报等子资源的 429 不代表账号被限流"""
+    if response.status != 429:
+        return False
+    url = response.url.split("?")[0]
+    if "/jot/" in url:  # 客户端事件上报
+        return False
+    if "/i/api/" in url or "graphql" in url:
+        return True
+    try:
+        return response.request.resource_type == "document"
+    except Exception:
+        return False
+
+
+class RateLimiter:
+    """最小间隔限速器：所有协程共享，保证两次放行之间至少间隔 min_interval 秒"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = max(0.0, min_interval)
+        self._lock = asyncio.Lock()
+        self._next_at = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+                now = time.monotonic()
+            self._next_at = now + self.min_interval
+
+
+def parse_jitter(value: str) -> Tuple[float, float]:
+    """'800-1500'（毫秒）→ (0.8, 1.5) 秒；单个数字表示固定停顿，空值或 0 表示不停顿"""
+    parts = [p.strip() for p in (value or "").split("-") if p.strip()]
+    if not parts:
+        return 0.0, 0.0
+    low = float(parts[0]) / 1000
+    high = float(parts[-1]) / 1000
+    return (min(low, high), max(low, high))
+
+
+class PacingPolicy:
+    """
+    导航节奏：所有页面共享的最小间隔 + 每次导航前的随机停顿（第一次导航不停顿）
+    传入 bucket 时每次导航还要从自适应令牌桶取一个令牌
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 0.0,
+        jitter: Tuple[float, float] = (0.0, 0.0),
+        bucket: Optional["AdaptiveRateLimiter"] = None,
+    ):
+        self.limiter = RateLimiter(min_interval)
+        self.jitter = jitter
+        self.bucket = bucket
+        self._started = False
+
+    async def wait(self) -> None:
+        if self._started and self.jitter[1] > 0:
+            # 随机停顿在各页面内各自进行，不占用共享的限速锁
+            await asyncio.sleep(random.uniform(*self.jitter))
+        self._started = True
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        await self.limiter.acquire()
+
+
+# ==================== 自适应令牌桶 ====================
+def ensure_rate_limit_table(conn: sqlite3.Connection) -> None:
+    """每个限速器一行：当前速率、剩余令牌和暂停截止时间（Unix 时间戳，跨进程有效）"""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            name TEXT PRIMARY KEY,
+            rate REAL NOT NULL,
+            tokens REAL NOT NULL,
+            paused_until REAL NOT NULL DEFAULT 0,
+            last_penalty_at REAL NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        );
+        """
+    )
+
+
+class AdaptiveRateLimiter:
+    """
+    AIMD 令牌桶：桶容量为一分钟的令牌数，令牌按 rate 持续补充
+    同一进程内所有页面共享一个实例；跨进程（cron 每轮、守护进程重启）通过 load/save 延续状态
+    """
+
+    def __init__(
+        self,
+        name: str = "x",
+        rate: float = RATE_INITIAL,
+        tokens: Optional[float] = None,
+        paused_until: float = 0.0,
+        last_penalty_at: float = 0.0,
+        updated_at: Optional[float] = None,
+    ):
+        self.name = name
+        self.rate = min(max(rate, RATE_MIN), RATE_MAX)
+        self.tokens = self.capacity if tokens is None else tokens
+        self.paused_until = paused_until
+        self.last_penalty_at = last_penalty_at
+        self._updated_at = time.time() if updated_at is None else updated_at
+        self._lock = asyncio.Lock()
+        self._refill()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.rate)
+
+    def _refill(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        elapsed = max(0.0, now - max(self._updated_at, self.paused_until))
+        if now > self.paused_until:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate / 60)
+        self._updated_at = max(self._updated_at, now)
+
+    def paused_for(self, now: Optional[float] = None) -> float:
+        """距离暂停结束的秒数，未暂停时为 0"""
+        now = time.time() if now is None else now
+        return max(0.0, self.paused_until - now)
+
+    def budget(self, horizon: float = RATE_HORIZON, now: Optional[float] = None) -> int:
+        """horizon 秒内最多能放行多少次（现有令牌 + 期间补充的令牌），用于决定本轮进几个详情页"""
+        now = time.time() if now is None else now
+        self._refill(now)
+        usable = max(0.0, horizon - self.paused_for(now))
+        return int(self.tokens + usable * self.rate / 60)
+
+    async def acquire(self) -> None:
+        """取一个令牌；桶空或暂停中时等待（按到达顺序排队）"""
+        async with self._lock:
+            while True:
+                now = time.time()
+                self._refill(now)
+                wait = self.paused_for(now)
+                if not wait and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                if not wait:
+                    wait = (1 - self.tokens) * 60 / self.rate
+                await asyncio.sleep(wait)
+
+    def penalize(self, reason: str, now: Optional[float] = None) -> bool:
+        """收到限流信号：速率乘以 RATE_BACKOFF、清空令牌并暂停；冷却期内的重复信号只记录不再降速"""
+        now = time.time() if now is None else now
+        if now - self.last_penalty_at < PENALTY_COOLDOWN:
+            return False
+        old = self.rate
+        self.rate = max(RATE_MIN, self.rate * RATE_BACKOFF)
+        self.tokens = 0.0
+        self.paused_until = now + RATE_PAUSE
+        self.last_penalty_at = now
+        self._updated_at = now
+        print(f"[WARN] 检测到限流（{reason}），速率 {old:.1f} → {self.rate:.1f} 次/分钟，暂停 {RATE_PAUSE}s")
+        return True
+
+    def reward(self, run_started: float) -> bool:
+        """一轮运行期间没有任何限流信号时加性提速；返回是否提速"""
+        if self.last_penalty_at >= run_started or self.rate >= RATE_MAX:
+            return False
+        old = self.rate
+        self.rate = min(RATE_MAX, self.rate + RATE_STEP)
+        print(f"[INFO] 本轮未遇到限流，速率 {old:.1f} → {self.rate:.1f} 次/分钟")
+        return True
+
+    def watch(self, page: Any) -> Any:
+        """监听页面响应，页面或接口返回 429 时立即降速；返回监听函数，用于 page.remove_listener"""
+        def on_response(response: Any) -> None:
+            if is_rate_limited(response):
+                self.penalize(f"HTTP 429 {response.url.split('?')[0]}")
+
+        page.on("response", on_response)
+        return on_response
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, name: str = "x") -> "AdaptiveRateLimiter":
+        row = conn.execute(
+            "SELECT rate, tokens, paused_until, last_penalty_at, updated_at FROM rate_limits WHERE name = ?",
+            (name,),
+        ).fetchone()
+        if not row:
+            return cls(name)
+        return cls(name, rate=row[0], tokens=row[1], paused_until=row[2], last_penalty_at=row[3], updated_at=row[4])
+
+    def save(self, conn: sqlite3.Connection) -> None:
+        self._refill()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO rate_limits (name, rate, tokens, paused_until, last_penalty_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    rate=excluded.rate,
+                    tokens=excluded.tokens,
+                    paused_until=excluded.paused_until,
+                    last_penalty_at=excluded.last_penalty_at,
+                    updated_at=excluded.updated_at;
+                """,
+                (self.name, self.rate, self.tokens, self.paused_until, self.last_penalty_at, self._updated_at),
+            )
@@ -7,17 +7,23 @@ Twitter Screenshot Processor
 
 from __future__ import annotations
 
+import asyncio
 import json
 import os
 import re
 import sqlite3
+import sys
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import alibabacloud_oss_v2 as oss
 import requests
 from alibabacloud_oss_v2.models import PutObjectRequest
-from openai import OpenAI
+
+# 以脚本方式运行（python src/twitter/processor.py）时也能导入项目内模块
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.common import ai, ai_ledger
 
 # ==================== 配置加载 ====================
 def load_secrets():
@@ -46,9 +52,7 @@ FEISHU_WEBHOOK = os.getenv("TWITTER_FEISHU_WEBHOOK") or SECRETS.get("feishu", {}
 
 # AI配置（优先从环境变量，其次从 secrets.json）
 AI_API_KEY = os.getenv("QIANWEN_API_KEY") or SECRETS.get("qianwen", {}).get("api_key", "")
-AI_BASE_URL = os.getenv("QIANWEN_BASE_URL") or SECRETS.get("qianwen", {}).get("base_url", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-AI_MODEL = os.getenv("QIANWEN_MODEL") or SECRETS.get("qianwen", {}).get("model", "qwen-vl-plus")
-AI_TIMEOUT = int(os.getenv("QIANWEN_TIMEOUT", "120"))  # AI调用超时时间（秒）
+# 模型、超时、并发和重试配置见 src/common/ai.py（QIANWEN_*）
 
 AI_PROMPT = """
 你是一名事件驱动型投资信号分析器。
@@ -207,66 +211,12 @@ def upload_to_oss(file_path: str) -> Optional[str]:
 
 
 # ==================== AI分析 ====================
-def analyze_screenshot(oss_url: str, retry_count: int = 3) -> Dict[str, Any]:
-    """使用通义千问视觉模型分析截图"""
-    last_error = None
-    
-    for attempt in range(retry_count):
-        try:
-            if attempt > 0:
-                print(f"[INFO] AI调用重试 {attempt}/{retry_count-1}...")
-            
-            client = OpenAI(
-                api_key=AI_API_KEY,
-                base_url=AI_BASE_URL,
-                timeout=AI_TIMEOUT,
-            )
-
-            completion = client.chat.completions.create(
-                model=AI_MODEL,
-                messages=[
-                    {"role": "system", "content": AI_PROMPT.strip()},
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": oss_url}
-                            },
-                        ]
-                    }
-                ]
-            )
-
-            # 获取完整响应
-            result = completion.model_dump()
-            
-            # 提取AI返回的文本内容
-            ai_text = ""
-            if result.get("choices") and len(result["choices"]) > 0:
-                message = result["choices"][0].get("message", {})
-                ai_text = message.get("content", "")
-
-            return {
-                "success": True,
-                "ai_text": ai_text,
-                "full_response": json.dumps(result, ensure_ascii=False)
-            }
-
-        except Exception as exc:
-            last_error = exc
-            print(f"[WARN] AI分析失败（尝试 {attempt + 1}/{retry_count}）: {exc}")
-            if attempt < retry_count - 1:
-                import time
-                time.sleep(2)  # 等待2秒后重试
-    
-    # 所有重试都失败
-    print(f"[ERROR] AI分析最终失败: {last_error}")
-    return {
-        "success": False,
-        "ai_text": "",
-        "full_response": str(last_error)
-    }
+async def analyze_screenshot(oss_url: str, content: Optional[bytes] = None) -> Dict[str, Any]:
+    """
+    使用通义千问视觉模型分析截图（共享异步客户端，并发、重试和响应缓存由 src/common/ai.py 控制）
+    重扫截图目录属于补处理，按低优先级调用：当天 token 预算接近上限时推迟到下一次运行
+    """
+    return await ai.analyze_image(oss_url, AI_PROMPT, content=content, priority=ai_ledger.PRIORITY_LOW)
 
 
 def extract_summary(ai_text: str) -> str:
@@ -313,11 +263,11 @@ def send_to_feishu(title: str, image_url: str, text: str) -> bool:
 
 
 # ==================== 主处理流程 ====================
-def process_screenshot(screenshot_path: Path, conn: sqlite3.Connection) -> bool:
-    """处理单个截图：上传、分析、存储、通知"""
+async def process_screenshot(screenshot_path: Path, conn: sqlite3.Connection) -> bool:
+    """处理单个截图：上传、分析、存储、通知（上传和通知在线程中执行，数据库只在事件循环线程中读写）"""
     import datetime as dt
 
-    # 从文件名提取tweet_id（假设文件名是 {tweet_id}.jpg）
+    # 从文件名提取tweet_id（假设文件名是 {tweet_id}.jpg / {tweet_id}.webp）
     tweet_id = screenshot_path.stem
     
     print(f"\n[INFO] ========== 处理截图: {tweet_id} ==========")
@@ -329,7 +279,7 @@ def process_screenshot(screenshot_path: Path, conn: sqlite3.Connection) -> bool:
 
     # 1. 上传到OSS
     print(f"[INFO] 上传截图到OSS...")
-    oss_url = upload_to_oss(str(screenshot_path))
+    oss_url = await asyncio.to_thread(upload_to_oss, str(screenshot_path))
     if not oss_url:
         print(f"[ERROR] OSS上传失败，跳过该推文")
         return False
@@ -338,8 +288,11 @@ def process_screenshot(screenshot_path: Path, conn: sqlite3.Connection) -> bool:
 
     # 2. AI分析
     print(f"[INFO] 调用AI分析...")
-    ai_result = analyze_screenshot(oss_url)
+    ai_result = await analyze_screenshot(oss_url, screenshot_path.read_bytes())
     
+    if ai_result.get("deferred"):
+        print(f"[WARN] 今日 token 预算不足，推迟分析（下次运行时补上）")
+        return False
     if not ai_result["success"]:
         print(f"[ERROR] AI分析失败，跳过该推文")
         return False
@@ -363,7 +316,8 @@ def process_screenshot(screenshot_path: Path, conn: sqlite3.Connection) -> bool:
 
     # 5. 发送飞书通知
     print(f"[INFO] 发送飞书通知...")
-    send_to_feishu(
+    await asyncio.to_thread(
+        send_to_feishu,
         title=summary,
         image_url=oss_url,
         text=ai_text
@@ -372,6 +326,17 @@ def process_screenshot(screenshot_path: Path, conn: sqlite3.Connection) -> bool:
     return True
 
 
+async def process_all(screenshots: List[Path], conn: sqlite3.Connection) -> List[bool]:
+    """同时处理的截图数不超过 AI 并发上限；拿到名额后才上传、读取截图，积压很多时内存占用不随截图数增长"""
+    slots = asyncio.Semaphore(max(1, ai.CONCURRENCY))
+
+    async def process(screenshot: Path) -> bool:
+        async with slots:
+            return await process_screenshot(screenshot, conn)
+
+    return await asyncio.gather(*(process(screenshot) for screenshot in screenshots))
+
+
 def validate_config() -> bool:
     """验证配置是否完整"""
     # 检查OSS配置
@@ -410,16 +375,17 @@ def main():
         conn = ensure_db()
 
         # 获取所有截图文件
-        screenshots = list(SCREENSHOT_DIR.glob("*.jpg")) + list(SCREENSHOT_DIR.glob("*.png"))
+        screenshots = (
+            list(SCREENSHOT_DIR.glob("*.jpg")) + list(SCREENSHOT_DIR.glob("*.png")) + list(SCREENSHOT_DIR.glob("*.webp"))
+        )
         print(f"[INFO] 找到 {len(screenshots)} 个截图文件")
 
-        # 处理每个截图
-        processed_count = 0
-        for screenshot in screenshots:
-            if process_screenshot(screenshot, conn):
-                processed_count += 1
+        # 所有截图同时处理，模型请求的并发和 QPS 由共享客户端限制
+        results = asyncio.run(process_all(screenshots, conn))
+        processed_count = sum(results)
 
         print(f"\n[INFO] 处理完成！共处理 {processed_count} 个新截图")
+        ai.report()
     
     except KeyboardInterrupt:
         print(f"\n[INFO] 用户中断，正在退出...")
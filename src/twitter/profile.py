@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+持久化浏览器配置目录（可选，TWITTER_USER_DATA_DIR）
+每次都用全新配置启动 Chromium 时，X 几 MB 的 JS bundle、字体和图标每轮都要重新下载、编译；
+复用同一个配置目录后，重复加载走磁盘 HTTP 缓存和 V8 代码缓存
+- 启动前检查目录大小，超过上限时按顺序清理缓存目录（登录态和 localStorage 不动）
+- 每次启动后的第一次页面加载记录耗时和缓存命中，对比冷启动（首次）和热启动
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page
+
+# ==================== 配置 ====================
+USER_DATA_DIR = os.getenv("TWITTER_USER_DATA_DIR", "")  # 为空时不启用（每次全新配置）
+PROFILE_MAX_MB = int(os.getenv("TWITTER_PROFILE_MAX_MB", "512"))  # 配置目录大小上限
+DISK_CACHE_MB = int(os.getenv("TWITTER_DISK_CACHE_MB", "256"))  # Chromium HTTP 缓存上限（--disk-cache-size）
+PRUNE_INTERVAL_HOURS = float(os.getenv("TWITTER_PROFILE_PRUNE_HOURS", "24"))  # 常驻模式下多久重启一次以清理缓存
+
+# 按清理顺序排列：越靠前越不影响下一次加载速度
+CACHE_DIRS = [
+    "Default/Service Worker/CacheStorage",
+    "GrShaderCache",
+    "ShaderCache",
+    "Default/GPUCache",
+    "Default/Cache",
+    "Default/Code Cache",
+]
+
+STATS_FILE = "spider_load_stats.json"
+
+# 导航计时 + 资源缓存命中（跨域资源没有 Timing-Allow-Origin 时大小为 0，不计入统计）
+LOAD_TIMING_JS = r"""
+() => {
+    const nav = performance.getEntriesByType('navigation')[0];
+    const measurable = performance.getEntriesByType('resource').filter((r) => r.decodedBodySize > 0);
+    const sum = (list, key) => list.reduce((n, r) => n + (r[key] || 0), 0);
+    return {
+        dom_content_loaded_ms: nav ? Math.round(nav.domContentLoadedEventEnd) : null,
+        resources: measurable.length,
+        cached: measurable.filter((r) => r.transferSize === 0).length,
+        transfer_bytes: sum(measurable, 'transferSize'),
+        decoded_bytes: sum(measurable, 'decodedBodySize'),
+    };
+}
+"""
+
+
+def dir_size(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += (Path(root) / name).stat().st_size
+            except OSError:
+                pass
+    return total
+
+
+def prune_profile(user_data_dir: Path, max_bytes: int) -> int:
+    """配置目录超过上限时依次删除缓存目录，直到低于上限；返回释放的字节数（必须在浏览器关闭时调用）"""
+    size = dir_size(user_data_dir)
+    if size <= max_bytes:
+        return 0
+    freed = 0
+    for relative in CACHE_DIRS:
+        cache = user_data_dir / relative
+        if not cache.exists():
+            continue
+        cache_size = dir_size(cache)
+        shutil.rmtree(cache, ignore_errors=True)
+        freed += cache_size
+        if size - freed <= max_bytes:
+            break
+    print(f"[INFO] 浏览器配置目录 {size / 1024 / 1024:.0f} MB 超过上限，已清理缓存 {freed / 1024 / 1024:.0f} MB")
+    return freed
+
+
+def is_cold(user_data_dir: Path) -> bool:
+    """配置目录里还没有 HTTP 缓存和代码缓存（首次启动或刚被清理）"""
+    return not (user_data_dir / "Default" / "Cache").exists() and not (user_data_dir / "Default" / "Code Cache").exists()
+
+
+async def measure_load(page: "Page") -> Dict[str, Any]:
+    return await page.evaluate(LOAD_TIMING_JS)
+
+
+def record_load(user_data_dir: Path, cold: bool, first_tweet_ms: int, timing: Dict[str, Any]) -> None:
+    """记录并输出本次加载；冷启动记为 first_load，热启动记为 warm_load，两者都有时输出对比"""
+    stats_path = user_data_dir / STATS_FILE
+    try:
+        stats = json.loads(stats_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        stats = {}
+
+    entry = {"first_tweet_ms": first_tweet_ms, **timing, "at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    kind = "first_load" if cold else "warm_load"
+    stats[kind] = entry
+    stats_path.write_text(json.dumps(stats, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(
+        f"[INFO] 页面加载（{'冷启动' if cold else '热启动'}）：首条推文 {first_tweet_ms}ms，"
+        f"DOMContentLoaded {timing.get('dom_content_loaded_ms')}ms，"
+        f"缓存命中 {timing.get('cached', 0)}/{timing.get('resources', 0)}，"
+        f"下载 {timing.get('transfer_bytes', 0) / 1024 / 1024:.1f} MB / 资源 {timing.get('decoded_bytes', 0) / 1024 / 1024:.1f} MB"
+    )
+    first: Optional[Dict[str, Any]] = stats.get("first_load")
+    warm: Optional[Dict[str, Any]] = stats.get("warm_load")
+    if first and warm:
+        print(
+            f"[INFO] 冷/热启动对比：首条推文 {first['first_tweet_ms']}ms → {warm['first_tweet_ms']}ms，"
+            f"下载 {first.get('transfer_bytes', 0) / 1024 / 1024:.1f} MB → {warm.get('transfer_bytes', 0) / 1024 / 1024:.1f} MB"
+        )
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+浏览器请求拦截策略：按阶段屏蔽不需要的资源，节省小 VPS 上的带宽和渲染时间
+- timeline（滚动收集阶段）：屏蔽图片、视频、字体和埋点上报
+- screenshot（详情截图阶段）：放行图片和字体，屏蔽视频和埋点上报
+GraphQL 等 XHR/fetch 请求始终放行（graphql 收集模式依赖它们）
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    from playwright.async_api import BrowserContext, Page, Request, Response, Route
+
+TIMELINE = "timeline"
+SCREENSHOT = "screenshot"
+
+# 各阶段按资源类型屏蔽
+PHASE_BLOCKED_TYPES = {
+    TIMELINE: {"image", "media", "font"},
+    SCREENSHOT: {"media"},
+}
+
+# 埋点、广告、统计上报（任何阶段都屏蔽）
+TELEMETRY_RE = re.compile(
+    r"/1\.1/jot/"                                   # client_event / error 上报
+    r"|/i/api/1\.1/keyword/|/i/api/2/badge_count"
+    r"|google-analytics\.com|googletagmanager\.com"
+    r"|analytics\.(?:x|twitter)\.com|ads-api\.(?:x|twitter)\.com"
+    r"|ads-twitter\.com|ads-twimg\.com|static\.ads-twitter\.com"
+    r"|/i/adsct|sentry\.io"
+)
+
+# 视频分片（封面图 amplify_video_thumb 属于 pbs.twimg.com 的图片，不在此列）
+VIDEO_RE = re.compile(r"video\.twimg\.com|\.m3u8(?:\?|$)|\.m4s(?:\?|$)|\.mp4(?:\?|$)")
+
+# 屏蔽请求的体积估算（字节）；运行中会用实际放行的同类响应大小修正
+DEFAULT_SIZE_ESTIMATE = {
+    "image": 40_000,
+    "media": 600_000,
+    "font": 35_000,
+    "telemetry": 1_500,
+}
+
+
+def block_reason(phase: str, resource_type: str, url: str) -> Optional[str]:
+    """判断请求是否应被屏蔽，返回屏蔽原因（用于统计），放行返回 None"""
+    if resource_type == "document":
+        return None
+    if TELEMETRY_RE.search(url):
+        return "telemetry"
+    if resource_type in ("xhr", "fetch", "script", "stylesheet"):
+        return None
+    if VIDEO_RE.search(url):
+        return "media"
+    if resource_type in PHASE_BLOCKED_TYPES.get(phase, set()):
+        return resource_type
+    return None
+
+
+class RequestPolicy:
+    """挂在 BrowserContext 上的拦截器，页面可单独指定阶段，并统计屏蔽数量和节省的流量"""
+
+    def __init__(self, default_phase: str = TIMELINE):
+        self.default_phase = default_phase
+        self._page_phases: Dict["Page", str] = {}
+        self.blocked: Counter = Counter()
+        self._observed_bytes: Counter = Counter()
+        self._observed_count: Counter = Counter()
+
+    async def install(self, context: "BrowserContext") -> None:
+        await context.route("**/*", self._handle)
+        context.on("response", self._observe)
+
+    def set_phase(self, page: "Page", phase: str) -> None:
+        if page not in self._page_phases:
+            page.on("close", lambda _: self._page_phases.pop(page, None))
+        self._page_phases[page] = phase
+
+    def _phase_of(self, request: "Request") -> str:
+        try:
+            return self._page_phases.get(request.frame.page, self.default_phase)
+        except Exception:
+            # Service Worker 等没有所属页面的请求
+            return self.default_phase
+
+    async def _handle(self, route: "Route") -> None:
+        request = route.request
+        reason = block_reason(self._phase_of(request), request.resource_type, request.url)
+        if reason:
+            self.blocked[reason] += 1
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    def _observe(self, response: "Response") -> None:
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            kind = response.request.resource_type
+            self._observed_bytes[kind] += int(length)
+            self._observed_count[kind] += 1
+
+    def _size_estimate(self, reason: str) -> int:
+        if self._observed_count[reason]:
+            return self._observed_bytes[reason] // self._observed_count[reason]
+        return DEFAULT_SIZE_ESTIMATE.get(reason, 0)
+
+    def report(self) -> Dict[str, Any]:
+        """本轮屏蔽的请求数（按原因）和估算节省的字节数"""
+        saved = sum(count * self._size_estimate(reason) for reason, count in self.blocked.items())
+        return {"blocked": dict(self.blocked), "blocked_total": sum(self.blocked.values()), "bytes_saved": saved}
+
+    def reset_stats(self) -> None:
+        self.blocked.clear()
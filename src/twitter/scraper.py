@@ -13,17 +13,38 @@ import datetime as dt
 import json
 import os
 import random
-import re
 import sqlite3
+import sys
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Set
-
-from playwright.async_api import async_playwright, Page, Browser
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from playwright.async_api import async_playwright, Page
+
+# 以脚本方式运行（python src/twitter/scraper.py）时也能导入项目内模块
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.twitter import detail, imaging, profile
+from src.twitter import twitter_pipeline as pipeline
+from src.twitter.auth import SessionExpiredError, discard_storage_state, ensure_logged_in
+from src.twitter.browser import BrowserSession
+from src.twitter.pacing import AdaptiveRateLimiter, PacingPolicy, ensure_rate_limit_table, parse_jitter
+from src.twitter.request_policy import SCREENSHOT, TIMELINE
+from src.twitter.timeline import (
+    collect_tweet_links,
+    ensure_watermark_table,
+    get_watermark,
+    next_watermark,
+    profile_url,
+    scroll_until_watermark,
+    update_watermark,
+)
 
 # ==================== 配置 ====================
 TARGET_USER = os.getenv("TWITTER_USER", "elonmusk")
-TARGET_URL = f"https://x.com/{TARGET_USER}"
+TARGET_URL = profile_url(TARGET_USER)
 COOKIE_FILE = Path(os.getenv("TWITTER_COOKIE_FILE", "config/twitter_cookies.json"))
+STORAGE_STATE_FILE = Path(os.getenv("TWITTER_STORAGE_STATE", "data/twitter_state.json"))  # 成功运行后保存的登录态
 DB_PATH = Path(os.getenv("TWITTER_DB_PATH", "data/twitter.db"))
 SCREENSHOT_DIR = Path(os.getenv("TWITTER_SCREENSHOT_DIR", "screenshots"))
 
@@ -33,8 +54,10 @@ TIMEOUT = int(os.getenv("TWITTER_TIMEOUT", "60000"))  # 毫秒
 
 # 滚动配置
 MAX_SCROLLS = int(os.getenv("TWITTER_MAX_SCROLLS", "5"))  # 最多滚动次数（降低风控风险）
+MAX_DEEP_SCROLLS = int(os.getenv("TWITTER_MAX_DEEP_SCROLLS", "15"))  # 一直没到水位线时最多加深到的屏数
 SCROLL_DELAY = int(os.getenv("TWITTER_SCROLL_DELAY", "3000"))  # 每次滚动后等待时间（毫秒）
-MAX_DETAIL_PAGES = int(os.getenv("TWITTER_MAX_DETAIL_PAGES", "10"))  # 最多进入详情页数量（避免触发 Rate Limit）
+MAX_DETAIL_PAGES = int(os.getenv("TWITTER_MAX_DETAIL_PAGES", "0"))  # 额外的固定上限；0 表示只按自适应限速器的预算
+DETAIL_JITTER = parse_jitter(os.getenv("TWITTER_DETAIL_JITTER", "800-1500"))  # 两个详情页之间的随机停顿（毫秒范围）
 
 
 # ==================== 数据库操作 ====================
@@ -66,6 +89,11 @@ def ensure_db() -> sqlite3.Connection:
         conn.execute("ALTER TABLE tweets ADD COLUMN screenshot_path TEXT;")
         print("[INFO] 已添加 screenshot_path 列到数据库")
     
+    # 增量滚动的水位线
+    ensure_watermark_table(conn)
+    # 跨运行共享的自适应限速状态
+    ensure_rate_limit_table(conn)
+    
     conn.commit()
     return conn
 
@@ -104,7 +132,7 @@ def save_tweet(conn: sqlite3.Connection, tweet: Dict[str, Any]) -> bool:
                     tweet.get("link"),
                     tweet.get("screenshot_path"),
                     fetched_at,
-                    json.dumps(tweet, ensure_ascii=False),
+                    json.dumps({k: v for k, v in tweet.items() if k != imaging.IMAGE_KEY}, ensure_ascii=False),
                 ),
             )
         return True
@@ -132,15 +160,14 @@ def load_cookies() -> List[Dict[str, Any]]:
         raise SystemExit(f"Cookie 文件格式错误: {exc}") from exc
 
 
-async def inject_cookies(page: Page, cookies: List[Dict[str, Any]]) -> None:
-    """注入 Cookie 到浏览器上下文"""
-    await page.context.add_cookies(cookies)  # type: ignore
-    print(f"[INFO] 已注入 {len(cookies)} 个 Cookie")
-
-
 # ==================== 页面操作 ====================
 async def wait_for_timeline(page: Page, user: str, timeout: int = 30000) -> None:
-    """等待 Timeline 区域加载完成"""
+    """等待 Timeline 区域加载完成；先快速检查登录态，会话失效时立即失败"""
+    try:
+        await ensure_logged_in(page)
+    except SessionExpiredError:
+        discard_storage_state(STORAGE_STATE_FILE)
+        raise
     timeline_selector = f'div[aria-label*="Timeline"][aria-label*="{user}"]'
     try:
         await page.wait_for_selector(timeline_selector, timeout=timeout, state="visible")
@@ -150,54 +177,6 @@ async def wait_for_timeline(page: Page, user: str, timeout: int = 30000) -> None
         await page.wait_for_selector('[data-testid="cellInnerDiv"]', timeout=10000, state="visible")
 
 
-async def collect_tweet_links(page: Page, user_handle: str) -> List[Dict[str, Any]]:
-    """从列表页收集推文链接和基本信息（不提取文本）"""
-    tweets = []
-    
-    tweet_cells = await page.locator('[data-testid="cellInnerDiv"]').all()
-    print(f"[INFO] 找到 {len(tweet_cells)} 个推文单元格")
-
-    for idx, cell in enumerate(tweet_cells):
-        try:
-            # 提取推文 ID
-            tweet_id = None
-            user_name_locator = cell.locator('[data-testid="User-Name"]')
-            if await user_name_locator.count() > 0:
-                status_link = user_name_locator.locator('a[href*="/status/"]').first
-                if await status_link.count() > 0:
-                    href = await status_link.get_attribute("href")
-                    if href:
-                        match = re.search(r"/status/(\d+)", href)
-                        if match:
-                            tweet_id = match.group(1)
-            
-            if not tweet_id:
-                continue
-
-            # 检查是否是转发
-            is_repost = 0
-            social_context_locator = cell.locator('[data-testid="socialContext"]')
-            if await social_context_locator.count() > 0:
-                social_text = await social_context_locator.inner_text()
-                if "reposted" in social_text.lower():
-                    is_repost = 1
-            
-            # 构建链接
-            link = f"https://x.com/{user_handle}/status/{tweet_id}"
-
-            tweets.append({
-                "id": tweet_id,
-                "user_handle": user_handle,
-                "is_repost": is_repost,
-                "link": link,
-            })
-
-        except Exception as exc:
-            print(f"[WARN] 收集推文 #{idx + 1} 链接时出错: {exc}")
-
-    return tweets
-
-
 async def smooth_scroll(page: Page) -> None:
     """平滑滚动，模拟真人操作"""
     scroll_info = await page.evaluate("""
@@ -231,146 +210,116 @@ async def smooth_scroll(page: Page) -> None:
 
 
 async def fetch_tweet_detail(page: Page, tweet: Dict[str, Any], screenshot_dir: Path) -> Dict[str, Any]:
-    """进入推文详情页，提取文字并截图"""
-    tweet_id = tweet["id"]
-    link = tweet["link"]
-    
-    print(f"[INFO] 进入详情页: {link}")
-    
-    try:
-        # 导航到详情页
-        await page.goto(link, timeout=TIMEOUT)
-        
-        # 等待推文本体加载（article 是推文的精准容器）
-        await page.wait_for_selector('article[data-testid="tweet"]', timeout=15000, state="visible")
-        await page.wait_for_timeout(1500)  # 额外等待渲染完成
-        
-        # 展开长推文（点击 "Show more" 按钮）
-        try:
-            show_more_btn = page.locator('article[data-testid="tweet"] button').filter(has_text="Show more").first
-            if await show_more_btn.count() > 0:
-                await show_more_btn.click()
-                print(f"[INFO] 已点击 Show more 展开长推文")
-                await page.wait_for_timeout(800)
-        except Exception:
-            pass  # 没有 Show more 按钮，忽略
-        
-        # 查看敏感内容（点击 "View" 按钮）
-        try:
-            view_btn = page.locator('article[data-testid="tweet"] button').filter(has_text="View").first
-            if await view_btn.count() > 0:
-                await view_btn.click()
-                print(f"[INFO] 已点击 View 展示敏感内容")
-                await page.wait_for_timeout(800)
-        except Exception:
-            pass  # 没有 View 按钮，忽略
-        
-        # 提取推文文本（只取第一个 tweetText）
-        text = ""
-        text_locator = page.locator('[data-testid="tweetText"]').first
-        if await text_locator.count() > 0:
-            text = await text_locator.inner_text()
-        
-        tweet["text"] = text.strip()
-        
-        # 截图：对推文本体 article 区域截图（避免 cellInnerDiv 的上下留白）
-        article_locator = page.locator('article[data-testid="tweet"]').first
-        if await article_locator.count() > 0:
-            screenshot_path = screenshot_dir / f"{tweet_id}.jpg"
-            await article_locator.screenshot(path=str(screenshot_path), type="jpeg", quality=90)
-            tweet["screenshot_path"] = str(screenshot_path)
-            print(f"[INFO] 已保存截图: {screenshot_path}")
-        else:
-            print(f"[WARN] 未找到推文区域，跳过截图")
-            tweet["screenshot_path"] = None
-        
-        # 随机等待，模拟真人浏览
-        await page.wait_for_timeout(random.randint(800, 1500))
-        
-    except Exception as exc:
-        print(f"[WARN] 获取推文详情失败 {tweet_id}: {exc}")
-        tweet["text"] = ""
-        tweet["screenshot_path"] = None
-    
-    return tweet
+    """进入推文详情页，提取文字并截图（等待逻辑见 detail.py）"""
+    return await detail.fetch_tweet_detail(page, tweet, screenshot_dir, TIMEOUT)
 
 
 # ==================== 主流程 ====================
-async def scrape_user_tweets(user_handle: str) -> List[Dict[str, Any]]:
-    """抓取指定用户的推文（新方案：进入详情页获取文字和截图）"""
-    cookies = load_cookies()
-    all_tweet_links: Dict[str, Dict[str, Any]] = {}  # 去重
-
+async def scrape_user_tweets(
+    user_handle: str, watermark: Optional[str] = None, limiter: Optional[AdaptiveRateLimiter] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    抓取指定用户的推文（新方案：进入详情页获取文字和截图）
+    滚动到水位线即停止；返回 (推文列表, 新水位线)
+    主页加载、滚动和详情页导航都从 limiter 取令牌，遇到限流信号时降速
+    """
+    limiter = limiter or AdaptiveRateLimiter()
+    run_started = time.time()
     # 确保截图目录存在
     SCREENSHOT_DIR.mkdir(parents=True, exist_ok=True)
     print(f"[INFO] 截图保存目录: {SCREENSHOT_DIR}")
 
     async with async_playwright() as p:
-        browser: Browser = await p.chromium.launch(headless=HEADLESS)
-        context = await browser.new_context(
-            viewport={"width": 1920, "height": 1080},
-            user_agent=(
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
+        # 优先复用上次保存的登录态，否则注入 Cookie 文件
+        session = BrowserSession(
+            p,
+            load_cookies,
+            headless=HEADLESS,
+            policy=pipeline.build_request_policy(),
+            storage_state=STORAGE_STATE_FILE,
+            cookie_file=COOKIE_FILE,
+            user_data_dir=Path(profile.USER_DATA_DIR) if profile.USER_DATA_DIR else None,
         )
+        page = await session.start()
+        limiter.watch(page)
+        # 同一个页面先滚动时间线、再进详情页截图，按阶段切换拦截规则
+        if session.policy:
+            session.policy.set_phase(page, TIMELINE)
 
-        page = await context.new_page()
-
-        # 先注入 Cookie（必须在 goto 之前，避免以游客身份加载触发限制）
-        await inject_cookies(page, cookies)
+        async def scroll() -> None:
+            await limiter.acquire()
+            await smooth_scroll(page)
 
         # ========== 阶段1：收集推文链接 ==========
         print(f"\n[INFO] ========== 阶段1：收集推文链接 ==========")
-        print(f"[INFO] 导航到用户页面: {TARGET_URL}")
-        await page.goto(TARGET_URL, timeout=TIMEOUT)
-        await wait_for_timeline(page, user_handle, timeout=30000)
-
-        # 滚动收集链接
-        for scroll_num in range(MAX_SCROLLS):
-            print(f"\n[INFO] === 第 {scroll_num + 1}/{MAX_SCROLLS} 次滚动 ===")
-            
-            current_links = await collect_tweet_links(page, user_handle)
-            
-            new_count = 0
-            for t in current_links:
-                if t["id"] not in all_tweet_links:
-                    all_tweet_links[t["id"]] = t
-                    new_count += 1
-            
-            print(f"[INFO] 本次收集 {len(current_links)} 条，新增 {new_count} 条，总计 {len(all_tweet_links)} 条")
-            
-            if scroll_num < MAX_SCROLLS - 1:
-                await smooth_scroll(page)
+        print(f"[INFO] 导航到用户页面: {profile_url(user_handle)}")
+        await limiter.acquire()
+        load_started = time.monotonic()
+        await page.goto(profile_url(user_handle), timeout=TIMEOUT)
+        try:
+            await wait_for_timeline(page, user_handle, timeout=30000)
+        except SessionExpiredError:
+            raise
+        except SystemExit:
+            limiter.penalize("限流提示页" if await detail.is_rate_limited(page) else "时间线未加载")
+            raise
+        await session.report_load(page, int((time.monotonic() - load_started) * 1000))
+
+        # 滚动收集链接（到达水位线即停止）
+        all_tweet_links = await scroll_until_watermark(
+            harvest=lambda: collect_tweet_links(page, user_handle),
+            scroll=scroll,
+            watermark=watermark,
+            max_scrolls=MAX_SCROLLS,
+            max_deep_scrolls=MAX_DEEP_SCROLLS,
+        )
 
         print(f"\n[INFO] 链接收集完成，共 {len(all_tweet_links)} 条推文")
+        if not all_tweet_links:
+            limiter.penalize("时间线为空")
+        await session.save_state()
 
         # ========== 阶段2：逐个进入详情页获取文字和截图 ==========
         print(f"\n[INFO] ========== 阶段2：获取详情和截图 ==========")
         
         all_tweets = []
         tweet_list = list(all_tweet_links.values())
+        seen_watermark = next_watermark(tweet_list, watermark)
         
-        # 限制最多进入的详情页数量（避免触发 Rate Limit）
-        if len(tweet_list) > MAX_DETAIL_PAGES:
-            print(f"[INFO] 收集到 {len(tweet_list)} 条，限制只处理前 {MAX_DETAIL_PAGES} 条")
-            tweet_list = tweet_list[:MAX_DETAIL_PAGES]
+        # 本轮进入的详情页数量由限速器的令牌预算决定（避免触发 Rate Limit）
+        budget = limiter.budget()
+        if MAX_DETAIL_PAGES > 0:
+            budget = min(budget, MAX_DETAIL_PAGES)
+        if len(tweet_list) > budget:
+            print(f"[INFO] 收集到 {len(tweet_list)} 条，限速预算只够前 {budget} 条（{limiter.rate:.1f} 次/分钟）")
+            tweet_list = tweet_list[:budget]
+            # 有推文被丢弃时水位线不前进，下一轮仍会滚到这里重新发现它们
+            seen_watermark = watermark
         
+        if session.policy:
+            session.policy.set_phase(page, SCREENSHOT)
+        pacing = PacingPolicy(jitter=DETAIL_JITTER, bucket=limiter)
         for idx, tweet in enumerate(tweet_list):
             print(f"\n[INFO] === 处理 {idx + 1}/{len(tweet_list)} ===")
             
+            # 模拟真人浏览的随机停顿（第一条不停顿）
+            await pacing.wait()
+            
             # 进入详情页获取文字和截图
             detailed_tweet = await fetch_tweet_detail(page, tweet, SCREENSHOT_DIR)
             all_tweets.append(detailed_tweet)
+            if not detailed_tweet.get("screenshot_path") and await detail.is_rate_limited(page):
+                limiter.penalize("详情页限流提示")
             
             # 每处理5条输出进度
             if (idx + 1) % 5 == 0:
                 print(f"[INFO] 进度: {idx + 1}/{len(tweet_list)} ({(idx+1)*100//len(tweet_list)}%)")
 
-        await browser.close()
+        pipeline.report_request_policy(session)
+        await session.close()
 
-    return all_tweets
+    limiter.reward(run_started)
+    return all_tweets, seen_watermark
 
 
 async def main() -> None:
@@ -383,9 +332,19 @@ async def main() -> None:
 
     conn = ensure_db()
     known_ids = known_tweet_ids(conn, TARGET_USER)
-    print(f"[INFO] 数据库中已有 {len(known_ids)} 条推文（最近300条）")
-
-    tweets = await scrape_user_tweets(TARGET_USER)
+    watermark = get_watermark(conn, TARGET_USER)
+    print(f"[INFO] 数据库中已有 {len(known_ids)} 条推文（最近300条），水位线: {watermark or '无'}")
+
+    limiter = AdaptiveRateLimiter.load(conn)
+    if limiter.paused_for() > 0:
+        print(f"[WARN] 限速器暂停中（还剩 {limiter.paused_for():.0f}s），跳过本次运行")
+        conn.close()
+        return
+    try:
+        tweets, seen_watermark = await scrape_user_tweets(TARGET_USER, watermark, limiter)
+    finally:
+        # 失败的运行也要保存，降速和暂停对下一次运行同样有效
+        limiter.save(conn)
     print(f"\n[INFO] 本次抓取到 {len(tweets)} 条推文")
 
     # 过滤出新推文
@@ -400,7 +359,13 @@ async def main() -> None:
     
     print(f"[INFO] 已保存 {saved_count} 条推文到数据库")
 
+    # 推文全部落库后才推进水位线
+    if saved_count == len(tweets):
+        update_watermark(conn, TARGET_USER, seen_watermark)
+
     conn.close()
+    await imaging.flush()
+    imaging.shutdown()
     print(f"[INFO] 完成！数据库: {DB_PATH}，截图目录: {SCREENSHOT_DIR}")
 
 
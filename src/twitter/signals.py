@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+交易信号的结构化解析：模型以 JSON 模式输出，这里按字段类型校验，
+替代从自由文本里贪婪匹配 {...} 再逐字段猜测
+流式输出时 StreamingSignalParser 在 summary 和 direction 写完后立即取出，用于提前发送初步通知
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+SIGNAL_TYPES = {
+    "A": "📊 行动/公司行为",
+    "B": "🏛️ 政策立场",
+    "C": "🚀 技术突破/产品发布",
+    "D": "💬 情绪/口水战",
+    "E": "🎮 纯娱乐",
+}
+DIRECTIONS = {"long": "Long", "short": "Short", "neutral": "Neutral"}
+MARKETS = ("US", "CN")
+
+
+class SignalError(ValueError):
+    """模型输出不符合信号格式"""
+
+
+def normalize_direction(value: Any) -> str:
+    direction = DIRECTIONS.get(str(value).strip().lower())
+    if direction is None:
+        raise SignalError(f"direction 无效: {value!r}")
+    return direction
+
+
+def _assets(value: Any) -> Dict[str, List[str]]:
+    if value is None:
+        value = {}
+    if not isinstance(value, dict):
+        raise SignalError(f"assets 必须是对象: {value!r}")
+    assets = {}
+    for market in MARKETS:
+        items = value.get(market) or []
+        if isinstance(items, str):
+            items = [items]
+        if not isinstance(items, list):
+            raise SignalError(f"assets.{market} 必须是列表: {items!r}")
+        assets[market] = [str(item).strip() for item in items if str(item).strip()]
+    return assets
+
+
+class TradingSignal:
+    """一条交易信号（字段与提示词中的输出格式一致）"""
+
+    def __init__(
+        self,
+        summary: str,
+        signal_type: str,
+        direction: str,
+        assets: Dict[str, List[str]],
+        confidence: int,
+        expiry: str,
+        risk: str = "",
+    ):
+        self.summary = summary
+        self.signal_type = signal_type
+        self.direction = direction
+        self.assets = assets
+        self.confidence = confidence
+        self.expiry = expiry
+        self.risk = risk
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "TradingSignal":
+        if not isinstance(data, dict):
+            raise SignalError("信号必须是 JSON 对象")
+        signal_type = str(data.get("signal_type", "")).strip().upper()[:1]
+        if signal_type not in SIGNAL_TYPES:
+            raise SignalError(f"signal_type 无效: {data.get('signal_type')!r}")
+        try:
+            confidence = int(float(data.get("confidence")))
+        except (TypeError, ValueError):
+            raise SignalError(f"confidence 无效: {data.get('confidence')!r}") from None
+        return cls(
+            summary=str(data.get("summary") or "").strip(),
+            signal_type=signal_type,
+            direction=normalize_direction(data.get("direction")),
+            assets=_assets(data.get("assets")),
+            confidence=max(0, min(10, confidence)),
+            expiry=str(data.get("expiry") or "未知").strip(),
+            risk=str(data.get("risk") or "").strip(),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "summary": self.summary,
+            "signal_type": self.signal_type,
+            "direction": self.direction,
+            "assets": self.assets,
+            "confidence": self.confidence,
+            "expiry": self.expiry,
+        }
+        if self.risk:
+            data["risk"] = self.risk
+        return data
+
+
+def extract_json(text: str) -> Dict[str, Any]:
+    """JSON 模式下整段就是对象；兼容 ```json 代码块和前后多余文字（从第一个 { 起解析一个完整对象）"""
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    start = text.find("{")
+    if start < 0:
+        raise SignalError("没有 JSON 对象")
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text[start:])
+    except ValueError as exc:
+        raise SignalError(f"JSON 解析失败: {exc}") from None
+    return data
+
+
+def parse_signal(text: str) -> Optional[TradingSignal]:
+    """解析并校验模型输出；不符合格式时返回 None"""
+    if not text:
+        return None
+    try:
+        return TradingSignal.from_dict(extract_json(text))
+    except SignalError:
+        return None
+
+
+class StreamingSignalParser:
+    """喂入流式输出的累计文本，字符串字段的值写完（出现闭合引号）后即可取出"""
+
+    EARLY_FIELDS = ("summary", "direction")
+
+    def __init__(self):
+        self.fields: Dict[str, str] = {}
+        self._patterns = {
+            name: re.compile(r'"%s"\s*:\s*"((?:[^"\\]|\\.)*)"' % name) for name in self.EARLY_FIELDS
+        }
+
+    def feed(self, text: str) -> Dict[str, str]:
+        for name, pattern in self._patterns.items():
+            if name in self.fields:
+                continue
+            match = pattern.search(text)
+            if not match:
+                continue
+            try:
+                value = json.loads(f'"{match.group(1)}"')
+                if name == "direction":
+                    value = normalize_direction(value)
+            except ValueError:
+                continue
+            self.fields[name] = value.strip()
+        return self.fields
+
+    @property
+    def ready(self) -> bool:
+        return all(name in self.fields for name in self.EARLY_FIELDS)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段流水线：每个阶段一个有界 asyncio.Queue + 固定数量的 worker
+一条推文截图完成后立即进入 上传 → AI 分析 → 通知，不等同一轮的其他推文；
+下游阶段处理不过来时队列写满，submit 阻塞，上游自然放慢（背压）
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+# 阶段处理函数：返回交给下一阶段的对象，返回 None 表示到此为止
+Handler = Callable[[Any], Awaitable[Optional[Any]]]
+
+
+class StagedPipeline:
+    """stages 为 [(名称, 处理函数, 并发数)]，按顺序串联"""
+
+    def __init__(
+        self,
+        stages: List[Tuple[str, Handler, int]],
+        queue_size: int = 4,
+        on_done: Optional[Callable[[Any], None]] = None,
+    ):
+        self.stages = stages
+        self.queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self.on_done = on_done
+        self.failed = 0
+        self._workers: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        for index, (name, handler, concurrency) in enumerate(self.stages):
+            for _ in range(max(1, concurrency)):
+                self._workers.append(asyncio.create_task(self._work(index, name, handler)))
+
+    async def submit(self, item: Any) -> None:
+        """放入第一个阶段；队列已满时等待"""
+        await self.queues[0].put(item)
+
+    async def _work(self, index: int, name: str, handler: Handler) -> None:
+        queue = self.queues[index]
+        while True:
+            item = await queue.get()
+            try:
+                result = await handler(item)
+                if result is None:
+                    continue
+                if index + 1 < len(self.queues):
+                    await self.queues[index + 1].put(result)
+                elif self.on_done:
+                    self.on_done(result)
+            except Exception as exc:
+                self.failed += 1
+                print(f"[ERROR] 流水线阶段 {name} 处理失败: {exc}")
+            finally:
+                queue.task_done()
+
+    async def join(self) -> None:
+        """等待已提交的所有对象走完全部阶段（前一阶段清空后才可能不再往后一阶段放入）"""
+        for queue in self.queues:
+            await queue.join()
+
+    async def close(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多目标调度：目标账号注册表（用户名、优先级、轮询间隔）+ 公平调度与按账号退避
+守护进程（daemon.py）用同一个浏览器和有限的页面池轮流抓取所有目标，
+内存和 CPU 只随同时打开的页面数增长，不随目标数增长
+
+注册表文件（TWITTER_TARGETS_FILE，默认 config/twitter_targets.json）示例：
+[
+  {"handle": "elonmusk", "priority": 10, "interval": 60},
+  {"handle": "BillGates", "interval": 600},
+  "sama"
+]
+文件不存在时只抓取 TWITTER_USER 一个目标
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+# ==================== 配置 ====================
+TARGETS_FILE = Path(os.getenv("TWITTER_TARGETS_FILE", "config/twitter_targets.json"))
+MAX_BACKOFF = int(os.getenv("TWITTER_TARGET_MAX_BACKOFF", "3600"))  # 单个账号连续失败后的最长退避（秒）
+
+
+class Target:
+    """一个被监控的账号及其调度状态"""
+
+    def __init__(self, handle: str, priority: int = 1, interval: int = 120):
+        self.handle = handle
+        self.priority = max(1, priority)
+        self.interval = max(1, interval)
+        self.next_due = 0.0
+        self.failures = 0
+        self.runs = 0
+        self.running = False
+
+    def __repr__(self) -> str:
+        return f"Target(@{self.handle}, priority={self.priority}, interval={self.interval}s)"
+
+
+def _parse_target(entry: Any, default_interval: int) -> Target:
+    if isinstance(entry, str):
+        entry = {"handle": entry}
+    if not isinstance(entry, dict) or not str(entry.get("handle", "")).strip():
+        raise SystemExit(f"❌ 目标配置格式错误（需要 handle）: {entry}")
+    try:
+        return Target(
+            handle=str(entry["handle"]).strip().lstrip("@"),
+            priority=int(entry.get("priority", 1)),
+            interval=int(entry.get("interval", default_interval)),
+        )
+    except (TypeError, ValueError) as exc:
+        raise SystemExit(f"❌ 目标配置格式错误 {entry}: {exc}")
+
+
+def load_targets(default_handle: str, default_interval: int, path: Path = TARGETS_FILE) -> List[Target]:
+    """读取目标注册表；文件不存在时返回只包含 default_handle 的列表"""
+    if not path.exists():
+        return [Target(default_handle, interval=default_interval)]
+
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise SystemExit(f"❌ 目标配置 {path} 应为非空列表")
+
+    targets = [_parse_target(entry, default_interval) for entry in entries]
+    seen = set()
+    for target in targets:
+        # known_tweet_ids / save_tweet 按 user_handle 精确匹配，同一账号不同大小写会被当成两个目标
+        key = target.handle.lower()
+        if key in seen:
+            raise SystemExit(f"❌ 目标配置中 @{target.handle} 重复")
+        seen.add(key)
+    return targets
+
+
+class TargetScheduler:
+    """
+    选出下一个该抓取的目标：
+    - 只有到期（next_due 已过）且未在抓取中的目标参与调度
+    - 得分 = 优先级 + 逾期时长 / 轮询间隔，低优先级目标等得越久得分越高，不会被饿死
+    - 抓取失败按 interval * 2^失败次数 退避（最长 max_backoff），成功后恢复原间隔
+    """
+
+    def __init__(self, targets: List[Target], max_backoff: int = MAX_BACKOFF):
+        self.targets = targets
+        self.max_backoff = max_backoff
+        # 启动时所有目标立即到期，逾期时长从 0 开始计算，首轮按优先级排序
+        started = time.monotonic()
+        for target in targets:
+            target.next_due = target.next_due or started
+
+    def next_target(self, now: Optional[float] = None) -> Optional[Target]:
+        now = time.monotonic() if now is None else now
+        due = [t for t in self.targets if not t.running and t.next_due <= now]
+        if not due:
+            return None
+        return max(due, key=lambda t: (t.priority + (now - t.next_due) / t.interval, -t.next_due))
+
+    def seconds_until_due(self, now: Optional[float] = None) -> Optional[float]:
+        """距离下一个目标到期的秒数；所有目标都在抓取中时返回 None"""
+        now = time.monotonic() if now is None else now
+        waiting = [t.next_due for t in self.targets if not t.running]
+        if not waiting:
+            return None
+        return max(0.0, min(waiting) - now)
+
+    def start(self, target: Target) -> None:
+        target.running = True
+
+    def finish(self, target: Target, success: bool, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        target.running = False
+        target.runs += 1
+        if success:
+            target.failures = 0
+            target.next_due = now + target.interval
+            return
+        target.failures += 1
+        delay = max(target.interval, min(target.interval * 2 ** target.failures, self.max_backoff))
+        target.next_due = now + delay
+        print(f"[WARN] @{target.handle} 连续失败 {target.failures} 次，{delay}s 后重试")
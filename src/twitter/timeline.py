@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时间线解析与增量滚动（scraper.py 和 twitter_pipeline.py 共用）
+- 一次 page.evaluate 取回当前所有推文单元格的信息，
+  替代逐个单元格 count / get_attribute / inner_text 的多次 CDP 往返
+- 按用户记录水位线（twitter.db: user_watermarks），滚到上次抓取过的位置就停止
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import sqlite3
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from playwright.async_api import Page
+
+# 解析单个 cellInnerDiv，返回 {id, author, is_repost, pinned, has_media, truncated, sensitive, quote}，不是推文时返回 null
+# truncated / sensitive / quote 表示时间线上显示不完整（Show more、敏感内容遮罩、引用卡片），需要进详情页截图
+# socialContext 同时匹配英文和中文界面（Cookie 所属账号的语言设置决定界面语言）
+# 批量解析（EXTRACT_CELLS_JS）和实时监听（watcher.py 的 MutationObserver）共用
+CELL_INFO_JS = r"""
+function spiderCellInfo(cell) {
+    const article = cell.querySelector('article[data-testid="tweet"]');
+    if (!article) return null;
+    const link = article.querySelector('[data-testid="User-Name"] a[href*="/status/"]');
+    const match = link && link.getAttribute('href').match(/^\/([^/]+)\/status\/(\d+)/);
+    if (!match) return null;
+    const social = cell.querySelector('[data-testid="socialContext"]');
+    const socialText = social ? social.innerText.toLowerCase() : '';
+    return {
+        id: match[2],
+        author: match[1],
+        is_repost: socialText.includes('reposted') || socialText.includes('转帖'),
+        pinned: socialText.includes('pinned') || socialText.includes('置顶'),
+        has_media: !!article.querySelector(
+            '[data-testid="tweetPhoto"], [data-testid="videoPlayer"], [data-testid="card.wrapper"]'
+        ),
+        truncated: !!article.querySelector('[data-testid="tweet-text-show-more-link"]'),
+        sensitive: Array.from(article.querySelectorAll('button')).some(
+            (b) => ['view', 'show', '查看', '显示'].includes(b.innerText.trim().toLowerCase())
+        ),
+        quote: article.querySelectorAll('[data-testid="User-Name"]').length > 1,
+    };
+}
+"""
+
+# 在页面内一次遍历所有 cellInnerDiv
+EXTRACT_CELLS_JS = (
+    "() => {\n"
+    + CELL_INFO_JS
+    + "return Array.from(document.querySelectorAll('[data-testid=\"cellInnerDiv\"]'))"
+    ".map(spiderCellInfo).filter(Boolean);\n}"
+)
+
+
+def profile_url(user_handle: str) -> str:
+    """用户主页地址"""
+    return f"https://x.com/{user_handle}"
+
+
+async def extract_cells(page: "Page") -> List[Dict[str, Any]]:
+    """一次 evaluate 取回当前已渲染的所有推文单元格"""
+    return await page.evaluate(EXTRACT_CELLS_JS)
+
+
+async def collect_tweet_links(page: "Page", user_handle: str, own_only: bool = False) -> List[Dict[str, Any]]:
+    """
+    从列表页收集推文链接和基本信息（不提取正文）
+    own_only=True 时只保留目标用户本人发布的推文（转发的原作者不是本人，会被排除）
+    """
+    handle = user_handle.lower()
+    return [
+        cell_to_tweet(cell, user_handle)
+        for cell in await extract_cells(page)
+        if not own_only or cell["author"].lower() == handle
+    ]
+
+
+def cell_to_tweet(cell: Dict[str, Any], user_handle: str) -> Dict[str, Any]:
+    """把 spiderCellInfo 的结果转换成流水线使用的推文字典"""
+    return {
+        "id": cell["id"],
+        "user_handle": user_handle,
+        "is_repost": 1 if cell["is_repost"] else 0,
+        "link": f"https://x.com/{cell['author']}/status/{cell['id']}",
+        "pinned": cell["pinned"],
+        "has_media": cell["has_media"],
+        "truncated": cell["truncated"],
+        "sensitive": cell["sensitive"],
+        "quote": cell["quote"],
+    }
+
+
+# ==================== 水位线（增量滚动） ====================
+def ensure_watermark_table(conn: sqlite3.Connection) -> None:
+    """每个用户一条水位线：已完整抓取到的最新推文 ID（非置顶、非转发）"""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_watermarks (
+            user_handle TEXT PRIMARY KEY,
+            last_tweet_id TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """
+    )
+
+
+def get_watermark(conn: sqlite3.Connection, user_handle: str) -> Optional[str]:
+    """读取水位线；旧数据库没有记录时，用已存储推文中最大的 ID 初始化"""
+    row = conn.execute(
+        "SELECT last_tweet_id FROM user_watermarks WHERE user_handle = ?", (user_handle,)
+    ).fetchone()
+    if row:
+        return row[0]
+    # 推文 ID 是 Snowflake，数值越大越新；按长度+字典序比较等价于数值比较
+    row = conn.execute(
+        "SELECT id FROM tweets WHERE user_handle = ? AND is_repost = 0 ORDER BY length(id) DESC, id DESC LIMIT 1",
+        (user_handle,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def update_watermark(conn: sqlite3.Connection, user_handle: str, tweet_id: Optional[str]) -> None:
+    """只前进不后退"""
+    if not tweet_id:
+        return
+    current = get_watermark(conn, user_handle)
+    if current and int(current) >= int(tweet_id):
+        return
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO user_watermarks (user_handle, last_tweet_id, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(user_handle) DO UPDATE SET
+                last_tweet_id=excluded.last_tweet_id,
+                updated_at=excluded.updated_at;
+            """,
+            (user_handle, tweet_id, dt.datetime.now().isoformat(timespec="seconds")),
+        )
+
+
+def _comparable(tweet: Dict[str, Any]) -> bool:
+    # 置顶推文不按时间排序；转发显示的是原推 ID，可能远早于转发时间
+    return not tweet.get("pinned") and not tweet.get("is_repost") and str(tweet.get("id", "")).isdigit()
+
+
+def reached_watermark(tweets: List[Dict[str, Any]], watermark: Optional[str]) -> bool:
+    """当前屏幕中是否已出现不晚于水位线的推文（即已滚到上次抓取过的位置）"""
+    if not watermark:
+        return False
+    return any(_comparable(t) and int(t["id"]) <= int(watermark) for t in tweets)
+
+
+def next_watermark(tweets: List[Dict[str, Any]], watermark: Optional[str]) -> Optional[str]:
+    """本轮看到的最新推文 ID 与旧水位线中较大者"""
+    ids = [int(t["id"]) for t in tweets if _comparable(t)]
+    if watermark:
+        ids.append(int(watermark))
+    return str(max(ids)) if ids else None
+
+
+async def scroll_until_watermark(
+    harvest: Callable[[], Awaitable[List[Dict[str, Any]]]],
+    scroll: Callable[[], Awaitable[None]],
+    watermark: Optional[str],
+    max_scrolls: int,
+    max_deep_scrolls: int,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    增量滚动收集推文：一旦看到水位线及更早的推文就停止
+    有水位线但 max_scrolls 屏内都没看到时继续加深，最多 max_deep_scrolls 屏（没有水位线时不加深）
+    """
+    limit = max(max_scrolls, max_deep_scrolls) if watermark else max_scrolls
+    collected: Dict[str, Dict[str, Any]] = {}
+    stale_rounds = 0
+
+    for scroll_num in range(limit):
+        if scroll_num == max_scrolls:
+            print(f"[INFO] {max_scrolls} 屏内未到达水位线 {watermark}，继续加深滚动（最多 {limit} 屏）")
+        print(f"\n[INFO] === 第 {scroll_num + 1} 屏 ===")
+
+        current = await harvest()
+        new_count = 0
+        for t in current:
+            if t["id"] not in collected:
+                collected[t["id"]] = t
+                new_count += 1
+        print(f"[INFO] 本屏收集 {len(current)} 条，新增 {new_count} 条，总计 {len(collected)} 条")
+
+        if reached_watermark(current, watermark):
+            print(f"[INFO] 已到达水位线 {watermark}，停止滚动")
+            break
+
+        # 连续两屏没有新推文，说明已经到底（或被限流），继续滚动没有意义
+        stale_rounds = stale_rounds + 1 if new_count == 0 else 0
+        if stale_rounds >= 2:
+            print(f"[INFO] 连续两屏没有新推文，停止滚动")
+            break
+
+        if scroll_num < limit - 1:
+            await scroll()
+
+    return collected
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本分诊：先用便宜的文本模型给推文正文打分，只有需要看图的推文才调用视觉模型
+- 带图片/视频、引用推文、没有提取到正文的推文直接走视觉模型（截图里有文本看不到的信息）
+- 其余推文按正文打分，置信度达到阈值才升级到视觉模型；一句话回复、梗图配文等噪音直接用文本结果
+文本结果和视觉结果输出同一 JSON 格式，存入同一张 twitter_ai_results 表
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional
+
+from src.common import ai
+from src.twitter.signals import parse_signal
+
+# ==================== 配置 ====================
+TRIAGE_ENABLED = os.getenv("TWITTER_TRIAGE", "true").lower() == "true"  # 设为 false 时所有推文都调用视觉模型
+TRIAGE_THRESHOLD = int(os.getenv("TWITTER_TRIAGE_THRESHOLD", "3"))  # 文本打分的置信度达到该值时升级到视觉模型
+
+TRIAGE_PROMPT = """
+你是一名事件驱动型投资信号分析器。
+
+输入：
+- 一条 Elon Musk 的 X 推文正文（纯文本，不含图片）
+
+任务：
+将该推文压缩为【交易级信号】，而不是内容解读。
+
+1. summary：一句话概括核心信息及其潜在市场含义，禁止背景解释与复述原文
+2. signal_type（只能选一个）：
+A. 行动/公司行为  B. 政策立场  C. 技术突破/产品发布  D. 情绪/口水战  E. 纯个人生活/娱乐
+3. direction：Long / Short / Neutral
+4. assets：受影响的美股、A股核心标的（最多各3个）
+5. confidence（0-10）：0-3 噪音/个人观点，4-6 有价值但需观察，7-10 可直接采取行动
+6. expiry：信号时效（即刻/1天/3天/1周/1个月）
+
+输出格式（JSON）：
+{
+  "summary": "",
+  "signal_type": "E",
+  "direction": "Neutral",
+  "assets": {
+    "US": [],
+    "CN": []
+  },
+  "confidence": 0,
+  "expiry": "即刻"
+}
+
+注意：
+- 禁止输出任何解释性文字，只输出 JSON
+- 一句话回复、表情、梗、纯个人生活内容，confidence 设为 0-2
+"""
+
+
+def vision_reason(tweet: Dict[str, Any]) -> Optional[str]:
+    """必须看截图的原因；纯文本推文返回 None"""
+    if tweet.get("has_media") or tweet.get("media"):
+        return "带图片/视频"
+    if tweet.get("quote") or tweet.get("is_quote"):
+        return "引用推文"
+    if not (tweet.get("text") or "").strip():
+        return "没有提取到正文"
+    return None
+
+
+async def triage_text(tweet: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    文本结果足以代替视觉分析时返回 analyze_text 的结果（低于阈值的噪音推文），
+    需要升级到视觉模型时返回 None
+    """
+    if not TRIAGE_ENABLED:
+        return None
+    reason = vision_reason(tweet)
+    if reason:
+        print(f"[INFO] {tweet['id']} {reason}，直接调用视觉模型")
+        return None
+
+    result = await ai.analyze_text(
+        tweet["text"].strip(), TRIAGE_PROMPT, json_mode=ai.JSON_MODE, validate=lambda text: parse_signal(text) is not None
+    )
+    if not result["success"]:
+        print(f"[WARN] {tweet['id']} 文本分诊失败，改用视觉模型")
+        return None
+    signal = parse_signal(result["ai_text"])
+    confidence = signal.confidence if signal else None
+    if confidence is None or confidence >= TRIAGE_THRESHOLD:
+        print(f"[INFO] {tweet['id']} 文本分诊置信度 {confidence}，升级到视觉模型")
+        return None
+    print(f"[INFO] {tweet['id']} 文本分诊置信度 {confidence}（低于 {TRIAGE_THRESHOLD}），跳过视觉模型")
+    return result
@@ -8,21 +8,46 @@ Twitter 完整流水线：爬取 → 上传OSS → AI分析 → 飞书通知
 from __future__ import annotations
 
 import asyncio
+import base64
 import datetime as dt
 import json
 import os
 import random
-import re
 import sqlite3
+import sys
 import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 import alibabacloud_oss_v2 as oss
 import requests
 from alibabacloud_oss_v2.models import PutObjectRequest
-from openai import OpenAI
-from playwright.async_api import async_playwright, Page, Browser
+from playwright.async_api import async_playwright, Page, Playwright
+
+# 以脚本方式运行（cron: python src/twitter/twitter_pipeline.py）时也能导入项目内模块
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.common import ai
+from src.twitter import detail, imaging, profile, triage
+from src.twitter.auth import SessionExpiredError, discard_storage_state, ensure_logged_in
+from src.twitter.backlog import enqueue_pending, ensure_pending_table, load_pending, remove_pending
+from src.twitter.browser import BrowserSession, PagePool
+from src.twitter.dedupe import ensure_hash_table, find_similar, record_hash, text_digest
+from src.twitter.graphql_timeline import GraphQLTimelineCollector
+from src.twitter.pacing import AdaptiveRateLimiter, PacingPolicy, ensure_rate_limit_table, parse_jitter
+from src.twitter.request_policy import SCREENSHOT, TIMELINE, RequestPolicy
+from src.twitter.signals import SIGNAL_TYPES, StreamingSignalParser, parse_signal
+from src.twitter.stages import StagedPipeline
+from src.twitter.timeline import (
+    collect_tweet_links,
+    extract_cells,
+    ensure_watermark_table,
+    get_watermark,
+    next_watermark,
+    profile_url,
+    scroll_until_watermark,
+    update_watermark,
+)
 
 # ==================== 配置加载 ====================
 def load_secrets():
@@ -38,8 +63,9 @@ SECRETS = load_secrets()
 # ==================== 配置 ====================
 # Twitter 配置
 TARGET_USER = os.getenv("TWITTER_USER") or SECRETS.get("twitter", {}).get("target_user", "elonmusk")
-TARGET_URL = f"https://x.com/{TARGET_USER}"
+TARGET_URL = profile_url(TARGET_USER)
 COOKIE_FILE = Path(os.getenv("TWITTER_COOKIE_FILE", "config/twitter_cookies.json"))
+STORAGE_STATE_FILE = Path(os.getenv("TWITTER_STORAGE_STATE", "data/twitter_state.json"))  # 成功运行后保存的登录态
 DB_PATH = Path(os.getenv("TWITTER_DB_PATH", "data/twitter.db"))
 SCREENSHOT_DIR = Path(os.getenv("TWITTER_SCREENSHOT_DIR", "screenshots"))
 
@@ -49,8 +75,33 @@ TIMEOUT = int(os.getenv("TWITTER_TIMEOUT", "60000"))
 
 # 滚动配置
 MAX_SCROLLS = int(os.getenv("TWITTER_MAX_SCROLLS", "5"))
+MAX_DEEP_SCROLLS = int(os.getenv("TWITTER_MAX_DEEP_SCROLLS", "15"))  # 一直没到水位线时最多加深到的屏数
 SCROLL_DELAY = int(os.getenv("TWITTER_SCROLL_DELAY", "3000"))
-MAX_DETAIL_PAGES = int(os.getenv("TWITTER_MAX_DETAIL_PAGES", "10"))
+MAX_DETAIL_PAGES = int(os.getenv("TWITTER_MAX_DETAIL_PAGES", "0"))  # 额外的固定上限；0 表示只按自适应限速器的预算
+
+# 推文收集方式：dom（解析页面元素）/ graphql（监听 UserTweets/TweetDetail 接口响应）
+HARVEST_MODE = os.getenv("TWITTER_HARVEST_MODE", "dom").lower()
+
+# 按阶段屏蔽视频、字体、埋点等请求（滚动阶段连图片也屏蔽）
+BLOCK_REQUESTS = os.getenv("TWITTER_BLOCK_REQUESTS", "true").lower() == "true"
+
+# 详情页并发配置
+DETAIL_CONCURRENCY = int(os.getenv("TWITTER_DETAIL_CONCURRENCY", "3"))  # 同时打开的详情页数量
+DETAIL_MIN_INTERVAL = int(os.getenv("TWITTER_DETAIL_MIN_INTERVAL", "1000"))  # 两次详情页导航的最小间隔（毫秒）
+# 时间线上显示完整的推文直接原地截图，只有 Show more / 敏感内容 / 引用卡片才进详情页
+# 开启后滚动阶段需要加载图片（请求拦截不再屏蔽时间线上的图片）
+INPLACE_SCREENSHOTS = os.getenv("TWITTER_INPLACE_SCREENSHOTS", "true").lower() == "true"
+DETAIL_JITTER = parse_jitter(os.getenv("TWITTER_DETAIL_JITTER", "1000-3000"))  # 每次导航前的随机停顿（毫秒范围）
+
+# 处理流水线配置（截图完成的推文立即进入 上传 → AI 分析 → 通知）
+UPLOAD_CONCURRENCY = int(os.getenv("TWITTER_UPLOAD_CONCURRENCY", "2"))  # 同时上传 OSS 的推文数
+AI_CONCURRENCY = int(os.getenv("TWITTER_AI_CONCURRENCY", "2"))  # 同时进行 AI 分析的推文数（模型请求总并发另见 QIANWEN_CONCURRENCY）
+NOTIFY_CONCURRENCY = int(os.getenv("TWITTER_NOTIFY_CONCURRENCY", "1"))  # 同时发送飞书通知的推文数
+STAGE_QUEUE_SIZE = int(os.getenv("TWITTER_STAGE_QUEUE", "4"))  # 每个阶段前最多排队的推文数，满了上游等待
+# 截图以 data URL 直接发给视觉模型，OSS 上传同时进行、只用于存档和通知链接（模型不必再从 OSS 拉图）
+INLINE_IMAGE = os.getenv("TWITTER_AI_INLINE_IMAGE", "true").lower() == "true"
+# 视觉模型流式输出，summary 和 direction 一写完就先发一条初步通知（中性信号不发），完整分析结束后再发完整通知
+EARLY_ALERT = os.getenv("TWITTER_EARLY_ALERT", "true").lower() == "true"
 
 # OSS配置（优先从环境变量，其次从 secrets.json）
 OSS_ACCESS_KEY_ID = os.getenv("OSS_ACCESS_KEY_ID") or SECRETS.get("oss", {}).get("access_key_id", "")
@@ -64,9 +115,7 @@ FEISHU_WEBHOOK = os.getenv("TWITTER_FEISHU_WEBHOOK") or SECRETS.get("feishu", {}
 
 # AI配置（优先从环境变量，其次从 secrets.json）
 AI_API_KEY = os.getenv("QIANWEN_API_KEY") or SECRETS.get("qianwen", {}).get("api_key", "")
-AI_BASE_URL = os.getenv("QIANWEN_BASE_URL") or SECRETS.get("qianwen", {}).get("base_url", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-AI_MODEL = os.getenv("QIANWEN_MODEL") or SECRETS.get("qianwen", {}).get("model", "qwen-vl-plus")
-AI_TIMEOUT = int(os.getenv("QIANWEN_TIMEOUT", "120"))
+# 模型、超时、并发和重试配置见 src/common/ai.py（QIANWEN_*）
 
 # AI 分析数据库
 AI_DB_PATH = Path(os.getenv("TWITTER_AI_DB_PATH", "data/twitter_ai.db"))
@@ -168,10 +217,33 @@ def ensure_twitter_db() -> sqlite3.Connection:
         conn.execute("ALTER TABLE tweets ADD COLUMN screenshot_path TEXT;")
         print("[INFO] 已添加 screenshot_path 列到数据库")
     
+    # 增量滚动的水位线
+    ensure_watermark_table(conn)
+    # 跨运行共享的自适应限速状态
+    ensure_rate_limit_table(conn)
+    # 超出单轮预算、留到之后几轮的待截图推文
+    ensure_pending_table(conn)
+    
     conn.commit()
     return conn
 
 
+_rate_limiter: Optional[AdaptiveRateLimiter] = None
+
+
+def rate_limiter() -> AdaptiveRateLimiter:
+    """本进程共享的自适应限速器，首次使用时从数据库恢复上一次运行的状态"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        conn = ensure_twitter_db()
+        try:
+            _rate_limiter = AdaptiveRateLimiter.load(conn)
+        finally:
+            conn.close()
+        print(f"[INFO] 限速器: {_rate_limiter.rate:.1f} 次/分钟，剩余令牌 {_rate_limiter.tokens:.1f}")
+    return _rate_limiter
+
+
 def known_tweet_ids(conn: sqlite3.Connection, user_handle: str) -> Set[str]:
     """获取已存储的推文 ID"""
     rows = conn.execute(
@@ -206,7 +278,7 @@ def save_tweet(conn: sqlite3.Connection, tweet: Dict[str, Any]) -> bool:
                     tweet.get("link"),
                     tweet.get("screenshot_path"),
                     fetched_at,
-                    json.dumps(tweet, ensure_ascii=False),
+                    json.dumps({k: v for k, v in tweet.items() if k != imaging.IMAGE_KEY}, ensure_ascii=False),
                 ),
             )
         return True
@@ -236,6 +308,16 @@ def ensure_ai_db() -> sqlite3.Connection:
     conn.execute("CREATE INDEX IF NOT EXISTS idx_tweet_id ON twitter_ai_results(tweet_id);")
     # 索引：优化按时间查询已处理的推文
     conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_at ON twitter_ai_results(processed_at);")
+    
+    # 近似重复的截图复用哪条推文的分析结果
+    cursor = conn.execute("PRAGMA table_info(twitter_ai_results);")
+    columns = {row[1] for row in cursor.fetchall()}
+    if "duplicate_of" not in columns:
+        conn.execute("ALTER TABLE twitter_ai_results ADD COLUMN duplicate_of TEXT;")
+        print("[INFO] 已添加 duplicate_of 列到AI数据库")
+    
+    # 截图感知哈希（近似去重）
+    ensure_hash_table(conn)
     conn.commit()
     return conn
 
@@ -257,6 +339,17 @@ def get_processed_tweet_ids(conn: sqlite3.Connection) -> Set[str]:
     return {r[0] for r in rows}
 
 
+def get_ai_result(conn: sqlite3.Connection, tweet_id: str) -> Optional[Dict[str, Any]]:
+    """读取某条推文的分析结果（近似重复的截图复用）"""
+    row = conn.execute(
+        "SELECT oss_url, ai_result, summary, duplicate_of FROM twitter_ai_results WHERE tweet_id = ?",
+        (tweet_id,),
+    ).fetchone()
+    if not row:
+        return None
+    return {"oss_url": row[0], "ai_result": row[1], "summary": row[2], "duplicate_of": row[3]}
+
+
 def save_ai_result(
     conn: sqlite3.Connection,
     tweet_id: str,
@@ -264,23 +357,25 @@ def save_ai_result(
     oss_url: str,
     ai_result: str,
     summary: str,
-    processed_at: str
+    processed_at: str,
+    duplicate_of: Optional[str] = None,
 ) -> bool:
-    """保存AI分析结果"""
+    """保存AI分析结果；duplicate_of 不为空表示复用了该推文的结果"""
     try:
         with conn:
             conn.execute(
                 """
                 INSERT INTO twitter_ai_results (
-                    tweet_id, screenshot_path, oss_url, ai_result, summary, processed_at
-                ) VALUES (?, ?, ?, ?, ?, ?)
+                    tweet_id, screenshot_path, oss_url, ai_result, summary, processed_at, duplicate_of
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
                 ON CONFLICT(tweet_id) DO UPDATE SET
                     oss_url=excluded.oss_url,
                     ai_result=excluded.ai_result,
                     summary=excluded.summary,
-                    processed_at=excluded.processed_at;
+                    processed_at=excluded.processed_at,
+                    duplicate_of=excluded.duplicate_of;
                 """,
-                (tweet_id, screenshot_path, oss_url, ai_result, summary, processed_at),
+                (tweet_id, screenshot_path, oss_url, ai_result, summary, processed_at, duplicate_of),
             )
         return True
     except Exception as exc:
@@ -306,15 +401,14 @@ def load_cookies() -> List[Dict[str, Any]]:
     return cookies
 
 
-async def inject_cookies(page: Page, cookies: List[Dict[str, Any]]) -> None:
-    """注入 Cookie 到浏览器"""
-    await page.context.add_cookies(cookies)
-    print(f"[INFO] 已注入 {len(cookies)} 个 Cookie")
-
-
 # ==================== Twitter 爬虫逻辑 ====================
 async def wait_for_timeline(page: Page, user_handle: str, timeout: int = 30000) -> None:
-    """等待时间线加载"""
+    """等待时间线加载；先快速检查登录态，会话失效时立即失败"""
+    try:
+        await ensure_logged_in(page)
+    except SessionExpiredError:
+        discard_storage_state(STORAGE_STATE_FILE)
+        raise
     try:
         await page.wait_for_selector(
             'article[data-testid="tweet"]',
@@ -326,34 +420,17 @@ async def wait_for_timeline(page: Page, user_handle: str, timeout: int = 30000)
         raise SystemExit(f"❌ 时间线加载失败（可能需要重新获取 Cookie）: {exc}")
 
 
-async def collect_tweet_links(page: Page, user_handle: str) -> List[Dict[str, Any]]:
-    """收集当前页面的推文链接"""
-    articles = await page.query_selector_all('article[data-testid="tweet"]')
-    tweets = []
-    
-    for article in articles:
-        try:
-            link_elem = await article.query_selector(f'a[href*="/{user_handle}/status/"]')
-            if not link_elem:
-                continue
-            
-            href = await link_elem.get_attribute("href")
-            if not href:
-                continue
-            
-            full_link = f"https://x.com{href}" if href.startswith("/") else href
-            tweet_id = href.split("/status/")[-1].split("?")[0]
-            
-            tweets.append({
-                "id": tweet_id,
-                "user_handle": user_handle,
-                "link": full_link,
-                "is_repost": 0,
-            })
-        except Exception:
-            continue
-    
-    return tweets
+async def harvest_timeline(
+    page: Page, user_handle: str, collector: Optional[GraphQLTimelineCollector] = None
+) -> List[Dict[str, Any]]:
+    """收集当前已加载的推文：graphql 模式读取接口响应，没有拿到数据时回退到 DOM"""
+    if collector is not None:
+        await collector.drain()
+        tweets = collector.authored_by(user_handle)
+        if tweets:
+            return tweets
+        print(f"[WARN] 未收到 GraphQL 时间线数据（已收到 {collector.responses} 个响应），回退到 DOM 解析")
+    return await collect_tweet_links(page, user_handle, own_only=True)
 
 
 async def smooth_scroll(page: Page) -> None:
@@ -385,135 +462,252 @@ async def smooth_scroll(page: Page) -> None:
 
 
 async def fetch_tweet_detail(page: Page, tweet: Dict[str, Any], screenshot_dir: Path) -> Dict[str, Any]:
-    """进入推文详情页，提取文字并截图"""
-    tweet_id = tweet["id"]
-    link = tweet["link"]
+    """进入推文详情页，提取文字并截图（等待逻辑见 detail.py）"""
+    return await detail.fetch_tweet_detail(page, tweet, screenshot_dir, TIMEOUT)
+
+
+def new_session(playwright: Playwright) -> BrowserSession:
+    """按配置创建浏览器会话（优先复用保存的登录态，否则读取 Cookie 文件）"""
+    return BrowserSession(
+        playwright,
+        load_cookies,
+        headless=HEADLESS,
+        policy=build_request_policy(),
+        storage_state=STORAGE_STATE_FILE,
+        cookie_file=COOKIE_FILE,
+        user_data_dir=Path(profile.USER_DATA_DIR) if profile.USER_DATA_DIR else None,
+    )
+
+
+def build_request_policy() -> Optional[RequestPolicy]:
+    """按配置创建请求拦截策略，关闭时返回 None"""
+    return RequestPolicy() if BLOCK_REQUESTS else None
+
+
+def report_request_policy(session: BrowserSession) -> None:
+    """输出本轮屏蔽的请求数和估算节省的流量，并清零计数"""
+    if not session.policy:
+        return
+    report = session.policy.report()
+    reasons = ", ".join(f"{k}={v}" for k, v in sorted(report["blocked"].items())) or "无"
+    print(f"[INFO] 请求拦截：屏蔽 {report['blocked_total']} 个（{reasons}），估算节省 {report['bytes_saved'] / 1024 / 1024:.1f} MB")
+    session.policy.reset_stats()
+
+
+async def scrape_new_tweets(
+    user_handle: str,
+    known_ids: Set[str],
+    watermark: Optional[str] = None,
+    backlog: Optional[List[Dict[str, Any]]] = None,
+    on_ready: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str], List[Dict[str, Any]]]:
+    """
+    爬取新推文（只处理不在 known_ids 中的推文），单次运行：启动浏览器 → 抓取 → 关闭
+    返回 (新推文列表, 新水位线, 超出预算留到下一轮的推文)
+    """
+    async with async_playwright() as p:
+        session = new_session(p)
+        await session.start()
+        try:
+            return await scrape_with_session(
+                session, user_handle, known_ids, watermark, backlog=backlog, on_ready=on_ready
+            )
+        finally:
+            report_request_policy(session)
+            await session.close()
+
+
+async def fetch_details_concurrently(
+    pool: PagePool,
+    tweets: List[Dict[str, Any]],
+    screenshot_dir: Path,
+    on_ready: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    用页面池并发抓取详情页，共享节奏策略和限速器控制导航频率；结果保持输入（时间线）顺序
+    on_ready 在每条推文完成后立即调用（归还页面之后，下游背压不占用页面）
+    """
+    limiter = rate_limiter()
+    pacing = PacingPolicy(DETAIL_MIN_INTERVAL / 1000, DETAIL_JITTER, bucket=limiter)
+    done = 0
+
+    async def worker(tweet: Dict[str, Any]) -> Dict[str, Any]:
+        nonlocal done
+        async with pool.page() as page:
+            await pacing.wait()
+            on_response = limiter.watch(page)
+            try:
+                detailed = await fetch_tweet_detail(page, tweet, screenshot_dir)
+                if not detailed.get("screenshot_path") and await detail.is_rate_limited(page):
+                    limiter.penalize("详情页限流提示")
+            finally:
+                page.remove_listener("response", on_response)
+        if on_ready:
+            await on_ready(detailed)
+        done += 1
+        if done % 5 == 0:
+            print(f"[INFO] 进度: {done}/{len(tweets)} ({done*100//len(tweets)}%)")
+        return detailed
+
+    # gather 按传入顺序返回结果，与完成先后无关
+    return list(await asyncio.gather(*(worker(t) for t in tweets)))
+
+
+async def capture_in_place(
+    page: Page, tweets: List[Dict[str, Any]], known_ids: Set[str], captured: Dict[str, Dict[str, Any]]
+) -> None:
+    """对当前屏幕上的新推文原地截图，结果按 ID 记入 captured（时间线显示不完整的留给详情页）"""
+    candidates = [t for t in tweets if t["id"] not in known_ids and t["id"] not in captured]
+    if not candidates:
+        return
+    # graphql 模式的推文没有 DOM 标记，统一按当前渲染的单元格判断
+    cells = {cell["id"]: cell for cell in await extract_cells(page)}
+    for tweet in candidates:
+        cell = cells.get(tweet["id"])
+        if cell is None or detail.needs_detail(cell):
+            continue
+        shot = {"id": tweet["id"], "text": tweet.get("text", "")}
+        if await detail.screenshot_in_place(page, shot, SCREENSHOT_DIR):
+            captured[tweet["id"]] = shot
+
+
+async def scrape_with_session(
+    session: BrowserSession,
+    user_handle: str,
+    known_ids: Set[str],
+    watermark: Optional[str] = None,
+    page: Optional[Page] = None,
+    backlog: Optional[List[Dict[str, Any]]] = None,
+    on_ready: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str], List[Dict[str, Any]]]:
+    """
+    在已登录的浏览器会话上执行一轮抓取（cron 单次运行和常驻守护进程共用）
+    page 为空时使用会话的主页面；多目标调度时每个目标从时间线页面池借一个页面
+    backlog 是之前几轮超出预算的待截图推文（见 backlog.py），优先于本轮新推文处理
+    on_ready 对每条返回的推文调用一次：原地截图的在阶段2开始前，进详情页的在各自完成时
+    滚动到水位线即停止；返回 (新推文列表, 新水位线, 超出本轮预算的推文)
+    """
+    page = page or session.page
+    limiter = rate_limiter()
+    run_started = time.time()
+    
+    SCREENSHOT_DIR.mkdir(parents=True, exist_ok=True)
     
-    print(f"[INFO] 进入详情页: {link}")
+    # graphql 模式：在导航前挂上监听器，首屏的 UserTweets 响应也能收到
+    collector: Optional[GraphQLTimelineCollector] = None
+    if HARVEST_MODE == "graphql":
+        collector = GraphQLTimelineCollector()
+        collector.attach(page)
     
+    # 原地截图需要时间线上的图片，主页面改用截图阶段的拦截规则
+    if session.policy:
+        session.policy.set_phase(page, SCREENSHOT if INPLACE_SCREENSHOTS else TIMELINE)
+    captured: Dict[str, Dict[str, Any]] = {}
+    
+    async def harvest() -> List[Dict[str, Any]]:
+        tweets = await harvest_timeline(page, user_handle, collector)
+        if INPLACE_SCREENSHOTS:
+            await capture_in_place(page, tweets, known_ids, captured)
+        return tweets
+    
+    async def scroll() -> None:
+        # 每次滚动都会触发一次 UserTweets 请求，和导航一样消耗令牌
+        await limiter.acquire()
+        await smooth_scroll(page)
+    
+    on_response = limiter.watch(page)
     try:
-        await page.goto(link, timeout=TIMEOUT)
-        await page.wait_for_selector('article[data-testid="tweet"]', timeout=15000, state="visible")
-        await page.wait_for_timeout(1500)
-        
-        # 展开长推文
-        try:
-            show_more_btn = page.locator('article[data-testid="tweet"] button').filter(has_text="Show more").first
-            if await show_more_btn.is_visible():
-                await show_more_btn.click()
-                await page.wait_for_timeout(1000)
-        except Exception:
-            pass
-        
-        # 提取文字
-        try:
-            text_locator = page.locator('article[data-testid="tweet"] [data-testid="tweetText"]').first
-            text = await text_locator.inner_text() if await text_locator.count() > 0 else ""
-            tweet["text"] = text.strip()
-        except Exception:
-            tweet["text"] = ""
-        
-        # 截图
+        # 阶段1：收集推文链接
+        print(f"\n[INFO] ========== 阶段1：收集推文链接（{HARVEST_MODE}，水位线 {watermark or '无'}） ==========")
+        await limiter.acquire()
+        load_started = time.monotonic()
+        await page.goto(profile_url(user_handle), timeout=TIMEOUT)
         try:
-            article_locator = page.locator('article[data-testid="tweet"]').first
-            screenshot_path = screenshot_dir / f"{tweet_id}.jpg"
-            await article_locator.screenshot(path=str(screenshot_path), type="jpeg", quality=90)
-            tweet["screenshot_path"] = str(screenshot_path)
-            print(f"[INFO] 已保存截图: {screenshot_path}")
-        except Exception as exc:
-            print(f"[WARN] 截图失败: {exc}")
-            tweet["screenshot_path"] = None
+            await wait_for_timeline(page, user_handle, timeout=30000)
+        except SessionExpiredError:
+            raise
+        except SystemExit:
+            limiter.penalize("限流提示页" if await detail.is_rate_limited(page) else "时间线未加载")
+            raise
+        await session.report_load(page, int((time.monotonic() - load_started) * 1000))
         
-        await page.wait_for_timeout(random.randint(2000, 4000))
-        
-    except Exception as exc:
-        print(f"[WARN] 获取推文详情失败 {tweet_id}: {exc}")
-        tweet["text"] = ""
-        tweet["screenshot_path"] = None
+        all_tweet_links = await scroll_until_watermark(
+            harvest=harvest,
+            scroll=scroll,
+            watermark=watermark,
+            max_scrolls=MAX_SCROLLS,
+            max_deep_scrolls=MAX_DEEP_SCROLLS,
+        )
+    finally:
+        page.remove_listener("response", on_response)
+        if collector:
+            collector.detach(page)
     
-    return tweet
-
-
-async def scrape_new_tweets(user_handle: str, known_ids: Set[str]) -> List[Dict[str, Any]]:
-    """爬取新推文（只处理不在 known_ids 中的推文）"""
-    cookies = load_cookies()
-    all_tweet_links: Dict[str, Dict[str, Any]] = {}
+    print(f"\n[INFO] 链接收集完成，共 {len(all_tweet_links)} 条推文")
+    if not all_tweet_links:
+        # 已登录且时间线可见却一条推文都没有，通常是接口被限流
+        limiter.penalize("时间线为空")
+    # 时间线加载成功说明登录态有效，保存下来供下次启动复用
+    await session.save_state()
     
-    SCREENSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    # 过滤出新推文
+    new_tweet_links = {tid: t for tid, t in all_tweet_links.items() if tid not in known_ids}
+    print(f"[INFO] 其中新推文 {len(new_tweet_links)} 条（已排除数据库中已有的）")
     
-    async with async_playwright() as p:
-        browser: Browser = await p.chromium.launch(headless=HEADLESS)
-        context = await browser.new_context(
-            viewport={"width": 1920, "height": 1080},
-            user_agent=(
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
-        )
-        
-        page = await context.new_page()
-        await inject_cookies(page, cookies)
-        
-        # 阶段1：收集推文链接
-        print(f"\n[INFO] ========== 阶段1：收集推文链接 ==========")
-        await page.goto(TARGET_URL, timeout=TIMEOUT)
-        await wait_for_timeline(page, user_handle, timeout=30000)
-        
-        for scroll_num in range(MAX_SCROLLS):
-            print(f"\n[INFO] === 第 {scroll_num + 1}/{MAX_SCROLLS} 次滚动 ===")
-            
-            current_links = await collect_tweet_links(page, user_handle)
-            
-            new_count = 0
-            for t in current_links:
-                if t["id"] not in all_tweet_links:
-                    all_tweet_links[t["id"]] = t
-                    new_count += 1
-            
-            print(f"[INFO] 本次收集 {len(current_links)} 条，新增 {new_count} 条，总计 {len(all_tweet_links)} 条")
-            
-            if scroll_num < MAX_SCROLLS - 1:
-                await smooth_scroll(page)
-        
-        print(f"\n[INFO] 链接收集完成，共 {len(all_tweet_links)} 条推文")
-        
-        # 过滤出新推文
-        new_tweet_links = {tid: t for tid, t in all_tweet_links.items() if tid not in known_ids}
-        print(f"[INFO] 其中新推文 {len(new_tweet_links)} 条（已排除数据库中已有的）")
-        
-        if not new_tweet_links:
-            print(f"[INFO] 没有新推文，跳过详情页抓取")
-            await browser.close()
-            return []
-        
-        # 阶段2：只对新推文进入详情页
+    seen_watermark = next_watermark(list(all_tweet_links.values()), watermark)
+    # 待截图队列排在最前面；本轮又滚到的推文保持队列中的位置，内容以本轮为准
+    queued = {t["id"]: t for t in backlog or [] if t["id"] not in known_ids}
+    if queued:
+        print(f"[INFO] 待截图队列中还有 {len(queued)} 条，优先处理")
+    new_tweet_links = {**queued, **new_tweet_links}
+    if not new_tweet_links:
+        print(f"[INFO] 没有新推文，跳过详情页抓取")
+        limiter.reward(run_started)
+        return [], seen_watermark, []
+    
+    # 已在时间线上原地截图的推文不再进详情页
+    for tid, shot in captured.items():
+        if tid in new_tweet_links:
+            new_tweet_links[tid].update(shot)
+    tweet_list = list(new_tweet_links.values())
+    pending = [t for t in tweet_list if not t.get("screenshot_path")]
+    print(f"[INFO] 时间线上原地截图 {len(tweet_list) - len(pending)} 条，需进入详情页 {len(pending)} 条")
+    
+    # 阶段2：只对时间线上显示不完整的新推文进入详情页
+    deferred: List[Dict[str, Any]] = []
+    if pending:
         print(f"\n[INFO] ========== 阶段2：获取新推文详情和截图 ==========")
         
-        new_tweets = []
-        tweet_list = list(new_tweet_links.values())
-        
-        # 限制数量
-        if len(tweet_list) > MAX_DETAIL_PAGES:
-            print(f"[INFO] 新推文 {len(tweet_list)} 条，限制只处理前 {MAX_DETAIL_PAGES} 条")
-            tweet_list = tweet_list[:MAX_DETAIL_PAGES]
-        
-        for idx, tweet in enumerate(tweet_list):
-            print(f"\n[INFO] === 处理 {idx + 1}/{len(tweet_list)} ===")
-            detailed_tweet = await fetch_tweet_detail(page, tweet, SCREENSHOT_DIR)
-            new_tweets.append(detailed_tweet)
-            
-            if (idx + 1) % 5 == 0:
-                print(f"[INFO] 进度: {idx + 1}/{len(tweet_list)} ({(idx+1)*100//len(tweet_list)}%)")
-        
-        await browser.close()
+        # 本轮能进的详情页数由限速器的令牌预算决定（原地截图不产生额外请求）
+        budget = limiter.budget()
+        if MAX_DETAIL_PAGES > 0:
+            budget = min(budget, MAX_DETAIL_PAGES)
+        if len(pending) > budget:
+            print(f"[INFO] 需进入详情页 {len(pending)} 条，限速预算只够前 {budget} 条（{limiter.rate:.1f} 次/分钟），其余留到下一轮")
+            deferred = pending[budget:]
+            pending = pending[:budget]
+            deferred_ids = {t["id"] for t in deferred}
+            tweet_list = [t for t in tweet_list if t["id"] not in deferred_ids]
+    
+    # 已在时间线上截好图的推文先交给下游，不等详情页
+    if on_ready:
+        pending_ids = {t["id"] for t in pending}
+        for tweet in tweet_list:
+            if tweet["id"] not in pending_ids:
+                await on_ready(tweet)
+    
+    if pending:
+        print(f"[INFO] 并发抓取 {len(pending)} 个详情页（页面池 {DETAIL_CONCURRENCY}）")
+        # fetch_tweet_detail 原地更新推文字典，tweet_list 保持时间线顺序
+        await fetch_details_concurrently(session.detail_pool(DETAIL_CONCURRENCY), pending, SCREENSHOT_DIR, on_ready)
     
-    return new_tweets
+    limiter.reward(run_started)
+    return tweet_list, seen_watermark, deferred
 
 
 # ==================== OSS 上传 ====================
-def upload_to_oss(file_path: str) -> Optional[str]:
-    """上传文件到OSS"""
+def upload_to_oss(file_path: str, data: Optional[bytes] = None) -> Optional[str]:
+    """上传截图到OSS；传入 data 时直接上传内存中的字节（本地存档可能还没写完）"""
     object_name = os.path.basename(file_path)
     oss_url = f"{OSS_BASE_URL}{object_name}"
     
@@ -528,14 +722,24 @@ def upload_to_oss(file_path: str) -> Optional[str]:
         
         client = oss.Client(cfg)
         
-        with open(file_path, 'rb') as file_obj:
+        if data is not None:
             request = PutObjectRequest(
                 bucket=OSS_BUCKET,
                 key=object_name,
-                body=file_obj
+                body=data,
+                content_type=imaging.content_type(object_name),
             )
             response = client.put_object(request)
-            print(f"[INFO] 上传成功: {object_name}, ETag: {response.etag}")
+            print(f"[INFO] 上传成功: {object_name}（{len(data) / 1024:.0f} KB）, ETag: {response.etag}")
+        else:
+            with open(file_path, 'rb') as file_obj:
+                request = PutObjectRequest(
+                    bucket=OSS_BUCKET,
+                    key=object_name,
+                    body=file_obj
+                )
+                response = client.put_object(request)
+                print(f"[INFO] 上传成功: {object_name}, ETag: {response.etag}")
         
         return oss_url
     
@@ -550,163 +754,96 @@ def upload_to_oss(file_path: str) -> Optional[str]:
 
 
 # ==================== AI 分析 ====================
-def analyze_screenshot(image_url: str) -> Dict[str, Any]:
-    """调用AI分析截图"""
-    client = OpenAI(api_key=AI_API_KEY, base_url=AI_BASE_URL, timeout=AI_TIMEOUT)
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = client.chat.completions.create(
-                model=AI_MODEL,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": AI_PROMPT},
-                            {"type": "image_url", "image_url": {"url": image_url}},
-                        ],
-                    }
-                ],
-            )
-            
-            ai_text = response.choices[0].message.content
-            full_response = response.model_dump_json(indent=2)
-            
-            return {
-                "success": True,
-                "ai_text": ai_text,
-                "full_response": full_response
-            }
-        
-        except Exception as exc:
-            print(f"[WARN] AI分析失败 (尝试 {attempt + 1}/{max_retries}): {exc}")
-            if attempt < max_retries - 1:
-                time.sleep(2)
-            else:
-                return {"success": False, "error": str(exc)}
+async def analyze_screenshot(
+    image_url: str, content: Optional[bytes] = None, on_text: Optional[Callable[[str], None]] = None
+) -> Dict[str, Any]:
+    """调用AI分析截图（共享异步客户端，并发、重试和响应缓存由 src/common/ai.py 控制；on_text 非空时流式输出）"""
+    return await ai.analyze_image(
+        image_url, AI_PROMPT, system_prompt=False, content=content, json_mode=ai.JSON_MODE, on_text=on_text,
+        validate=lambda text: parse_signal(text) is not None,
+    )
 
 
 def extract_summary(ai_text: str) -> str:
     """从AI响应中提取摘要"""
-    try:
-        json_match = re.search(r'\{.*\}', ai_text, re.DOTALL)
-        if json_match:
-            data = json.loads(json_match.group())
-            return data.get("summary", "")[:100]
-    except Exception:
-        pass
-    
-    if "summary" in ai_text.lower():
-        lines = ai_text.split("\n")
-        for line in lines:
-            if "summary" in line.lower() and ":" in line:
-                summary = line.split(":", 1)[1].strip().strip('"')
-                summary = re.sub(r'\s+', ' ', summary)
-                return summary
-    
+    signal = parse_signal(ai_text)
+    if signal and signal.summary:
+        return signal.summary[:100]
     return ai_text[:100] if ai_text else "无摘要"
 
 
 # ==================== 飞书通知 ====================
+DIRECTION_ICONS = {
+    "Long": "📈 做多",
+    "Short": "📉 做空",
+    "Neutral": "➖ 中性",
+}
+
+
 def format_ai_result(ai_text: str, image_url: str) -> str:
     """将AI分析结果格式化为友好的文本"""
-    try:
-        # 尝试解析 JSON
-        json_match = re.search(r'\{.*\}', ai_text, re.DOTALL)
-        if json_match:
-            data = json.loads(json_match.group())
-            
-            # 信号类型映射
-            signal_types = {
-                "A": "📊 行动/公司行为",
-                "B": "🏛️ 政策立场",
-                "C": "🚀 技术突破/产品发布",
-                "D": "💬 情绪/口水战",
-                "E": "🎮 纯娱乐"
-            }
-            
-            # 方向映射
-            direction_icons = {
-                "Long": "📈 做多",
-                "Short": "📉 做空",
-                "Neutral": "➖ 中性"
-            }
-            
-            # 置信度评级
-            confidence = data.get("confidence", 0)
-            if confidence >= 7:
-                confidence_text = f"⭐⭐⭐ 高置信度 ({confidence}/10)"
-            elif confidence >= 4:
-                confidence_text = f"⭐⭐ 中等置信度 ({confidence}/10)"
-            else:
-                confidence_text = f"⭐ 低置信度 ({confidence}/10) - 噪音"
-            
-            # 构建友好的文本
-            formatted = f"""📝 摘要
-{data.get('summary', '无')}
+    signal = parse_signal(ai_text)
+    if signal is None:
+        # 不符合信号格式时返回原始文本
+        return f"🔔 马斯克推文分析\n\n{ai_text}\n\n🖼️ 截图：{image_url}"
+
+    # 置信度评级
+    confidence = signal.confidence
+    if confidence >= 7:
+        confidence_text = f"⭐⭐⭐ 高置信度 ({confidence}/10)"
+    elif confidence >= 4:
+        confidence_text = f"⭐⭐ 中等置信度 ({confidence}/10)"
+    else:
+        confidence_text = f"⭐ 低置信度 ({confidence}/10) - 噪音"
+
+    # 构建友好的文本
+    formatted = f"""📝 摘要
+{signal.summary or '无'}
 
 🏷️ 信号类型
-{signal_types.get(data.get('signal_type', 'E'), '未知')}
+{SIGNAL_TYPES[signal.signal_type]}
 
 📊 影响方向
-{direction_icons.get(data.get('direction', 'Neutral'), '中性')}
+{DIRECTION_ICONS[signal.direction]}
 
 💼 受影响资产
 """
-            
-            # 添加美股资产
-            assets = data.get('assets', {})
-            us_assets = assets.get('US', [])
-            if us_assets:
-                formatted += f"🇺🇸 美股：{', '.join(us_assets)}\n"
-            else:
-                formatted += "🇺🇸 美股：无直接影响\n"
-            
-            # 添加A股资产
-            cn_assets = assets.get('CN', [])
-            if cn_assets:
-                formatted += f"🇨🇳 A股：{', '.join(cn_assets)}\n"
-            else:
-                formatted += "🇨🇳 A股：无直接影响\n"
-            
-            # 添加置信度
-            formatted += f"\n{confidence_text}\n"
-            
-            # 添加失效时间
-            expiry = data.get('expiry', '未知')
-            formatted += f"\n⏰ 信号时效：{expiry}\n"
-            
-            # 添加风险提示
-            risk = data.get('risk', '无')
-            if risk and risk != '无':
-                formatted += f"\n⚠️ 关键风险\n{risk}\n"
-            
-            # 添加截图链接
-            formatted += f"\n🖼️ 截图：{image_url}"
-            
-            return formatted
-    
-    except Exception as e:
-        print(f"[WARN] 格式化AI结果失败: {e}")
-    
-    # 如果解析失败，返回原始文本
-    return f"🔔 马斯克推文分析\n\n{ai_text}\n\n🖼️ 截图：{image_url}"
 
+    us_assets = signal.assets["US"]
+    formatted += f"🇺🇸 美股：{', '.join(us_assets)}\n" if us_assets else "🇺🇸 美股：无直接影响\n"
+    cn_assets = signal.assets["CN"]
+    formatted += f"🇨🇳 A股：{', '.join(cn_assets)}\n" if cn_assets else "🇨🇳 A股：无直接影响\n"
 
-def send_to_feishu(title: str, image_url: str, text: str) -> bool:
-    """发送消息到飞书（格式化后的富文本）"""
+    formatted += f"\n{confidence_text}\n"
+    formatted += f"\n⏰ 信号时效：{signal.expiry}\n"
+    if signal.risk and signal.risk != "无":
+        formatted += f"\n⚠️ 关键风险\n{signal.risk}\n"
+
+    # 添加截图链接
+    formatted += f"\n🖼️ 截图：{image_url}"
+    return formatted
+
+
+def format_preliminary(tweet: Dict[str, Any], fields: Dict[str, str]) -> str:
+    """流式输出刚写完 summary 和 direction 时的初步通知（完整分析随后再发一条）"""
+    return (
+        f"⚡ 初步信号（分析进行中）\n\n"
+        f"📝 摘要\n{fields['summary'] or '无'}\n\n"
+        f"📊 影响方向\n{DIRECTION_ICONS[fields['direction']]}\n\n"
+        f"🔗 推文：{tweet['link']}"
+    )
+
+
+def post_to_feishu(text: str) -> bool:
+    """发送一条文本消息到飞书"""
     if not FEISHU_WEBHOOK:
         print("[WARN] FEISHU_WEBHOOK 未配置，跳过飞书通知")
         return False
     
-    # 格式化 AI 结果
-    formatted_text = format_ai_result(text, image_url)
-    
     payload = {
         "msg_type": "text",
         "content": {
-            "text": formatted_text
+            "text": text
         }
     }
     
@@ -725,81 +862,307 @@ def send_to_feishu(title: str, image_url: str, text: str) -> bool:
         return False
 
 
+def send_to_feishu(title: str, image_url: str, text: str) -> bool:
+    """发送消息到飞书（格式化后的富文本）"""
+    return post_to_feishu(format_ai_result(text, image_url))
+
+
 # ==================== 处理流程 ====================
-def process_new_tweets(new_tweets: List[Dict[str, Any]], ai_conn: sqlite3.Connection) -> int:
-    """处理新推文：上传OSS、AI分析、发送飞书"""
-    if not new_tweets:
-        print(f"[INFO] 没有新推文需要处理")
-        return 0
+# 以下每一步处理一条推文，由流水线（TweetProcessor）的各阶段调用
+def upload_tweet(tweet: Dict[str, Any]) -> Optional[str]:
+    print(f"[INFO] {tweet['id']} 上传到OSS...")
+    oss_url = upload_to_oss(tweet["screenshot_path"], tweet.get(imaging.IMAGE_KEY))
+    if not oss_url:
+        print(f"[ERROR] {tweet['id']} OSS上传失败，跳过")
+        return None
+    print(f"[INFO] OSS URL: {oss_url}")
+    return oss_url
+
+
+def inline_image_url(tweet: Dict[str, Any]) -> Optional[str]:
+    """内联模式下把内存中的截图编码成 data URL；未开启或没有截图字节时返回 None（改用 OSS 链接）"""
+    data = tweet.get(imaging.IMAGE_KEY)
+    if not INLINE_IMAGE or not data:
+        return None
+    return f"data:{imaging.content_type(tweet['screenshot_path'])};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+async def upload_and_analyze(tweet: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, str]]]:
+    """内联模式下上传和 AI 分析同时进行；否则先上传，再让模型从 OSS 拉图。返回 (oss_url, analysis)"""
+    upload = asyncio.ensure_future(asyncio.to_thread(upload_tweet, tweet))
+    image_url = inline_image_url(tweet)
+    if image_url is None:
+        oss_url = await upload
+        if not oss_url:
+            return None, None
+        return oss_url, await analyze_tweet(tweet, oss_url)
+    analysis = await analyze_tweet(tweet, image_url)
+    return await upload, analysis
+
+
+async def analyze_tweet(
+    tweet: Dict[str, Any],
+    image_url: str,
+    on_preliminary: Optional[Callable[[Dict[str, str]], None]] = None,
+) -> Optional[Dict[str, str]]:
+    """
+    AI 分析并提取摘要（纯文本的噪音推文只用文本模型，见 triage.py），失败时返回 None
+    on_preliminary 非空时视觉模型流式输出，summary 和 direction 写完后以 {summary, direction} 回调一次
+    """
+    print(f"[INFO] {tweet['id']} AI分析中...")
+    ai_result = await triage.triage_text(tweet)
+    if ai_result is None:
+        on_text = None
+        if on_preliminary:
+            parser = StreamingSignalParser()
+
+            def on_text(text: str) -> None:
+                if not parser.ready and parser.feed(text) and parser.ready:
+                    on_preliminary(dict(parser.fields))
+
+        ai_result = await analyze_screenshot(image_url, tweet.get(imaging.IMAGE_KEY), on_text)
+    if not ai_result["success"]:
+        print(f"[ERROR] {tweet['id']} AI分析失败，跳过")
+        return None
     
-    # 过滤出有截图的推文
-    tweets_with_screenshots = [t for t in new_tweets if t.get("screenshot_path")]
+    ai_text = ai_result["ai_text"]
+    print(f"[INFO] {tweet['id']} AI分析完成{'（命中缓存）' if ai_result.get('cached') else ''}")
+    print(f"[INFO] AI返回: {ai_text[:150]}...")
+    if parse_signal(ai_text) is None:
+        print(f"[WARN] {tweet['id']} AI返回不符合信号格式，按原始文本通知")
     
-    if not tweets_with_screenshots:
-        print(f"[INFO] 没有截图需要处理")
-        return 0
+    summary = extract_summary(ai_text)
+    print(f"[INFO] 摘要: {summary}")
+    return {"ai_text": ai_text, "full_response": ai_result["full_response"], "summary": summary}
+
+
+def save_tweet_analysis(
+    ai_conn: sqlite3.Connection, tweet: Dict[str, Any], oss_url: Optional[str], analysis: Dict[str, str]
+) -> None:
+    processed_at = dt.datetime.now().isoformat(timespec="seconds")
+    if save_ai_result(
+        ai_conn, tweet["id"], tweet["screenshot_path"], oss_url,
+        analysis["full_response"], analysis["summary"], processed_at,
+    ):
+        print(f"[INFO] {tweet['id']} 已保存到AI数据库")
+    if tweet.get(imaging.HASH_KEY):
+        record_hash(ai_conn, tweet["id"], tweet[imaging.HASH_KEY], text_digest(tweet.get("text")))
+
+
+def notify_tweet(tweet: Dict[str, Any], oss_url: Optional[str], analysis: Dict[str, str]) -> bool:
+    print(f"[INFO] {tweet['id']} 发送飞书通知...")
+    # 内联模式下分析成功但上传失败时，通知里附推文链接
+    return send_to_feishu(title=analysis["summary"], image_url=oss_url or tweet["link"], text=analysis["ai_text"])
+
+
+class TweetProcessor:
+    """
+    新推文的 上传 → AI 分析 → 通知 流水线：截图完成的推文立即 submit，每个阶段有独立的并发上限，
+    第一条推文的通知不用等同一轮最后一条推文截图
+    内联图片模式（INLINE_IMAGE）下上传阶段只启动上传就放行，分析用 data URL，保存结果前再等上传完成
+    EARLY_ALERT 时分析阶段在流式输出中途就发出初步通知，通知阶段等它发完再发完整通知，保证顺序
+    上传和通知放到线程里执行，AI 分析直接用共享的异步客户端；AI 数据库只在事件循环线程中读写（sqlite3 连接不能跨线程）
+    """
+
+    def __init__(self, on_done: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.ai_conn = ensure_ai_db()
+        self.processed_ids = get_processed_tweet_ids(self.ai_conn)
+        self.processed = 0
+        self.preliminary: Dict[str, "asyncio.Future[bool]"] = {}
+        self.pipeline = StagedPipeline(
+            [
+                ("upload", self._upload, UPLOAD_CONCURRENCY),
+                ("analyze", self._analyze, AI_CONCURRENCY),
+                ("notify", self._notify, NOTIFY_CONCURRENCY),
+            ],
+            queue_size=STAGE_QUEUE_SIZE,
+            on_done=on_done,
+        )
+
+    async def __aenter__(self) -> "TweetProcessor":
+        self.pipeline.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            # 正常结束时等已提交的推文全部处理完；出错时直接停止
+            if exc_type is None:
+                await self.pipeline.join()
+        finally:
+            await self.pipeline.close()
+            self.ai_conn.close()
+
+    async def submit(self, tweet: Dict[str, Any]) -> None:
+        """提交一条已保存的推文；没有截图、已处理过或与已分析截图近似的不进入流水线"""
+        tweet_id = tweet["id"]
+        if not tweet.get("screenshot_path"):
+            return
+        if tweet_id in self.processed_ids:
+            print(f"[INFO] 推文 {tweet_id} 已处理过，跳过")
+            return
+        self.processed_ids.add(tweet_id)
+        if reuse_similar_result(self.ai_conn, tweet):
+            return
+        await self.pipeline.submit(tweet)
+
+    async def _upload(self, tweet: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], "asyncio.Future[Optional[str]]"]]:
+        upload = asyncio.ensure_future(asyncio.to_thread(upload_tweet, tweet))
+        # 内联模式下不等上传完成，直接交给分析阶段；否则模型要从 OSS 拉图，必须先上传成功
+        if inline_image_url(tweet) is None and not await upload:
+            self.processed_ids.discard(tweet["id"])
+            return None
+        return tweet, upload
+
+    async def _analyze(
+        self, item: Tuple[Dict[str, Any], "asyncio.Future[Optional[str]]"]
+    ) -> Optional[Tuple[Dict[str, Any], Optional[str], Dict[str, str]]]:
+        tweet, upload = item
+        image_url = inline_image_url(tweet) or await upload
+        on_preliminary = (lambda fields: self._send_preliminary(tweet, fields)) if EARLY_ALERT else None
+        analysis = await analyze_tweet(tweet, image_url, on_preliminary)
+        oss_url = await upload
+        if not analysis:
+            self.processed_ids.discard(tweet["id"])
+            self.preliminary.pop(tweet["id"], None)
+            return None
+        save_tweet_analysis(self.ai_conn, tweet, oss_url, analysis)
+        return tweet, oss_url, analysis
+
+    def _send_preliminary(self, tweet: Dict[str, Any], fields: Dict[str, str]) -> None:
+        """流式输出中 summary 和 direction 已写完：不等分析结束，后台先发初步通知"""
+        if fields["direction"] == "Neutral":
+            return
+        print(f"[INFO] {tweet['id']} 发送初步通知（{fields['direction']}）...")
+        self.preliminary[tweet["id"]] = asyncio.ensure_future(
+            asyncio.to_thread(post_to_feishu, format_preliminary(tweet, fields))
+        )
+
+    async def _notify(self, item: Tuple[Dict[str, Any], Optional[str], Dict[str, str]]) -> Dict[str, Any]:
+        tweet, oss_url, analysis = item
+        early = self.preliminary.pop(tweet["id"], None)
+        if early is not None:
+            await early
+        await asyncio.to_thread(notify_tweet, tweet, oss_url, analysis)
+        self.processed += 1
+        return tweet
+
+
+def reuse_similar_result(ai_conn: sqlite3.Connection, tweet: Dict[str, Any]) -> bool:
+    """
+    正文相同、截图近似的推文分析结果可用时，复制结果并标记 duplicate_of，返回 True
+    只凭截图哈希相近不算重复（同一账号的不同推文截图也可能很接近），以免漏发新推文的通知
+    """
+    tweet_id = tweet["id"]
+    image_hash = tweet.get(imaging.HASH_KEY)
+    text_hash = text_digest(tweet.get("text"))
+    if not image_hash or not text_hash:
+        return False
+    similar = find_similar(ai_conn, tweet_id, image_hash, text_hash)
+    if not similar:
+        return False
+    other_id, distance = similar
+    previous = get_ai_result(ai_conn, other_id)
+    if not previous or not previous["ai_result"]:
+        return False
+    # 指向最初分析的那条推文，避免重复链越来越长
+    origin = previous["duplicate_of"] or other_id
+    processed_at = dt.datetime.now().isoformat(timespec="seconds")
+    save_ai_result(
+        ai_conn, tweet_id, tweet["screenshot_path"], previous["oss_url"], previous["ai_result"],
+        previous["summary"], processed_at, duplicate_of=origin,
+    )
+    record_hash(ai_conn, tweet_id, image_hash, text_hash)
+    print(f"[INFO] 推文 {tweet_id} 与 {origin} 正文相同、截图近似（汉明距离 {distance}），复用分析结果，跳过上传和通知")
+    return True
+
+
+# ==================== 主流程 ====================
+def validate_config() -> bool:
+    """检查 OSS 和 AI 配置是否完整"""
+    if not OSS_ACCESS_KEY_ID or not OSS_ACCESS_KEY_SECRET:
+        print("[ERROR] OSS配置缺失")
+        return False
     
-    print(f"\n[INFO] ========== 开始处理 {len(tweets_with_screenshots)} 个新截图 ==========")
+    if not AI_API_KEY:
+        print("[ERROR] AI API KEY 未配置")
+        return False
     
-    # 【性能优化】批量查询已处理的推文ID，避免循环中频繁查询数据库
-    processed_ids = get_processed_tweet_ids(ai_conn)
-    print(f"[INFO] 数据库中已有 {len(processed_ids)} 条AI分析记录")
+    return True
+
+
+async def run_cycle(
+    user_handle: str, session: Optional[BrowserSession] = None, page: Optional[Page] = None
+) -> Tuple[int, int]:
+    """
+    执行一轮完整流程，返回 (新推文数, 已处理数)
+    每条推文截图完成后立即 保存 → 上传 → AI处理 → 通知（TweetProcessor），不等整轮抓取结束
+    传入 session 时复用常驻的已登录浏览器（守护进程），否则单独启动一次浏览器（cron）
+    """
+    print(f"\n{'='*60}")
+    print(f"爬取新推文并逐条处理")
+    print(f"{'='*60}")
     
-    processed_count = 0
+    limiter = rate_limiter()
+    if session is None and limiter.paused_for() > 0:
+        # cron 单次运行不在限流暂停期间启动浏览器，等下一轮
+        print(f"[WARN] 限速器暂停中（还剩 {limiter.paused_for():.0f}s），跳过本轮")
+        return 0, 0
     
-    for idx, tweet in enumerate(tweets_with_screenshots):
-        tweet_id = tweet["id"]
-        screenshot_path = tweet["screenshot_path"]
-        
-        print(f"\n[INFO] === 处理 {idx + 1}/{len(tweets_with_screenshots)}: {tweet_id} ===")
-        
-        # 【性能优化】使用内存中的 Set 检查，O(1) 复杂度
-        if tweet_id in processed_ids:
-            print(f"[INFO] 推文 {tweet_id} 已处理过，跳过")
-            continue
-        
-        # 1. 上传OSS
-        print(f"[INFO] 上传到OSS...")
-        oss_url = upload_to_oss(screenshot_path)
-        if not oss_url:
-            print(f"[ERROR] OSS上传失败，跳过")
-            continue
-        
-        print(f"[INFO] OSS URL: {oss_url}")
-        
-        # 2. AI分析
-        print(f"[INFO] AI分析中...")
-        ai_result = analyze_screenshot(oss_url)
-        
-        if not ai_result["success"]:
-            print(f"[ERROR] AI分析失败，跳过")
-            continue
-        
-        ai_text = ai_result["ai_text"]
-        full_response = ai_result["full_response"]
-        
-        print(f"[INFO] AI分析完成")
-        print(f"[INFO] AI返回: {ai_text[:150]}...")
-        
-        # 3. 提取摘要
-        summary = extract_summary(ai_text)
-        print(f"[INFO] 摘要: {summary}")
-        
-        # 4. 保存结果
-        processed_at = dt.datetime.now().isoformat(timespec="seconds")
-        if save_ai_result(ai_conn, tweet_id, screenshot_path, oss_url, full_response, summary, processed_at):
-            print(f"[INFO] 已保存到AI数据库")
-        
-        # 5. 发送飞书
-        print(f"[INFO] 发送飞书通知...")
-        send_to_feishu(title=summary, image_url=oss_url, text=ai_text)
+    twitter_conn = ensure_twitter_db()
+    saved_ids: List[str] = []
+    try:
+        known_ids = known_tweet_ids(twitter_conn, user_handle)
+        watermark = get_watermark(twitter_conn, user_handle)
+        backlog = load_pending(twitter_conn, user_handle, known_ids)
+        print(
+            f"[INFO] 数据库中已有 {len(known_ids)} 条推文，水位线: {watermark or '无'}，"
+            f"待截图队列 {len(backlog)} 条"
+        )
         
-        processed_count += 1
+        async with TweetProcessor() as processor:
+            async def on_ready(tweet: Dict[str, Any]) -> None:
+                # 先落库再进入处理流水线
+                if save_tweet(twitter_conn, tweet):
+                    saved_ids.append(tweet["id"])
+                    remove_pending(twitter_conn, [tweet["id"]])
+                await processor.submit(tweet)
+            
+            if session is None:
+                new_tweets, seen_watermark, deferred = await scrape_new_tweets(
+                    user_handle, known_ids, watermark, backlog, on_ready=on_ready
+                )
+            else:
+                new_tweets, seen_watermark, deferred = await scrape_with_session(
+                    session, user_handle, known_ids, watermark, page, backlog=backlog, on_ready=on_ready
+                )
+            print(f"[INFO] 本次爬取到 {len(new_tweets)} 条新推文，已保存 {len(saved_ids)} 条到数据库")
+            
+            # 超出预算的推文先进入待截图队列，水位线可以照常前进
+            if deferred:
+                added = enqueue_pending(twitter_conn, user_handle, deferred)
+                print(f"[INFO] {len(deferred)} 条推文留在待截图队列（新加入 {added} 条）")
+            
+            # 推文全部落库后才推进水位线
+            if len(saved_ids) == len(new_tweets):
+                update_watermark(twitter_conn, user_handle, seen_watermark)
+            
+            if new_tweets:
+                print(f"[INFO] 抓取结束，等待处理流水线完成")
+        # 退出 async with 时已等待所有推文走完 上传 → AI → 通知
+    finally:
+        # 失败的运行也要保存，降速和暂停对下一次运行同样有效
+        limiter.save(twitter_conn)
+        twitter_conn.close()
     
-    return processed_count
+    if not new_tweets:
+        print(f"\n[INFO] 没有新推文，流程结束")
+        return 0, 0
+    
+    if processor.pipeline.failed:
+        print(f"[WARN] 处理流水线有 {processor.pipeline.failed} 次失败")
+    return len(new_tweets), processor.processed
 
 
-# ==================== 主流程 ====================
 async def main():
     """主流程：爬取 → 处理 → 通知"""
     print(f"=" * 60)
@@ -813,54 +1176,19 @@ async def main():
     print(f"[INFO] 飞书 Webhook: {FEISHU_WEBHOOK}")
     
     # 验证配置
-    if not OSS_ACCESS_KEY_ID or not OSS_ACCESS_KEY_SECRET:
-        print("[ERROR] OSS配置缺失")
-        return
-    
-    if not AI_API_KEY:
-        print("[ERROR] AI API KEY 未配置")
+    if not validate_config():
         return
     
     try:
-        # ========== 步骤1：爬取新推文 ==========
-        print(f"\n{'='*60}")
-        print(f"步骤1：爬取新推文")
-        print(f"{'='*60}")
-        
-        twitter_conn = ensure_twitter_db()
-        known_ids = known_tweet_ids(twitter_conn, TARGET_USER)
-        print(f"[INFO] 数据库中已有 {len(known_ids)} 条推文")
-        
-        new_tweets = await scrape_new_tweets(TARGET_USER, known_ids)
-        print(f"[INFO] 本次爬取到 {len(new_tweets)} 条新推文")
-        
-        # 保存到数据库
-        saved_count = 0
-        for tweet in new_tweets:
-            if save_tweet(twitter_conn, tweet):
-                saved_count += 1
-        
-        print(f"[INFO] 已保存 {saved_count} 条推文到数据库")
-        twitter_conn.close()
-        
-        if not new_tweets:
-            print(f"\n[INFO] 没有新推文，流程结束")
+        new_count, processed_count = await run_cycle(TARGET_USER)
+        if not new_count:
             return
         
-        # ========== 步骤2：AI处理新推文 ==========
-        print(f"\n{'='*60}")
-        print(f"步骤2：AI处理新推文")
-        print(f"{'='*60}")
-        
-        ai_conn = ensure_ai_db()
-        processed_count = process_new_tweets(new_tweets, ai_conn)
-        ai_conn.close()
-        
         # ========== 完成 ==========
         print(f"\n{'='*60}")
         print(f"流程完成！")
         print(f"{'='*60}")
-        print(f"[INFO] 新推文: {len(new_tweets)} 条")
+        print(f"[INFO] 新推文: {new_count} 条")
         print(f"[INFO] 已处理: {processed_count} 条")
         print(f"[INFO] 推文数据库: {DB_PATH}")
         print(f"[INFO] AI数据库: {AI_DB_PATH}")
@@ -871,6 +1199,11 @@ async def main():
         print(f"\n[ERROR] 程序异常: {exc}")
         import traceback
         traceback.print_exc()
+    finally:
+        ai.report()
+        # 等后台的截图存档写完再退出
+        await imaging.flush()
+        imaging.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Twitter 实时监听：常驻一个打开目标用户主页的页面，页面内的 MutationObserver
+在新推文单元格插入时通过 page.expose_binding 推给 Python，新 ID 立即进入
+截图 → 保存 → AI 分析 → 飞书通知，不再等下一次 cron 轮询
+（时间线上显示完整的推文直接在监听页面上原地截图，其余进详情页）
+个人主页不会自动插入新推文，页面按 TWITTER_WATCH_REFRESH 定期刷新，
+刷新后重新渲染的单元格同样由 MutationObserver 上报
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from playwright.async_api import async_playwright
+
+# 以脚本方式运行（python src/twitter/watcher.py）时也能导入项目内模块
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from src.common import ai
+from src.twitter import detail, imaging
+from src.twitter import twitter_pipeline as pipeline
+from src.twitter.auth import SessionExpiredError
+from src.twitter.backlog import enqueue_pending, remove_pending
+from src.twitter.browser import BrowserSession
+from src.twitter.request_policy import SCREENSHOT
+from src.twitter.timeline import CELL_INFO_JS, cell_to_tweet, get_watermark, profile_url, update_watermark
+
+# ==================== 配置 ====================
+REFRESH_INTERVAL = int(os.getenv("TWITTER_WATCH_REFRESH", "30"))  # 刷新主页的间隔（秒）
+MAX_REFRESH_FAILURES = int(os.getenv("TWITTER_WATCH_MAX_FAILURES", "3"))  # 连续刷新失败多少次后回收浏览器
+
+BINDING_NAME = "__spiderOnTweetCells"
+
+# 页面加载时注入：先上报已渲染的单元格，之后每次 DOM 变化只检查新增节点所在的单元格
+# 单元格可能先插入空壳、稍后才渲染 article，所以按新增节点向上找 cellInnerDiv，并按 ID 去重
+OBSERVER_JS = (
+    "(() => {\n"
+    + CELL_INFO_JS
+    + r"""
+const CELL = '[data-testid="cellInnerDiv"]';
+const reported = new Set();
+const report = (cells) => {
+    const infos = [];
+    for (const cell of cells) {
+        const info = spiderCellInfo(cell);
+        if (info && !reported.has(info.id)) {
+            reported.add(info.id);
+            infos.push(info);
+        }
+    }
+    if (infos.length && window.__spiderOnTweetCells) window.__spiderOnTweetCells(infos);
+};
+const start = () => {
+    report(document.querySelectorAll(CELL));
+    new MutationObserver((mutations) => {
+        const cells = new Set();
+        for (const mutation of mutations) {
+            for (const node of mutation.addedNodes) {
+                if (node.nodeType !== Node.ELEMENT_NODE) continue;
+                const cell = node.closest(CELL);
+                if (cell) cells.add(cell);
+                node.querySelectorAll(CELL).forEach((c) => cells.add(c));
+            }
+        }
+        if (cells.size) report(cells);
+    }).observe(document.body, {childList: true, subtree: true});
+};
+if (document.body) start(); else document.addEventListener('DOMContentLoaded', start);
+})();
+"""
+)
+
+
+class TimelineWatcher:
+    """监听目标用户主页，把新推文放入队列，由 worker 抓取详情并进入 AI 流程"""
+
+    def __init__(self, user_handle: str, refresh_interval: int = REFRESH_INTERVAL):
+        self.user_handle = user_handle
+        self.refresh_interval = refresh_interval
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.known_ids: Set[str] = set()
+        self.watermark: Optional[str] = None
+        self.captured = 0
+        self._detected_at: Dict[str, float] = {}
+        # 原地截图和定期刷新都操作监听页面，互斥执行
+        self._page_lock = asyncio.Lock()
+        self.processor: Optional[pipeline.TweetProcessor] = None
+        # 一批新推文（从发现到全部截图完成）：整批成功且期间没有限流信号时才给限速器提速
+        self._batch_started: Optional[float] = None
+        self._batch_failed = False
+        self._capturing = 0
+        # 水位线只推进到比所有在途（已入队或正在截图）和截图失败的推文都旧的已截图推文，
+        # 否则较新的推文先完成时会越过仍在处理或失败的旧推文，失败的推文也就不会再重试
+        self._in_flight: Set[str] = set()
+        self._failed: Set[str] = set()
+        self._captured_ids: Set[str] = set()
+
+    # ---------- 页面内上报 ----------
+    def _on_cells(self, source: Dict[str, Any], cells: List[Dict[str, Any]]) -> None:
+        """MutationObserver 的回调：只保留本人发布、比水位线新、尚未处理的推文"""
+        handle = self.user_handle.lower()
+        fresh = []
+        for cell in cells:
+            if cell["author"].lower() != handle or cell["is_repost"] or cell["pinned"]:
+                continue
+            if cell["id"] in self.known_ids:
+                continue
+            if self.watermark and int(cell["id"]) <= int(self.watermark):
+                continue
+            fresh.append(cell)
+
+        if self.watermark is None and fresh:
+            # 数据库里没有该用户的记录：首屏只作为基线，不把历史推文全部推送一遍
+            self.watermark = str(max(int(c["id"]) for c in fresh))
+            self.known_ids.update(c["id"] for c in fresh)
+            print(f"[INFO] 首次监听，以当前最新推文 {self.watermark} 作为基线")
+            return
+
+        if fresh and self._batch_started is None:
+            self._batch_started = time.time()
+        for cell in fresh:
+            self.known_ids.add(cell["id"])
+            self._in_flight.add(cell["id"])
+            self._detected_at[cell["id"]] = time.monotonic()
+            print(f"[INFO] 发现新推文 {cell['id']}")
+            self.queue.put_nowait(cell_to_tweet(cell, self.user_handle))
+
+    async def _prepare_page(self, session: BrowserSession) -> None:
+        """在主页面上注册 binding 和 MutationObserver（刷新后仍然有效），并打开主页"""
+        page = session.page
+        if session.policy and pipeline.INPLACE_SCREENSHOTS:
+            # 原地截图需要时间线上的图片
+            session.policy.set_phase(page, SCREENSHOT)
+        await page.expose_binding(BINDING_NAME, self._on_cells)
+        await page.add_init_script(OBSERVER_JS)
+        # 遇到 429 时降速，刷新和详情页导航随之放慢
+        pipeline.rate_limiter().watch(page)
+        await pipeline.rate_limiter().acquire()
+        await page.goto(profile_url(self.user_handle), timeout=pipeline.TIMEOUT)
+        await pipeline.wait_for_timeline(page, self.user_handle, timeout=30000)
+        await session.save_state()
+        print(f"[INFO] 已开始监听 {profile_url(self.user_handle)}")
+
+    # ---------- 刷新 ----------
+    async def _refresh_loop(self, session: BrowserSession) -> None:
+        """
+        定期刷新主页（每次刷新消耗一个限速令牌）；连续失败时回收浏览器并重新注册监听
+        刷新本身不提速：没有新推文时什么也没抓，提速只在一批新推文抓取成功后进行（见 _finish_batch）
+        """
+        limiter = pipeline.rate_limiter()
+        failures = 0
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await limiter.acquire()
+                async with self._page_lock:
+                    await session.page.reload(timeout=pipeline.TIMEOUT)
+                    await pipeline.wait_for_timeline(session.page, self.user_handle, timeout=30000)
+                failures = 0
+                await session.save_state()
+            except SessionExpiredError:
+                # 登录态失效时刷新和回收都没有意义，直接退出
+                raise
+            except (Exception, SystemExit) as exc:
+                failures += 1
+                print(f"[WARN] 刷新主页失败（连续 {failures} 次）: {exc}")
+                if await detail.is_rate_limited(session.page):
+                    limiter.penalize("限流提示页")
+                if failures >= MAX_REFRESH_FAILURES:
+                    await session.recycle()
+                    await self._prepare_page(session)
+                    failures = 0
+            finally:
+                pipeline.report_request_policy(session)
+                self._save_rate_limiter()
+
+    # ---------- 处理 ----------
+    async def _worker(self, session: BrowserSession) -> None:
+        """从队列取新推文：截图 → 保存，再交给处理流水线（AI 分析 → 飞书通知）"""
+        while True:
+            tweet = await self.queue.get()
+            self._capturing += 1
+            captured = False
+            try:
+                captured = await self._capture(session, tweet)
+            except Exception as exc:
+                print(f"[ERROR] 处理推文 {tweet['id']} 失败: {exc}")
+            finally:
+                self._capturing -= 1
+                if not captured:
+                    self._batch_failed = True
+                try:
+                    self._settle(tweet, captured)
+                finally:
+                    self.queue.task_done()
+            self._finish_batch()
+
+    def _settle(self, tweet: Dict[str, Any], captured: bool) -> None:
+        """
+        截图结束后更新水位线：
+        - 成功：推进到比所有在途、失败推文都旧的已截图推文中最新的一条
+        - 失败：不保存推文，放入待截图队列，并从 known_ids 中移除，刷新后重新上报时再试；
+          在它成功之前水位线不会越过它，单轮模式也会从队列中补截
+        """
+        tweet_id = tweet["id"]
+        self._in_flight.discard(tweet_id)
+        twitter_conn = pipeline.ensure_twitter_db()
+        try:
+            if captured:
+                self._failed.discard(tweet_id)
+                self._captured_ids.add(tweet_id)
+                remove_pending(twitter_conn, [tweet_id])
+            else:
+                self._failed.add(tweet_id)
+                self.known_ids.discard(tweet_id)
+                self._detected_at.pop(tweet_id, None)
+                enqueue_pending(twitter_conn, self.user_handle, [tweet])
+            blocked = [int(i) for i in self._in_flight | self._failed]
+            ready = [i for i in self._captured_ids if not blocked or int(i) < min(blocked)]
+            if ready:
+                update_watermark(twitter_conn, self.user_handle, max(ready, key=int))
+                self._captured_ids.difference_update(ready)
+        finally:
+            twitter_conn.close()
+
+    def _finish_batch(self) -> None:
+        """队列清空、所有 worker 空闲时结束当前批次；整批截图成功时按 AIMD 加性提速"""
+        if self._batch_started is None or self._capturing or not self.queue.empty():
+            return
+        if not self._batch_failed and pipeline.rate_limiter().reward(self._batch_started):
+            self._save_rate_limiter()
+        self._batch_started = None
+        self._batch_failed = False
+
+    async def _capture(self, session: BrowserSession, tweet: Dict[str, Any]) -> bool:
+        """截图并保存；返回是否拿到了截图"""
+        captured = False
+        if pipeline.INPLACE_SCREENSHOTS and not detail.needs_detail(tweet):
+            async with self._page_lock:
+                captured = await detail.screenshot_in_place(session.page, tweet, pipeline.SCREENSHOT_DIR)
+        if not captured:
+            limiter = pipeline.rate_limiter()
+            async with session.detail_pool(pipeline.DETAIL_CONCURRENCY).page() as page:
+                await limiter.acquire()
+                tweet = await pipeline.fetch_tweet_detail(page, tweet, pipeline.SCREENSHOT_DIR)
+                if not tweet.get("screenshot_path") and await detail.is_rate_limited(page):
+                    limiter.penalize("详情页限流提示")
+
+        if not tweet.get("screenshot_path"):
+            return False
+        twitter_conn = pipeline.ensure_twitter_db()
+        try:
+            pipeline.save_tweet(twitter_conn, tweet)
+        finally:
+            twitter_conn.close()
+
+        self.captured += 1
+        latency = time.monotonic() - self._detected_at.get(tweet["id"], time.monotonic())
+        print(f"[INFO] 推文 {tweet['id']} 已截图保存（发现后 {latency:.1f}s），进入处理流水线")
+        # 上传、AI 分析和通知在 TweetProcessor 的各阶段 worker 中进行，截图 worker 立即处理下一条
+        await self.processor.submit(tweet)
+        return True
+
+    def _on_processed(self, tweet: Dict[str, Any]) -> None:
+        latency = time.monotonic() - self._detected_at.pop(tweet["id"], time.monotonic())
+        print(f"[INFO] 推文 {tweet['id']} 处理完成，发现到通知耗时 {latency:.1f}s")
+
+    def _save_rate_limiter(self) -> None:
+        twitter_conn = pipeline.ensure_twitter_db()
+        try:
+            pipeline.rate_limiter().save(twitter_conn)
+        finally:
+            twitter_conn.close()
+
+    async def run(self) -> None:
+        twitter_conn = pipeline.ensure_twitter_db()
+        try:
+            self.known_ids = pipeline.known_tweet_ids(twitter_conn, self.user_handle)
+            self.watermark = get_watermark(twitter_conn, self.user_handle)
+        finally:
+            twitter_conn.close()
+        print(f"[INFO] 数据库中已有 {len(self.known_ids)} 条推文，水位线: {self.watermark or '无'}")
+
+        pipeline.SCREENSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        async with async_playwright() as p:
+            session = pipeline.new_session(p)
+            await session.start()
+            try:
+                await self._prepare_page(session)
+                async with pipeline.TweetProcessor(on_done=self._on_processed) as self.processor:
+                    workers = [
+                        asyncio.create_task(self._worker(session))
+                        for _ in range(max(1, pipeline.DETAIL_CONCURRENCY))
+                    ]
+                    try:
+                        await self._refresh_loop(session)
+                    finally:
+                        for task in workers:
+                            task.cancel()
+            finally:
+                await session.close()
+                ai.report()
+                await imaging.flush()
+                imaging.shutdown()
+
+
+async def main() -> None:
+    print(f"=" * 60)
+    print(f"Twitter 实时监听启动")
+    print(f"=" * 60)
+    print(f"[INFO] 目标用户: @{pipeline.TARGET_USER}")
+    print(f"[INFO] 刷新间隔: {REFRESH_INTERVAL}s")
+
+    if not pipeline.validate_config():
+        return
+
+    try:
+        await TimelineWatcher(pipeline.TARGET_USER).run()
+    except KeyboardInterrupt:
+        print(f"\n[INFO] 用户中断")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
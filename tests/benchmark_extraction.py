@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时间线 DOM 解析基准测试
+对比逐单元格 locator 往返（旧实现）和单次 page.evaluate（timeline.collect_tweet_links）
+每次滚动后的解析耗时；使用本地构造的时间线 HTML，无需登录 X
+
+运行: python tests/benchmark_extraction.py [单元格数量]
+"""
+
+import asyncio
+import re
+import sys
+import time
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.timeline import collect_tweet_links
+
+USER = "elonmusk"
+ROUNDS = 10
+
+
+def build_timeline_html(cells: int) -> str:
+    """构造与 X 时间线结构相同的 HTML：置顶、转发、带图、长推文混合"""
+    parts = []
+    for i in range(cells):
+        tweet_id = 1900000000000000000 - i
+        author = "someone" if i % 7 == 3 else USER
+        social = ""
+        if i == 0:
+            social = '<div data-testid="socialContext">Pinned</div>'
+        elif author != USER:
+            social = f'<div data-testid="socialContext">{USER} reposted</div>'
+        media = '<div data-testid="tweetPhoto"><img src="data:,"></div>' if i % 3 == 0 else ""
+        more = '<a data-testid="tweet-text-show-more-link" href="#">Show more</a>' if i % 5 == 0 else ""
+        parts.append(f"""
+        <div data-testid="cellInnerDiv">
+          {social}
+          <article data-testid="tweet">
+            <div data-testid="User-Name">
+              <a href="/{author}">{author}</a>
+              <a href="/{author}/status/{tweet_id}"><time>1h</time></a>
+            </div>
+            <div data-testid="tweetText">tweet #{i} {"long text " * 20}</div>
+            {more}{media}
+          </article>
+        </div>""")
+    return f"<html><body><div aria-label='Timeline'>{''.join(parts)}</div></body></html>"
+
+
+async def legacy_collect(page, user_handle):
+    """旧实现：每个单元格多次 locator 往返（count / get_attribute / inner_text）"""
+    tweets = []
+    for cell in await page.locator('[data-testid="cellInnerDiv"]').all():
+        tweet_id = None
+        user_name_locator = cell.locator('[data-testid="User-Name"]')
+        if await user_name_locator.count() > 0:
+            status_link = user_name_locator.locator('a[href*="/status/"]').first
+            if await status_link.count() > 0:
+                href = await status_link.get_attribute("href")
+                if href:
+                    match = re.search(r"/status/(\d+)", href)
+                    if match:
+                        tweet_id = match.group(1)
+        if not tweet_id:
+            continue
+        is_repost = 0
+        social_context_locator = cell.locator('[data-testid="socialContext"]')
+        if await social_context_locator.count() > 0:
+            social_text = await social_context_locator.inner_text()
+            if "reposted" in social_text.lower():
+                is_repost = 1
+        tweets.append({"id": tweet_id, "user_handle": user_handle, "is_repost": is_repost})
+    return tweets
+
+
+async def measure(name, func, page):
+    durations = []
+    result = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = await func(page, USER)
+        durations.append(time.perf_counter() - start)
+    avg = sum(durations) / len(durations) * 1000
+    print(f"[{name}] 解析 {len(result)} 条，平均 {avg:.2f}ms/次滚动（{ROUNDS} 次，最快 {min(durations)*1000:.2f}ms）")
+    return avg, result
+
+
+async def main():
+    cells = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+
+    print("=" * 60)
+    print(f"时间线解析基准测试（{cells} 个单元格）")
+    print("=" * 60)
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+        await page.set_content(build_timeline_html(cells))
+
+        legacy_ms, legacy = await measure("旧实现 locator", legacy_collect, page)
+        batched_ms, batched = await measure("单次 evaluate", collect_tweet_links, page)
+
+        await browser.close()
+
+    # 两种实现应解析出相同的推文和转发标记
+    assert [t["id"] for t in legacy] == [t["id"] for t in batched]
+    assert [t["is_repost"] for t in legacy] == [t["is_repost"] for t in batched]
+
+    print(f"\n性能提升: {legacy_ms / batched_ms:.1f}x ⚡")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
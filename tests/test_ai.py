@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试 AI 调用的重试判断、退避时间，以及路由时的流式回调和缓存写入"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.common import ai, ai_cache, ai_ledger, ai_router
+from src.common.ai_cache import AICache
+
+
+class _Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class _Error(Exception):
+    def __init__(self, headers):
+        super().__init__("rate limited")
+        self.response = _Response(headers)
+
+
+def test_retry_delay_honors_retry_after():
+    assert ai.retry_delay(0, _Error({"retry-after": "7"})) == 7
+    assert ai.retry_delay(0, _Error({"retry-after-ms": "1500"})) == 1.5
+    assert ai.retry_delay(0, _Error({"retry-after": "3600"})) == ai.BACKOFF_MAX
+
+
+def test_retry_delay_backs_off_with_jitter():
+    for attempt in range(6):
+        delay = ai.retry_delay(attempt, ValueError("boom"))
+        assert 0 <= delay <= min(ai.BACKOFF_MAX, ai.BACKOFF_BASE * 2 ** attempt)
+    # HTTP 日期格式的 Retry-After 退回到指数退避
+    assert 0 <= ai.retry_delay(0, _Error({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) <= ai.BACKOFF_BASE
+    assert not ai.is_retryable(ValueError("boom"))
+
+
+def _route_env(monkeypatch, cache=None):
+    monkeypatch.setattr(ai_ledger, "LEDGER_ENABLED", False)
+    monkeypatch.setattr(ai_cache, "CACHE_ENABLED", cache is not None)
+    monkeypatch.setattr(ai_cache, "_cache", cache)
+    monkeypatch.setattr(ai_router, "_router", None)
+    monkeypatch.setattr(ai_router, "HEDGE_DELAY", 0.05)
+    return [ai.Provider(name, "key", f"http://{name}", text_model="t", vision_model="v") for name in "ab"]
+
+
+def test_hedged_candidates_do_not_interleave_streamed_text(monkeypatch):
+    providers = _route_env(monkeypatch)
+
+    async def fake_complete(provider, model, messages, json_mode=False, on_text=None):
+        if provider.name == "a":
+            on_text('{"summary": "from a"')
+            await asyncio.sleep(1)
+        else:
+            on_text('{"summary": "from b", "direction": "Long"}')
+        return {"success": True, "ai_text": provider.name, "full_response": "{}", "attempts": 1}
+
+    monkeypatch.setattr(ai, "_complete", fake_complete)
+    monkeypatch.setattr(ai, "default_providers", lambda: providers)
+    streamed = []
+    result = asyncio.run(ai.analyze_image("data:image/webp;base64,", on_text=streamed.append))
+    assert result["ai_text"] == "b"  # 对冲请求胜出
+    assert streamed == ['{"summary": "from a"']  # 但只转发首先输出的 a
+
+
+def test_only_validated_results_are_cached(tmp_path, monkeypatch):
+    cache = AICache(tmp_path / "cache.db")
+    providers = _route_env(monkeypatch, cache)
+    answers = {"a": "not json", "b": "not json either"}
+
+    async def fake_complete(provider, model, messages, json_mode=False, on_text=None):
+        return {"success": True, "ai_text": answers[provider.name], "full_response": "{}", "attempts": 1}
+
+    monkeypatch.setattr(ai, "_complete", fake_complete)
+    is_json = lambda text: text.startswith("{")
+
+    async def run():
+        return await ai.analyze_text("text", "prompt", validate=is_json, providers=providers)
+
+    result = asyncio.run(run())
+    assert result["success"] and not result.get("cached")  # 兜底结果照常返回，但不写缓存
+
+    answers["b"] = '{"ok": 1}'
+    assert asyncio.run(run())["ai_text"] == '{"ok": 1}'
+    result = asyncio.run(run())
+    assert result.get("cached") and result["ai_text"] == '{"ok": 1}'
+    cache.close()
+
+
+def test_cache_hit_does_not_trigger_streaming_callback(tmp_path, monkeypatch):
+    cache = AICache(tmp_path / "cache.db")
+    providers = _route_env(monkeypatch, cache)
+
+    async def fake_complete(provider, model, messages, json_mode=False, on_text=None):
+        on_text('{"ok": 1}')
+        return {"success": True, "ai_text": '{"ok": 1}', "full_response": "{}", "attempts": 1}
+
+    monkeypatch.setattr(ai, "_complete", fake_complete)
+    monkeypatch.setattr(ai, "default_providers", lambda: providers)
+    streamed = []
+    asyncio.run(ai.analyze_image("https://oss.example/1.webp", on_text=streamed.append))
+    result = asyncio.run(ai.analyze_image("https://oss.example/1.webp", on_text=streamed.append))
+    assert result["cached"] and streamed == ['{"ok": 1}']  # 第二次命中缓存，不再触发初步通知
+    cache.close()
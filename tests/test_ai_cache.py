@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试 AI 响应缓存"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.common.ai_cache import AICache, cache_key
+
+
+def test_key_changes_with_content_prompt_model_and_provider():
+    base = cache_key(b"image", "prompt", "qwen-vl-plus", "qianwen")
+    assert base == cache_key(b"image", "prompt\n", "qwen-vl-plus", "qianwen")
+    assert base != cache_key(b"image2", "prompt", "qwen-vl-plus", "qianwen")
+    assert base != cache_key(b"image", "prompt v2", "qwen-vl-plus", "qianwen")
+    assert base != cache_key(b"image", "prompt", "qwen-vl-max", "qianwen")
+    assert base != cache_key(b"image", "prompt", "qwen-vl-plus", "deepseek")
+
+
+def test_ttl_and_lru_eviction(tmp_path):
+    cache = AICache(tmp_path / "cache.db", ttl_days=1, max_mb=0)
+    cache.max_bytes = 250
+    cache.put("a", "x" * 100, "m", "p", "prompt", now=1000)
+    cache.put("b", "y" * 100, "m", "p", "prompt", now=1001)
+    assert cache.get("a", now=1002) == "x" * 100  # a 变成最近使用
+
+    cache.put("c", "z" * 100, "m", "p", "prompt", now=1003)
+    assert cache.get("b", now=1004) is None  # 超过上限，淘汰最久未使用的 b
+    assert cache.get("a", now=1004) == "x" * 100
+    assert cache.get("c", now=1004 + 86400) is None  # 过期
+    assert (cache.hits, cache.misses) == (2, 2)
+    cache.close()
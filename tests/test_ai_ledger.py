@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试 AI 调用台账和每日 token 预算"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.common import ai, ai_cache, ai_ledger
+from src.common.ai_ledger import AILedger
+
+
+def test_records_calls_and_budget_levels(tmp_path):
+    ledger = AILedger(tmp_path / "ledger.db", budget=1000, downgrade_at=0.8, defer_at=0.95)
+    assert ledger.budget_level() == ai_ledger.NORMAL
+
+    ledger.record("qianwen", "qwen-vl-plus", "prompt", 600, 100, latency=1.5, attempts=2)
+    ledger.record("qianwen", "qwen-vl-plus", "prompt", attempts=0, cache_hit=True, status="cached")
+    assert ledger.tokens_today() == 700
+    assert ledger.budget_level() == ai_ledger.NORMAL
+
+    ledger.record("backup", "text-model", "prompt", 100, 50)
+    assert ledger.budget_level() == ai_ledger.DOWNGRADE  # 本进程的记录直接累加，不等重新汇总
+    ledger.record("backup", "text-model", "prompt", 100, 50)
+    assert ledger.budget_level() == ai_ledger.DEFER
+
+    item = ledger.summary()["qianwen:qwen-vl-plus"]
+    assert (item["calls"], item["cache_hits"], item["retries"]) == (2, 1, 1)
+    assert (item["input_tokens"], item["output_tokens"], item["avg_latency_ms"]) == (600, 100, 1500)
+    ledger.close()
+
+
+def test_usage_tokens_accepts_both_field_names():
+    assert ai_ledger.usage_tokens({"prompt_tokens": 12, "completion_tokens": 3}) == (12, 3)
+    assert ai_ledger.usage_tokens({"input_tokens": 5, "output_tokens": 7}) == (5, 7)
+    assert ai_ledger.usage_tokens(None) == (0, 0)
+
+
+def test_route_downgrades_then_defers_low_priority(tmp_path, monkeypatch):
+    ledger = AILedger(tmp_path / "ledger.db", budget=100, downgrade_at=0.5, defer_at=0.9)
+    monkeypatch.setattr(ai_ledger, "_ledger", ledger)
+    monkeypatch.setattr(ai_cache, "CACHE_ENABLED", False)
+    provider = ai.Provider("p", "key", "http://p", text_model="big", cheap_text_model="small")
+    models = []
+
+    async def fake_complete(provider, model, messages, json_mode=False, on_text=None):
+        models.append(model)
+        usage = {"prompt_tokens": 40, "completion_tokens": 20}
+        return {"success": True, "ai_text": "ok", "full_response": "{}", "usage": usage, "attempts": 1}
+
+    monkeypatch.setattr(ai, "_complete", fake_complete)
+
+    async def run(priority=ai_ledger.PRIORITY_NORMAL):
+        return await ai.analyze_text("text", "prompt", providers=[provider], priority=priority)
+
+    assert asyncio.run(run())["success"]
+    assert asyncio.run(run())["success"]  # 60 / 100，降级
+    assert models == ["big", "small"]
+
+    deferred = asyncio.run(run(ai_ledger.PRIORITY_LOW))  # 120 / 100，低优先级推迟
+    assert deferred["deferred"] and not deferred["success"]
+    assert asyncio.run(run())["success"]  # 普通优先级照常调用便宜模型
+    assert models == ["big", "small", "small"]
+    assert ledger.deferred == 1
+    ledger.close()
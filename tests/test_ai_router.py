@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试多服务商路由：对冲、取消落后的请求、故障切换"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.common import ai_ledger, ai_router
+from src.common.ai_ledger import AILedger
+from src.common.ai_router import Router
+
+
+def _ok(text):
+    return {"success": True, "ai_text": text, "full_response": "{}"}
+
+
+def test_hedges_after_p95_and_cancels_the_loser(monkeypatch):
+    monkeypatch.setattr(ai_router, "MIN_SAMPLES", 3)
+    router = Router()
+    for _ in range(5):
+        router.stats_for("slow").record(0.05, True)
+    cancelled = []
+
+    async def call(key):
+        try:
+            await asyncio.sleep(1 if key == "slow" else 0.05)
+        except asyncio.CancelledError:
+            cancelled.append(key)
+            raise
+        return _ok(key)
+
+    result = asyncio.run(router.call(["slow", "fast"], call))
+    assert result["ai_text"] == "fast" and result["provider"] == "fast"
+    assert cancelled == ["slow"]
+    assert router.hedges == 1
+
+
+def test_fails_over_on_error_or_invalid_answer():
+    router = Router()
+
+    async def call(key):
+        if key == "down":
+            raise ConnectionError("boom")
+        return _ok("not json" if key == "sloppy" else '{"ok": 1}')
+
+    result = asyncio.run(router.call(["down", "sloppy", "good"], call, lambda r: r["ai_text"].startswith("{")))
+    assert result["provider"] == "good"
+    assert router.stats_for("down").samples[-1][1] is False
+
+
+def test_rank_prefers_fast_healthy_providers(monkeypatch):
+    monkeypatch.setattr(ai_router, "MIN_SAMPLES", 2)
+    router = Router()
+    for _ in range(3):
+        router.stats_for("a").record(5.0, True)
+        router.stats_for("b").record(1.0, True)
+        router.stats_for("c").record(0.1, False)
+    assert router.rank(["a", "b", "c", "d"]) == ["b", "a", "d", "c"]
+
+
+def test_cold_start_seeds_from_ledger_and_does_not_hedge_without_samples(tmp_path, monkeypatch):
+    ledger = AILedger(tmp_path / "ledger.db")
+    monkeypatch.setattr(ai_ledger, "_ledger", ledger)
+    for latency in (30, 40, 50, 60, 70):
+        ledger.record("mofcom", "slow-model", "prompt", latency=latency)
+    ledger.record("mofcom", "slow-model", "prompt", attempts=0, cache_hit=True, status="cached")
+
+    router = Router()
+    assert router.hedge_delay("mofcom:slow-model") == 70  # 新进程从台账预热，不再按固定等待对冲
+    assert router.hedge_delay("other:model") is None
+
+    async def call(key):
+        await asyncio.sleep(0.05)
+        return _ok(key)
+
+    result = asyncio.run(router.call(["other:model", "backup:model"], call))
+    assert result["provider"] == "other:model" and router.hedges == 0
+    ledger.close()
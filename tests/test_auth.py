@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试登录态文件选择和登录页跳转识别"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.auth import LOGIN_URL_RE, usable_storage_state
+
+
+def test_newer_cookie_file_wins(tmp_path):
+    state = tmp_path / "state.json"
+    cookies = tmp_path / "cookies.json"
+    assert usable_storage_state(state, cookies) is None
+
+    cookies.write_text("[]", encoding="utf-8")
+    state.write_text("{}", encoding="utf-8")
+    os.utime(cookies, (1000, 1000))
+    os.utime(state, (2000, 2000))
+    assert usable_storage_state(state, cookies) == state
+
+    # 重新导出 Cookie 后以 Cookie 文件为准
+    os.utime(cookies, (3000, 3000))
+    assert usable_storage_state(state, cookies) is None
+
+
+def test_login_redirects():
+    assert LOGIN_URL_RE.search("https://x.com/i/flow/login?redirect_after_login=%2Felonmusk")
+    assert LOGIN_URL_RE.search("https://x.com/login")
+    assert not LOGIN_URL_RE.search("https://x.com/elonmusk")
+    assert not LOGIN_URL_RE.search("https://x.com/loginfan")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试待截图队列"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.backlog import enqueue_pending, ensure_pending_table, load_pending, remove_pending
+
+
+def _tweet(tweet_id: str) -> dict:
+    return {"id": tweet_id, "link": f"https://x.com/u/status/{tweet_id}", "text": "", "truncated": True}
+
+
+def test_pending_queue_keeps_discovery_order_and_drains():
+    conn = sqlite3.connect(":memory:")
+    ensure_pending_table(conn)
+
+    assert enqueue_pending(conn, "u", [_tweet("120"), _tweet("99")]) == 2
+    # 已在队列中的推文不重复加入，也不改变发现时间
+    assert enqueue_pending(conn, "u", [_tweet("120")]) == 0
+    enqueue_pending(conn, "other", [_tweet("5")])
+
+    pending = load_pending(conn, "u")
+    assert [t["id"] for t in pending] == ["99", "120"]
+    assert pending[0]["truncated"] is True
+
+    remove_pending(conn, ["99"])
+    assert [t["id"] for t in load_pending(conn, "u")] == ["120"]
+
+
+def test_load_pending_drops_tweets_saved_elsewhere():
+    conn = sqlite3.connect(":memory:")
+    ensure_pending_table(conn)
+    enqueue_pending(conn, "u", [_tweet("120"), _tweet("99")])
+
+    # 99 已由实时监听保存：不再返回，并从队列中删除
+    assert [t["id"] for t in load_pending(conn, "u", {"99"})] == ["120"]
+    assert [t["id"] for t in load_pending(conn, "u")] == ["120"]
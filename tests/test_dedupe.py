@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试截图近似去重"""
+
+import io
+import sqlite3
+import sys
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter import imaging
+from src.twitter import twitter_pipeline as pipeline
+from src.twitter.dedupe import ensure_hash_table, find_similar, hamming, record_hash, text_digest
+from src.twitter.imaging import dhash
+
+
+def _screenshot(text_width: int) -> bytes:
+    image = Image.new("RGB", (600, 300), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 20 + text_width, 60), fill="black")
+    draw.ellipse((200, 100, 400, 280), fill="gray")
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_dhash_is_stable_for_near_identical_screenshots():
+    assert hamming(dhash(_screenshot(300)), dhash(_screenshot(302))) <= 3
+    assert hamming(dhash(_screenshot(300)), dhash(_screenshot(30))) > 3
+
+
+def test_find_similar_within_threshold():
+    conn = sqlite3.connect(":memory:")
+    ensure_hash_table(conn)
+    text = text_digest("hello  world")
+    record_hash(conn, "1", "ffff0000ffff0000", text)
+    record_hash(conn, "2", "0123456789abcdef", text)
+
+    # 3 位不同，仍有一段完全相同
+    assert find_similar(conn, "3", "ffff0000ffff0007", text_digest("hello world"), max_distance=3) == ("1", 3)
+    assert find_similar(conn, "3", "ffff0000ffff000f", text, max_distance=3) is None
+    # 正文不同或没有正文时不算重复
+    assert find_similar(conn, "3", "ffff0000ffff0000", text_digest("hello"), max_distance=3) is None
+    assert find_similar(conn, "3", "ffff0000ffff0000", text_digest(""), max_distance=3) is None
+    # 不和自己比较
+    assert find_similar(conn, "1", "ffff0000ffff0000", text) is None
+
+
+def _account_screenshot(line_widths) -> bytes:
+    """同一账号的推文截图：头像、昵称行相同，只有几行正文不同"""
+    image = Image.new("RGB", (600, 400), "white")
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((20, 20, 80, 80), fill="gray")
+    draw.rectangle((100, 30, 300, 50), fill="black")
+    for i, width in enumerate(line_widths):
+        draw.rectangle((100, 100 + i * 20, 100 + width, 108 + i * 20), fill="black")
+    draw.rectangle((20, 360, 580, 370), fill="lightgray")
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_different_text_from_same_account_is_not_a_duplicate(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "AI_DB_PATH", tmp_path / "ai.db")
+    conn = pipeline.ensure_ai_db()
+    first = {"id": "1", "screenshot_path": "s/1.webp", "text": "Starship launches next week",
+             imaging.HASH_KEY: dhash(_account_screenshot([400, 350]))}
+    second = {"id": "2", "screenshot_path": "s/2.webp", "text": "Tesla is raising prices",
+              imaging.HASH_KEY: dhash(_account_screenshot([380, 200]))}
+    assert hamming(first[imaging.HASH_KEY], second[imaging.HASH_KEY]) <= 3  # 截图哈希几乎一样
+
+    pipeline.save_tweet_analysis(conn, first, "https://oss.example/1.webp",
+                                 {"full_response": "{}", "summary": "Starship"})
+    assert not pipeline.reuse_similar_result(conn, second)
+    assert pipeline.get_ai_result(conn, "2") is None
+
+    # 正文相同（重新抓取）才复用
+    again = dict(first, id="3", screenshot_path="s/3.webp")
+    assert pipeline.reuse_similar_result(conn, again)
+    assert pipeline.get_ai_result(conn, "3")["duplicate_of"] == "1"
+    conn.close()
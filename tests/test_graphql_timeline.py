@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试 GraphQL 时间线响应解析"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.graphql_timeline import operation_name, parse_timeline_payload
+
+
+def _tweet(rest_id, screen_name, text, **legacy):
+    return {
+        "__typename": "Tweet",
+        "rest_id": rest_id,
+        "core": {"user_results": {"result": {"legacy": {"screen_name": screen_name}}}},
+        "views": {"count": "1234"},
+        "legacy": {
+            "full_text": text,
+            "created_at": "Wed Oct 10 20:19:24 +0000 2018",
+            "favorite_count": 10,
+            "retweet_count": 2,
+            **legacy,
+        },
+    }
+
+
+def _entry(result):
+    return {"content": {"itemContent": {"tweet_results": {"result": result}}}}
+
+
+USER_TWEETS = {
+    "data": {"user": {"result": {"timeline_v2": {"timeline": {"instructions": [
+        {"type": "TimelinePinEntry", "entry": _entry(_tweet("100", "elonmusk", "pinned"))},
+        {"type": "TimelineAddEntries", "entries": [
+            _entry({
+                "__typename": "TweetWithVisibilityResults",
+                "tweet": {
+                    **_tweet("300", "elonmusk", "short text"),
+                    "note_tweet": {"note_tweet_results": {"result": {"text": "full long text"}}},
+                },
+            }),
+            _entry(_tweet("299", "elonmusk", "RT @other: hi",
+                          retweeted_status_result={"result": _tweet("250", "other", "hi")})),
+            _entry(_tweet("298", "elonmusk", "look", is_quote_status=True, quoted_status_id_str="42",
+                          extended_entities={"media": [
+                              {"type": "photo", "media_url_https": "https://pbs.twimg.com/a.jpg"},
+                          ]})),
+        ]},
+    ]}}}}}
+}
+
+
+def test_operation_name():
+    assert operation_name("https://x.com/i/api/graphql/abc123/UserTweets?variables=%7B%7D") == "UserTweets"
+    assert operation_name("https://x.com/i/api/graphql/abc123/TweetDetail?variables=%7B%7D") == "TweetDetail"
+    assert operation_name("https://x.com/i/api/graphql/abc123/UserTweetsAndReplies?v=1") is None
+    assert operation_name("https://x.com/i/api/1.1/jot/client_event.json") is None
+
+
+def test_parse_user_tweets():
+    tweets = parse_timeline_payload(USER_TWEETS)
+    assert [t["id"] for t in tweets] == ["100", "300", "250", "298"]
+
+    pinned, long_tweet, repost, quote = tweets
+    assert pinned["pinned"] and not long_tweet["pinned"]
+    assert long_tweet["text"] == "full long text"
+    assert long_tweet["created_at"] == "2018-10-10T20:19:24+00:00"
+    assert long_tweet["metrics"]["like"] == 10 and long_tweet["metrics"]["view"] == 1234
+
+    assert repost["is_repost"] == 1 and repost["user_handle"] == "other"
+    assert repost["reposted_by"] == "elonmusk"
+
+    assert quote["is_quote"] == 1 and quote["quoted_id"] == "42"
+    assert quote["media"] == [{"type": "photo", "url": "https://pbs.twimg.com/a.jpg"}]
+    assert quote["link"] == "https://x.com/elonmusk/status/298"
+
+
+def test_parse_tweet_detail():
+    payload = {"data": {"threaded_conversation_with_injections_v2": {"instructions": [
+        {"type": "TimelineAddEntries", "entries": [_entry(_tweet("500", "elonmusk", "detail"))]},
+    ]}}}
+    tweets = parse_timeline_payload(payload)
+    assert len(tweets) == 1 and tweets[0]["text"] == "detail"
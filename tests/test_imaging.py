@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试截图编码"""
+
+import asyncio
+import io
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter import imaging
+
+
+def _png(width: int, height: int) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_encode_downscales_to_target_width():
+    data = imaging.encode_image(_png(1600, 800), fmt="webp", width=800, quality=80)
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == "WEBP"
+        assert image.size == (800, 400)
+
+    data = imaging.encode_image(_png(600, 300), fmt="jpeg", width=800, quality=80)
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (600, 300)
+
+
+def test_encode_in_pool_and_archive(tmp_path):
+    async def run():
+        data, image_hash = await imaging.encode(_png(100, 50))
+        assert len(image_hash) == 16
+        imaging.archive(tmp_path / "1.webp", data)
+        await imaging.flush()
+        return data
+
+    try:
+        data = asyncio.run(run())
+    finally:
+        imaging.shutdown()
+    assert (tmp_path / "1.webp").read_bytes() == data
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试内联图片模式：上传和 AI 分析同时进行"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter import imaging
+from src.twitter import twitter_pipeline as pipeline
+
+
+def test_upload_runs_alongside_analysis_with_data_url(monkeypatch):
+    def fake_upload(tweet):
+        time.sleep(0.2)
+        return "https://oss.example/1.webp"
+
+    async def fake_analyze(tweet, image_url):
+        seen.append(image_url)
+        await asyncio.sleep(0.2)
+        return {"ai_text": "{}", "full_response": "{}", "summary": ""}
+
+    seen = []
+    monkeypatch.setattr(pipeline, "upload_tweet", fake_upload)
+    monkeypatch.setattr(pipeline, "analyze_tweet", fake_analyze)
+    tweet = {"id": "1", "link": "https://x.com/a/status/1", "screenshot_path": "s/1.webp", imaging.IMAGE_KEY: b"RIFF"}
+
+    monkeypatch.setattr(pipeline, "INLINE_IMAGE", True)
+    started = time.monotonic()
+    oss_url, analysis = asyncio.run(pipeline.upload_and_analyze(tweet))
+    assert oss_url == "https://oss.example/1.webp" and analysis
+    assert seen[-1] == "data:image/webp;base64,UklGRg=="
+    assert time.monotonic() - started < 0.35
+
+    monkeypatch.setattr(pipeline, "INLINE_IMAGE", False)
+    asyncio.run(pipeline.upload_and_analyze(tweet))
+    assert seen[-1] == "https://oss.example/1.webp"
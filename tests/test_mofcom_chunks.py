@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试商务部长公告的分段（map-reduce）分析"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.mofcom import scraper
+
+ENTRY = {"title": "关于对部分物项实施出口管制的公告", "date": "2025-01-01", "link": "https://www.mofcom.gov.cn/a.html"}
+
+
+def test_chunk_text_keeps_lines_and_respects_limit():
+    rows = [f"{i}. 商品编码 2805{i:04d} 稀土金属及其合金，税率 25%" for i in range(200)]
+    chunks = scraper.chunk_text("\n".join(rows), max_tokens=300)
+    assert len(chunks) > 1
+    assert all(scraper.estimate_tokens(chunk) <= 300 for chunk in chunks)
+    assert "\n".join(chunks).splitlines() == rows
+
+    long_line = "稀" * 1000
+    assert "".join(scraper.chunk_text(long_line, max_tokens=300)) == long_line
+
+
+def test_long_article_extracts_chunks_in_parallel_then_reduces(monkeypatch):
+    monkeypatch.setattr(scraper, "CHUNK_TOKENS", 300)
+    calls = []
+    in_flight = [0, 0]  # 当前 / 最大同时进行的调用数
+
+    async def fake_query(payload, prompt, config, provider=None):
+        calls.append(prompt)
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        if prompt is scraper.AI_PROMPT:
+            assert "第 3/3 段要点" in payload and "（本段提取失败" in payload
+            return "verdict"
+        if "第 2/3 段" in payload:
+            raise RuntimeError("timeout")
+        return "facts"
+
+    monkeypatch.setattr(scraper, "run_ai_query", fake_query)
+    content = "\n".join(["出口管制物项清单" * 10] * 9)
+    assert len(scraper.chunk_text(content)) == 3
+
+    result = asyncio.run(scraper.analyze_article(ENTRY, content, {}))
+    assert result == "verdict"
+    assert in_flight[1] == 3  # 三段同时发出
+    assert calls.count(scraper.EXTRACT_PROMPT) == 3 and calls[-1] is scraper.AI_PROMPT
+
+
+def test_short_article_uses_single_call(monkeypatch):
+    prompts = []
+
+    async def fake_query(payload, prompt, config, provider=None):
+        prompts.append(prompt)
+        return "verdict"
+
+    monkeypatch.setattr(scraper, "run_ai_query", fake_query)
+    assert asyncio.run(scraper.analyze_article(ENTRY, "短公告正文", {})) == "verdict"
+    assert prompts == [scraper.AI_PROMPT]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试导航节奏策略"""
+
+import asyncio
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.pacing import (
+    RATE_PAUSE,
+    AdaptiveRateLimiter,
+    PacingPolicy,
+    ensure_rate_limit_table,
+    is_rate_limited,
+    parse_jitter,
+)
+
+
+def test_parse_jitter():
+    assert parse_jitter("800-1500") == (0.8, 1.5)
+    assert parse_jitter("1500-800") == (0.8, 1.5)
+    assert parse_jitter("500") == (0.5, 0.5)
+    assert parse_jitter("") == (0.0, 0.0)
+
+
+def test_first_navigation_is_not_delayed():
+    async def run():
+        pacing = PacingPolicy(min_interval=0.05, jitter=(0.05, 0.05))
+        started = time.monotonic()
+        await pacing.wait()
+        first = time.monotonic() - started
+        await pacing.wait()
+        return first, time.monotonic() - started
+
+    first, total = asyncio.run(run())
+    assert first < 0.03
+    assert total >= 0.05
+
+
+def test_rate_limiter_backs_off_and_recovers():
+    limiter = AdaptiveRateLimiter(rate=20, tokens=5, updated_at=1000.0)
+    started = 1000.0
+    assert limiter.penalize("HTTP 429", now=1001.0)
+    assert limiter.rate == 10
+    # 同一波 429 只降速一次
+    assert not limiter.penalize("HTTP 429", now=1002.0)
+    assert limiter.rate == 10
+    # 暂停期间没有预算，暂停结束后按新速率补充
+    assert limiter.budget(horizon=0, now=1100.0) == 0
+    assert limiter.budget(horizon=0, now=1001.0 + RATE_PAUSE + 60) == 10
+    # 本轮出现过限流信号不提速，之后健康的一轮加性提速
+    assert not limiter.reward(started)
+    assert limiter.reward(2000.0)
+    assert limiter.rate > 10
+
+
+def test_rate_limiter_state_survives_runs():
+    conn = sqlite3.connect(":memory:")
+    ensure_rate_limit_table(conn)
+    limiter = AdaptiveRateLimiter(rate=30)
+    limiter.penalize("时间线为空")
+    limiter.save(conn)
+
+    restored = AdaptiveRateLimiter.load(conn)
+    assert restored.rate == limiter.rate
+    assert restored.paused_for() > 0
+    assert AdaptiveRateLimiter.load(conn, "other").rate != restored.rate
+
+
+class _Request:
+    def __init__(self, resource_type):
+        self.resource_type = resource_type
+
+
+class _Response:
+    def __init__(self, url, resource_type, status=429):
+        self.url = url
+        self.status = status
+        self.request = _Request(resource_type)
+
+
+def test_only_page_and_api_429s_count_as_rate_limits():
+    assert is_rate_limited(_Response("https://x.com/i/api/graphql/abc/UserTweets?variables=1", "fetch"))
+    assert is_rate_limited(_Response("https://x.com/i/api/2/badge_count/badge_count.json", "xhr"))
+    assert not is_rate_limited(_Response("https://x.com/i/api/1.1/jot/client_event.json", "xhr"))
+    assert is_rate_limited(_Response("https://x.com/elonmusk", "document"))
+    assert not is_rate_limited(_Response("https://pbs.twimg.com/media/abc.jpg", "image"))
+    assert not is_rate_limited(_Response("https://x.com/i/api/graphql/abc/UserTweets", "fetch", status=200))
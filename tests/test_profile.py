@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试浏览器配置目录的缓存清理"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.profile import is_cold, prune_profile
+
+
+def _write(path: Path, size: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * size)
+
+
+def test_prune_removes_caches_in_order(tmp_path):
+    _write(tmp_path / "Default" / "Cookies", 1000)
+    _write(tmp_path / "Default" / "GPUCache" / "data_0", 3000)
+    _write(tmp_path / "Default" / "Cache" / "Cache_Data" / "f_000001", 5000)
+    _write(tmp_path / "Default" / "Code Cache" / "js" / "index", 4000)
+    assert not is_cold(tmp_path)
+
+    # 未超过上限时不动
+    assert prune_profile(tmp_path, 20_000) == 0
+
+    # 删除 GPUCache 和 HTTP 缓存后已低于上限，代码缓存和登录数据保留
+    assert prune_profile(tmp_path, 6000) == 8000
+    assert not (tmp_path / "Default" / "Cache").exists()
+    assert (tmp_path / "Default" / "Code Cache").exists()
+    assert (tmp_path / "Default" / "Cookies").exists()
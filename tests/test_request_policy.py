@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试请求拦截策略的放行/屏蔽判断"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.request_policy import SCREENSHOT, TIMELINE, block_reason
+
+GRAPHQL = "https://x.com/i/api/graphql/abc/UserTweets?variables=%7B%7D"
+IMAGE = "https://pbs.twimg.com/media/GabcXYZ?format=jpg&name=small"
+VIDEO_THUMB = "https://pbs.twimg.com/amplify_video_thumb/123/img/abc.jpg"
+VIDEO = "https://video.twimg.com/amplify_video/123/vid/avc1/720x1280/abc.mp4"
+JOT = "https://x.com/i/api/1.1/jot/client_event.json"
+
+
+def test_timeline_phase():
+    assert block_reason(TIMELINE, "xhr", GRAPHQL) is None
+    assert block_reason(TIMELINE, "image", IMAGE) == "image"
+    assert block_reason(TIMELINE, "font", "https://abs.twimg.com/fonts/chirp.woff2") == "font"
+    assert block_reason(TIMELINE, "media", VIDEO) == "media"
+    assert block_reason(TIMELINE, "xhr", JOT) == "telemetry"
+    assert block_reason(TIMELINE, "document", "https://x.com/elonmusk") is None
+
+
+def test_screenshot_phase():
+    assert block_reason(SCREENSHOT, "image", IMAGE) is None
+    assert block_reason(SCREENSHOT, "image", VIDEO_THUMB) is None
+    assert block_reason(SCREENSHOT, "font", "https://abs.twimg.com/fonts/chirp.woff2") is None
+    assert block_reason(SCREENSHOT, "other", VIDEO) == "media"
+    assert block_reason(SCREENSHOT, "script", "https://www.google-analytics.com/analytics.js") == "telemetry"
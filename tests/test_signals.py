@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试交易信号的结构化解析和流式提前取字段"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.signals import StreamingSignalParser, parse_signal
+
+REPLY = (
+    '{"summary": "特斯拉回购，利好 \\"TSLA\\"", "signal_type": "a", "direction": "long",'
+    ' "assets": {"US": "TSLA", "CN": ["", "比亚迪"]}, "confidence": "7.0", "expiry": "3天"}'
+)
+
+
+def test_parse_validates_and_normalizes_fields():
+    signal = parse_signal(f"```json\n{REPLY}\n```\n以上")
+    assert signal.summary == '特斯拉回购，利好 "TSLA"'
+    assert (signal.signal_type, signal.direction, signal.confidence) == ("A", "Long", 7)
+    assert signal.assets == {"US": ["TSLA"], "CN": ["比亚迪"]}
+
+    assert parse_signal('{"summary": "x", "signal_type": "Z", "direction": "Long", "confidence": 1}') is None
+    assert parse_signal('{"summary": "x", "signal_type": "A", "direction": "up", "confidence": 1}') is None
+    assert parse_signal('{"summary": "x", "signal_type": "A", "direction": "Long"}') is None
+    assert parse_signal("没有 JSON") is None
+
+
+def test_streaming_parser_is_ready_once_summary_and_direction_close():
+    parser = StreamingSignalParser()
+    ready_at = None
+    for end in range(1, len(REPLY) + 1):
+        parser.feed(REPLY[:end])
+        if parser.ready:
+            ready_at = end
+            break
+    assert parser.fields == {"summary": '特斯拉回购，利好 "TSLA"', "direction": "Long"}
+    assert ready_at == REPLY.index('"long"') + len('"long"')
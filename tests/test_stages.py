@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试分阶段流水线"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.stages import StagedPipeline
+
+
+def test_items_flow_through_stages_without_waiting_for_batch():
+    async def run():
+        events = []
+
+        async def upload(item):
+            await asyncio.sleep(0.01)
+            return None if item == "skip" else item
+
+        async def notify(item):
+            events.append(("done", item))
+            return item
+
+        pipeline = StagedPipeline([("upload", upload, 2), ("notify", notify, 1)], queue_size=1)
+        pipeline.start()
+        await pipeline.submit("a")
+        # 第一条在第二条提交之前就能走完
+        await asyncio.sleep(0.05)
+        events.append(("submit", "b"))
+        await pipeline.submit("b")
+        await pipeline.submit("skip")
+        await pipeline.join()
+        await pipeline.close()
+        return events
+
+    assert asyncio.run(run()) == [("done", "a"), ("submit", "b"), ("done", "b")]
+
+
+def test_failures_do_not_stop_pipeline():
+    async def run():
+        finished = []
+
+        async def flaky(item):
+            if item == 1:
+                raise RuntimeError("boom")
+            return item
+
+        pipeline = StagedPipeline([("flaky", flaky, 1)], on_done=finished.append)
+        pipeline.start()
+        for item in range(3):
+            await pipeline.submit(item)
+        await pipeline.join()
+        await pipeline.close()
+        return finished, pipeline.failed
+
+    assert asyncio.run(run()) == ([0, 2], 1)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试多目标注册表和调度"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.targets import Target, TargetScheduler, load_targets
+
+
+def test_load_targets(tmp_path):
+    assert [t.handle for t in load_targets("elonmusk", 120, tmp_path / "missing.json")] == ["elonmusk"]
+
+    path = tmp_path / "targets.json"
+    path.write_text(json.dumps([{"handle": "@elonmusk", "priority": 5, "interval": 60}, "sama"]), encoding="utf-8")
+    first, second = load_targets("elonmusk", 120, path)
+    assert (first.handle, first.priority, first.interval) == ("elonmusk", 5, 60)
+    assert (second.handle, second.priority, second.interval) == ("sama", 1, 120)
+
+    path.write_text(json.dumps(["sama", "SAMA"]), encoding="utf-8")
+    with pytest.raises(SystemExit):
+        load_targets("elonmusk", 120, path)
+
+
+def test_priority_aging_and_backoff():
+    high, low = Target("high", priority=5, interval=60), Target("low", priority=1, interval=60)
+    scheduler = TargetScheduler([high, low])
+    now = high.next_due
+
+    # 同时到期时优先级高的先抓，抓取中的目标不会被重复调度
+    assert scheduler.next_target(now) is high
+    scheduler.start(high)
+    assert scheduler.next_target(now) is low
+
+    # 低优先级目标逾期足够久后得分超过刚到期的高优先级目标
+    scheduler.finish(high, True, now)
+    assert scheduler.next_target(now + 60) is high
+    scheduler.start(high)
+    scheduler.finish(high, True, now + 240)
+    assert scheduler.next_target(now + 300) is low
+
+    scheduler.start(low)
+    scheduler.finish(low, False, now)
+    scheduler.finish(low, False, now)
+    assert low.failures == 2 and low.next_due == now + 240
+    scheduler.finish(low, True, now)
+    assert low.failures == 0 and low.next_due == now + 60
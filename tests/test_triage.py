@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试文本分诊"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter import triage
+
+
+def test_media_quote_and_empty_text_go_to_vision():
+    assert triage.vision_reason({"text": "look", "has_media": True})
+    assert triage.vision_reason({"text": "look", "media": [{"type": "photo"}]})
+    assert triage.vision_reason({"text": "wow", "quote": True})
+    assert triage.vision_reason({"text": "wow", "is_quote": 1})
+    assert triage.vision_reason({"text": "  "})
+    assert triage.vision_reason({"text": "Exactly", "has_media": False, "media": []}) is None
+
+
+def test_low_score_skips_vision_and_high_score_escalates(monkeypatch):
+    replies = {
+        "lol": '{"summary": "", "signal_type": "E", "direction": "Neutral", "confidence": 1, "expiry": "即刻"}',
+        "Tesla buyback": '{"summary": "回购", "signal_type": "A", "direction": "Long", "confidence": 8, "expiry": "3天"}',
+    }
+
+    async def fake_analyze_text(text, prompt, **kwargs):
+        return {"success": True, "ai_text": replies[text], "full_response": "{}"}
+
+    monkeypatch.setattr(triage.ai, "analyze_text", fake_analyze_text)
+    monkeypatch.setattr(triage, "TRIAGE_THRESHOLD", 3)
+
+    result = asyncio.run(triage.triage_text({"id": "1", "text": "lol"}))
+    assert result["ai_text"] == replies["lol"]
+    assert asyncio.run(triage.triage_text({"id": "2", "text": "Tesla buyback"})) is None
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试实时监听对 MutationObserver 上报单元格的过滤、按批次提速，以及水位线推进"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter import twitter_pipeline as pipeline
+from src.twitter.backlog import load_pending
+from src.twitter.timeline import get_watermark
+from src.twitter.watcher import TimelineWatcher
+
+
+def _cell(tweet_id, author="elonmusk", **flags):
+    return {"id": tweet_id, "author": author, "is_repost": False, "pinned": False,
+            "has_media": False, "truncated": False, "sensitive": False, "quote": False, **flags}
+
+
+def test_only_new_own_tweets_are_queued():
+    watcher = TimelineWatcher("ElonMusk")
+    watcher.watermark = "200"
+    watcher.known_ids = {"300"}
+
+    watcher._on_cells({}, [
+        _cell("100", pinned=True),
+        _cell("400", author="other", is_repost=True),
+        _cell("300"),
+        _cell("250"),
+        _cell("150"),
+    ])
+    # 同一条推文重复上报（刷新后重新渲染）不会再次入队
+    watcher._on_cells({}, [_cell("250")])
+
+    assert watcher.queue.qsize() == 1
+    tweet = watcher.queue.get_nowait()
+    assert tweet["id"] == "250" and tweet["user_handle"] == "ElonMusk"
+    assert tweet["link"] == "https://x.com/elonmusk/status/250"
+
+
+def test_first_batch_without_watermark_is_baseline():
+    watcher = TimelineWatcher("elonmusk")
+    watcher._on_cells({}, [_cell("300"), _cell("299")])
+    assert watcher.queue.empty() and watcher.watermark == "300"
+
+    watcher._on_cells({}, [_cell("301")])
+    assert watcher.queue.get_nowait()["id"] == "301"
+
+
+class _Limiter:
+    def __init__(self):
+        self.rewards = []
+
+    def reward(self, run_started):
+        self.rewards.append(run_started)
+        return False
+
+
+def test_rate_is_only_rewarded_after_a_successful_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "DB_PATH", tmp_path / "twitter.db")
+    limiter = _Limiter()
+    monkeypatch.setattr(pipeline, "rate_limiter", lambda: limiter)
+    watcher = TimelineWatcher("elonmusk")
+    watcher.watermark = "100"
+    results = {"201": True, "202": True, "301": False}
+
+    async def fake_capture(session, tweet):
+        await asyncio.sleep(0.01)
+        return results[tweet["id"]]
+
+    watcher._capture = fake_capture
+
+    async def run():
+        workers = [asyncio.create_task(watcher._worker(None)) for _ in range(2)]
+        # 刷新后没有新推文：不提速
+        watcher._on_cells({}, [_cell("100")])
+        await watcher.queue.join()
+        assert limiter.rewards == []
+
+        watcher._on_cells({}, [_cell("201"), _cell("202")])
+        await watcher.queue.join()
+        assert len(limiter.rewards) == 1  # 整批成功，提速一次
+
+        watcher._on_cells({}, [_cell("301")])
+        await watcher.queue.join()
+        assert len(limiter.rewards) == 1  # 截图失败的批次不提速
+        for task in workers:
+            task.cancel()
+
+    asyncio.run(run())
+
+
+def test_watermark_never_passes_pending_or_failed_tweets(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "DB_PATH", tmp_path / "twitter.db")
+    monkeypatch.setattr(pipeline, "rate_limiter", lambda: _Limiter())
+    watcher = TimelineWatcher("elonmusk")
+    watcher.watermark = "100"
+    attempts = {"201": [False, True], "202": [True], "203": [True]}
+    delays = {"201": 0.03, "202": 0.01, "203": 0.0}
+
+    async def fake_capture(session, tweet):
+        await asyncio.sleep(delays[tweet["id"]])
+        return attempts[tweet["id"]].pop(0)
+
+    watcher._capture = fake_capture
+
+    def watermark():
+        conn = pipeline.ensure_twitter_db()
+        try:
+            return get_watermark(conn, "elonmusk"), [t["id"] for t in load_pending(conn, "elonmusk")]
+        finally:
+            conn.close()
+
+    async def run():
+        workers = [asyncio.create_task(watcher._worker(None)) for _ in range(3)]
+        watcher._on_cells({}, [_cell("201"), _cell("202"), _cell("203")])
+        await asyncio.sleep(0.015)
+        assert watermark() == (None, [])  # 203、202 已完成，但更旧的 201 仍在截图
+
+        await watcher.queue.join()
+        assert watermark() == (None, ["201"])  # 201 失败：进入待截图队列，水位线不越过它
+
+        watcher._on_cells({}, [_cell("201"), _cell("202")])  # 刷新后重新上报，只有 201 再次入队
+        await watcher.queue.join()
+        assert watermark() == ("203", [])
+        for task in workers:
+            task.cancel()
+
+    asyncio.run(run())
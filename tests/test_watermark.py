@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""测试增量滚动水位线"""
+
+import asyncio
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.twitter.timeline import (
+    ensure_watermark_table,
+    get_watermark,
+    next_watermark,
+    reached_watermark,
+    scroll_until_watermark,
+    update_watermark,
+)
+
+
+def _db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE tweets (id TEXT PRIMARY KEY, user_handle TEXT, is_repost INTEGER DEFAULT 0)")
+    ensure_watermark_table(conn)
+    return conn
+
+
+def test_pinned_and_reposts_are_ignored():
+    screen = [
+        {"id": "100", "pinned": True},       # 置顶的旧推文
+        {"id": "50", "is_repost": 1},        # 转发显示原推 ID
+        {"id": "1000"},
+    ]
+    assert not reached_watermark(screen, "900")
+    assert reached_watermark(screen + [{"id": "900"}], "900")
+    assert next_watermark(screen, "900") == "1000"
+    assert next_watermark([], None) is None
+
+
+def test_watermark_storage():
+    conn = _db()
+    conn.executemany("INSERT INTO tweets VALUES (?, 'elonmusk', ?)", [("99", 0), ("100", 0), ("999", 1)])
+    # 没有记录时从已存推文初始化（数值比较，排除转发）
+    assert get_watermark(conn, "elonmusk") == "100"
+
+    update_watermark(conn, "elonmusk", "200")
+    update_watermark(conn, "elonmusk", "150")  # 只前进不后退
+    assert get_watermark(conn, "elonmusk") == "200"
+    assert get_watermark(conn, "other") is None
+
+
+def test_scroll_stops_at_watermark():
+    screens = [[{"id": "30"}, {"id": "29"}], [{"id": "28"}, {"id": "20"}], [{"id": "19"}]]
+    scrolls = []
+
+    async def harvest():
+        return screens[len(scrolls)]
+
+    async def scroll():
+        scrolls.append(1)
+
+    collected = asyncio.run(scroll_until_watermark(harvest, scroll, "20", max_scrolls=5, max_deep_scrolls=10))
+    assert list(collected) == ["30", "29", "28", "20"]
+    assert len(scrolls) == 1